@@ -0,0 +1,111 @@
+"Binding awkward behaviors to templates"
+from typing import Iterable
+
+import awkward as ak
+import layered_edm as ledm
+import numpy as np
+from harness import benchmark, jagged_events
+
+
+class _pt_behavior(ak.Array):
+    @property
+    def pt2(self):
+        return self.pt * self.pt
+
+
+class _eta_behavior(ak.Array):
+    @property
+    def abs_eta(self):
+        return np.abs(self.eta)
+
+
+@ledm.add_awk_behavior(_pt_behavior)
+@ledm.add_awk_behavior(_eta_behavior)
+class _jet:
+    @property
+    @ledm.remap(lambda j: j.pt)
+    def pt(self) -> float:
+        ...
+
+    @property
+    @ledm.remap(lambda j: j.eta)
+    def eta(self) -> float:
+        ...
+
+
+@benchmark(number=200)
+def bind_two_behaviors():
+    "Bind a template with two behaviors (they are combined into one)"
+    jets = ak.flatten(jagged_events(1000).jets)
+    to_awk = ledm.edm_awk(_jet)
+    return lambda: to_awk(jets)
+
+
+@benchmark(number=5)
+def behavior_property_access():
+    to_awk = ledm.edm_awk(_jet)
+    jets = ak.flatten(jagged_events(100_000).jets)
+    return lambda: to_awk(jets).as_awkward().pt2
+
+
+class _p4_behavior(ak.Array):
+    @property
+    def px(self):
+        return self.pt * np.cos(self.phi)
+
+    @property
+    def pz(self):
+        return self.pt * np.sinh(self.eta)
+
+
+@ledm.add_awk_behavior(_p4_behavior)
+class _p4:
+    @property
+    @ledm.remap(lambda j: j.pt)
+    def pt(self) -> float:
+        ...
+
+    @property
+    @ledm.remap(lambda j: j.eta)
+    def eta(self) -> float:
+        ...
+
+    @property
+    @ledm.remap(lambda j: j.phi)
+    def phi(self) -> float:
+        ...
+
+
+@ledm.compact
+class _compact_p4(_p4):
+    ...
+
+
+def _p4_events(jet_template: type) -> type:
+    class evt:
+        @property
+        @ledm.remap(lambda e: e.jets)
+        def jets(self) -> Iterable[jet_template]:  # type: ignore
+            ...
+
+    return evt
+
+
+def _p4_math(jets):
+    return jets.px + jets.pz
+
+
+@benchmark(number=10)
+def p4_math_awk():
+    "Vector math on a collection of small records, one virtual array per field"
+    to_awk = ledm.edm_awk(_p4_events(_p4))
+    events = jagged_events(100_000)
+    return lambda: _p4_math(to_awk(events).jets.as_awkward())
+
+
+@benchmark(number=10)
+def p4_math_awk_compact():
+    "The same, with the records zipped into one array"
+    to_awk = ledm.edm_awk(_p4_events(_compact_p4))
+    events = jagged_events(100_000)
+    return lambda: _p4_math(to_awk(events).jets.as_awkward())
@@ -0,0 +1,98 @@
+"Rendering layers to awkward arrays: wide records, jagged collections and chunking"
+import awkward as ak
+import numpy as np
+import layered_edm as ledm
+from bench_navigation import _awk_evt, _evt, wide_template
+from harness import MockDataset, benchmark, jagged_events
+
+
+def _touch_all(a, fields):
+    "Materialize the (virtual) fields of a record array"
+    for f in fields:
+        ak.materialized(a[f])
+
+
+@benchmark(number=3)
+def wide_record_sx():
+    "A 50 field record, one query per field"
+    template = wide_template(50)
+    to_sx = ledm.edm_sx(template)
+    ds = MockDataset(10_000)
+    fields = [f"f{i}" for i in range(50)]
+    return lambda: _touch_all(to_sx(ds).as_awkward(), fields)
+
+
+@benchmark(number=3)
+def wide_record_sx_fused():
+    "A 50 field record, fetched with a single fused query"
+    template = wide_template(50)
+    to_sx = ledm.edm_sx(template)
+    ds = MockDataset(10_000)
+    fields = [f"f{i}" for i in range(50)]
+    return lambda: _touch_all(to_sx(ds, fuse_queries=True).as_awkward(), fields)
+
+
+@benchmark(number=3)
+def wide_record_sx_virtual():
+    "Build the virtual record, but do not touch any fields"
+    template = wide_template(50)
+    to_sx = ledm.edm_sx(template)
+    ds = MockDataset(10_000)
+    return lambda: to_sx(ds).as_awkward()
+
+
+@benchmark(number=10)
+def jagged_leaf_awk():
+    to_awk = ledm.edm_awk(_awk_evt)
+    events = jagged_events(100_000)
+    return lambda: to_awk(events).jets.pt.as_awkward()
+
+
+@benchmark(number=10)
+def jagged_record_awk():
+    to_awk = ledm.edm_awk(_awk_evt)
+    events = jagged_events(100_000)
+    return lambda: _touch_all(to_awk(events).jets.as_awkward(), ["pt"])
+
+
+@benchmark(number=5)
+def jagged_collection_sx():
+    to_sx = ledm.edm_sx(_evt)
+    ds = MockDataset(100_000)
+    return lambda: to_sx(ds).jets.pt.as_awkward()
+
+
+@benchmark(number=5)
+def iter_chunks_awk():
+    to_awk = ledm.edm_awk(_awk_evt)
+    events = jagged_events(100_000)
+    return lambda: sum(len(c) for c in to_awk(events).jets.pt.iter_chunks(10_000))
+
+
+def _min_pair_dr(jets):
+    "Smallest distance between two jets in each event - an expensive remap"
+    j1, j2 = ak.unzip(ak.combinations(jets, 2))
+    dphi = (j1.phi - j2.phi + np.pi) % (2 * np.pi) - np.pi
+    return ak.min(np.sqrt((j1.eta - j2.eta) ** 2 + dphi**2), axis=1)
+
+
+class _dr_evt:
+    @property
+    @ledm.remap(lambda e: _min_pair_dr(e.jets))
+    def min_dr(self) -> float:
+        ...
+
+
+@benchmark(number=3)
+def heavy_remap_awk():
+    to_awk = ledm.edm_awk(_dr_evt)
+    events = jagged_events(200_000, mean_jets=8.0)
+    return lambda: to_awk(events).min_dr.as_awkward()
+
+
+@benchmark(number=3)
+def heavy_remap_awk_parallel():
+    "The same remap, on 4 processes"
+    to_awk = ledm.edm_awk(_dr_evt)
+    events = jagged_events(200_000, mean_jets=8.0)
+    return lambda: to_awk(events, n_processes=4).min_dr.as_awkward()
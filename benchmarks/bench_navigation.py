@@ -0,0 +1,151 @@
+"Building layers: template navigation, attribute lookup and lambda parsing"
+from typing import Iterable
+
+import layered_edm as ledm
+from harness import MockDataset, benchmark, jagged_events
+from layered_edm.layer_awkward import LEDMAwkward
+from layered_edm.layer_nested import BaseTemplateEDMLayer
+from layered_edm.util_ast import parse_remap_lambda
+
+
+class _vertex:
+    @property
+    @ledm.remap(lambda v: v.z())
+    def z(self) -> float:
+        ...
+
+
+class _track:
+    @property
+    @ledm.remap(lambda t: t.vertex())
+    def vertex(self) -> _vertex:
+        ...
+
+
+class _jet:
+    @property
+    @ledm.remap(lambda j: j.leadingTrack())
+    def track(self) -> _track:
+        ...
+
+    @property
+    @ledm.remap(lambda j: j.pt() / 1000.0)
+    def pt(self) -> float:
+        ...
+
+
+class _evt:
+    @property
+    @ledm.remap(lambda e: e.Jets("AntiKt4EMTopoJets"))
+    def jets(self) -> Iterable[_jet]:
+        ...
+
+    @property
+    @ledm.remap(lambda e: e.Jets("AntiKt4EMTopoJets").First())
+    def leading_jet(self) -> _jet:
+        ...
+
+
+class _awk_jet:
+    @property
+    @ledm.remap(lambda j: j.pt)
+    def pt(self) -> float:
+        ...
+
+
+class _awk_evt:
+    @property
+    @ledm.remap(lambda e: e.jets)
+    def jets(self) -> Iterable[_awk_jet]:
+        ...
+
+
+def wide_template(n_fields: int) -> type:
+    "A template with `n_fields` float attributes, `f0`, `f1`, ..."
+
+    def field(i: int) -> property:
+        name = f"f{i}"
+
+        @ledm.remap(lambda e: e.field(name))
+        def get(self) -> float:
+            ...
+
+        return property(get)
+
+    return type(f"wide_{n_fields}", (), {f"f{i}": field(i) for i in range(n_fields)})
+
+
+@benchmark(number=20)
+def bind_template_sx():
+    ds = MockDataset()
+    to_sx = ledm.edm_sx(_evt)
+    return lambda: to_sx(ds)
+
+
+@benchmark(number=20)
+def navigate_deep_sx():
+    "Four levels of templates, ending in a single item. Memoized after the first call: this times the lookup"
+    data = ledm.edm_sx(_evt)(MockDataset())
+    return lambda: data.leading_jet.track.vertex.z
+
+
+@benchmark(number=20)
+def navigate_deep_sx_cold():
+    "As `navigate_deep_sx`, but from a new binding each time, so nothing is memoized"
+    ds = MockDataset()
+    to_sx = ledm.edm_sx(_evt)
+    return lambda: to_sx(ds).leading_jet.track.vertex.z
+
+
+@benchmark(number=20)
+def navigate_collection_sx():
+    "From a new binding each time - navigation is memoized"
+    ds = MockDataset()
+    to_sx = ledm.edm_sx(_evt)
+    return lambda: to_sx(ds).jets.pt
+
+
+@benchmark(number=200)
+def navigate_collection_awk():
+    "From a new binding each time - navigation (and the remaps it runs) is memoized"
+    events = jagged_events(1000)
+    to_awk = ledm.edm_awk(_awk_evt)
+    return lambda: to_awk(events).jets.pt
+
+
+@benchmark(number=2, repeat=3)
+def navigate_many_sx():
+    "Keep 1000 navigation results alive: the memory is mostly the layer objects"
+    ds = MockDataset()
+    to_sx = ledm.edm_sx(_evt)
+    return lambda: [to_sx(ds).jets for _ in range(1000)]
+
+
+@benchmark(number=2, repeat=3)
+def navigate_many_awk():
+    "Keep 10000 navigation results alive: the memory is mostly the layer objects"
+    events = jagged_events(1000)
+    to_awk = ledm.edm_awk(_awk_evt)
+    return lambda: [to_awk(events).jets for _ in range(10_000)]
+
+
+@benchmark(number=5)
+def template_layers():
+    "10000 template layers over the same data: just the cost of the layer objects"
+    layer = LEDMAwkward(jagged_events(10))
+    return lambda: [BaseTemplateEDMLayer(layer, _awk_evt) for _ in range(10_000)]
+
+
+@benchmark(number=2000)
+def find_template_attr_wide():
+    "Attribute resolution on a template with 200 attributes"
+    template = wide_template(200)
+    data = ledm.edm_sx(template)(MockDataset())
+    return lambda: data._find_template_attr("f150")
+
+
+@benchmark(number=2000)
+def parse_remap_lambda_cached():
+    func = getattr(_jet.pt.fget, "__remap_func")
+    parse_remap_lambda(func)
+    return lambda: parse_remap_lambda(func)
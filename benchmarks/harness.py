@@ -0,0 +1,185 @@
+"""Shared machinery for the benchmarks: registration, timing, memory and the
+results file.
+
+A benchmark is a setup function, decorated with `benchmark`, that returns the
+function to time. Only the returned function is measured.
+"""
+import ast
+import datetime
+import json
+import platform
+import subprocess
+import timeit
+import tracemalloc
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import awkward as ak
+import numpy as np
+from func_adl import EventDataset
+
+RESULTS_FILE = Path(__file__).parent / "results.jsonl"
+
+
+@dataclass
+class Benchmark:
+    "A registered benchmark"
+
+    # Name, `<module>.<function>`
+    name: str
+
+    # Builds everything that should not be timed, and returns what should be
+    setup: Callable[[], Callable[[], Any]]
+
+    # Number of calls in each timing loop
+    number: int
+
+    # Number of timing loops
+    repeat: int
+
+
+_benchmarks: List[Benchmark] = []
+
+
+def benchmark(number: int = 10, repeat: int = 5) -> Callable:
+    """Register a benchmark.
+
+    ```
+    @benchmark(number=100)
+    def navigate_deep():
+        return lambda: evt(ds).a.b.c.x
+    ```
+
+    Navigation is memoized on the bound template, so bind it inside the timed
+    function unless it is the cached lookup that is being timed.
+
+    Args:
+        number (int): Number of calls in each timing loop
+        repeat (int): Number of timing loops (the best and mean are reported)
+    """
+
+    def register(setup: Callable[[], Callable[[], Any]]) -> Callable[[], Callable[[], Any]]:
+        module = setup.__module__.split(".")[-1]
+        _benchmarks.append(Benchmark(f"{module}.{setup.__name__}", setup, number, repeat))
+        return setup
+
+    return register
+
+
+def registered() -> List[Benchmark]:
+    "All the benchmarks registered so far"
+    return list(_benchmarks)
+
+
+def measure(b: Benchmark) -> Dict[str, Any]:
+    """Run a benchmark.
+
+    Timing is done with `timeit`, and memory with `tracemalloc` on a separate
+    call (tracing slows everything down).
+
+    Returns:
+        Dict[str, Any]: Seconds per call (best and mean over the loops), and the peak
+            memory allocated during a single call.
+    """
+    fn = b.setup()
+    times = [t / b.number for t in timeit.repeat(fn, number=b.number, repeat=b.repeat)]
+
+    fn = b.setup()
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "best_s": min(times),
+        "mean_s": sum(times) / len(times),
+        "peak_bytes": peak,
+    }
+
+
+def git_commit() -> Tuple[Optional[str], bool]:
+    "The commit of the working tree, and whether it has changes. None if not in git."
+    root = Path(__file__).parent
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=root, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        status = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            cwd=root,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None, False
+    return commit, len(status) > 0
+
+
+def append_results(results: Dict[str, Dict[str, Any]], path: Path = RESULTS_FILE):
+    "Append one JSON line per benchmark, keyed by the current git commit"
+    commit, dirty = git_commit()
+    when = datetime.datetime.now(datetime.timezone.utc).isoformat()
+    with path.open("a") as f:
+        for name, r in results.items():
+            line = {
+                "commit": commit,
+                "dirty": dirty,
+                "time": when,
+                "python": platform.python_version(),
+                "benchmark": name,
+                **r,
+            }
+            f.write(json.dumps(line) + "\n")
+
+
+def load_results(path: Path = RESULTS_FILE) -> List[Dict[str, Any]]:
+    "All the results recorded so far, oldest first"
+    if not path.exists():
+        return []
+    with path.open() as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class MockDataset(EventDataset):
+    """An offline `EventDataset`. Every query returns `n_events` worth of
+    synthetic data: a record for a dictionary `Select`, numbers otherwise.
+    """
+
+    def __init__(self, n_events: int = 1000):
+        super().__init__()
+        self._n_events = n_events
+        self.n_queries = 0
+
+    async def execute_result_async(self, a: ast.AST, _title: Optional[str] = None) -> Any:
+        select_lambda = a.args[0].args[1] if isinstance(a.args[0], ast.Call) else None
+        if isinstance(select_lambda, ast.Lambda) and isinstance(select_lambda.body, ast.Constant):
+            # The number of events
+            return ak.Array(np.zeros(self._n_events, dtype=np.int64))
+        self.n_queries += 1
+
+        values = np.arange(self._n_events, dtype=np.float64)
+        if isinstance(select_lambda, ast.Lambda) and isinstance(select_lambda.body, ast.Dict):
+            return ak.Array({k.value: values for k in select_lambda.body.keys})  # type: ignore
+        return ak.Array(values)
+
+
+def jagged_events(n_events: int, mean_jets: float = 4.0, seed: int = 42) -> ak.Array:
+    "Synthetic events with a jagged collection of jets (`pt`, `eta`, `phi`) and `met`"
+    rng = np.random.default_rng(seed)
+    counts = rng.poisson(mean_jets, n_events)
+    n_jets = int(counts.sum())
+    jets = ak.zip(
+        {
+            "pt": rng.exponential(50.0, n_jets),
+            "eta": rng.normal(0.0, 1.5, n_jets),
+            "phi": rng.uniform(-np.pi, np.pi, n_jets),
+        }
+    )
+    return ak.zip(
+        {"met": rng.exponential(30.0, n_events), "jets": ak.unflatten(jets, counts)},
+        depth_limit=1,
+    )
@@ -0,0 +1,92 @@
+"""Run the benchmarks, and record the results against the current git commit.
+
+```
+python benchmarks/run.py                  # run everything, append to results.jsonl
+python benchmarks/run.py -k navigate      # only benchmarks with `navigate` in the name
+python benchmarks/run.py --report         # trends across the recorded commits
+```
+"""
+import argparse
+import importlib
+import sys
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Dict, List
+
+# Benchmark the checked out code, not whatever version is installed
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent))
+
+import harness  # noqa: E402
+
+
+def _load_benchmarks() -> List[harness.Benchmark]:
+    for f in sorted(Path(__file__).parent.glob("bench_*.py")):
+        importlib.import_module(f.stem)
+    return harness.registered()
+
+
+def _format_time(seconds: float) -> str:
+    for unit, scale in (("s", 1.0), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.3g} {unit}"
+    return f"{seconds / 1e-9:.3g} ns"
+
+
+def _format_bytes(n: int) -> str:
+    for unit, scale in (("MB", 1024**2), ("kB", 1024)):
+        if n >= scale:
+            return f"{n / scale:.3g} {unit}"
+    return f"{n} B"
+
+
+def run(pattern: str, save: bool):
+    results: Dict[str, Dict[str, Any]] = {}
+    for b in _load_benchmarks():
+        if pattern not in b.name:
+            continue
+        r = harness.measure(b)
+        results[b.name] = r
+        print(
+            f"{b.name:45} {_format_time(r['best_s']):>10} {_format_time(r['mean_s']):>10}"
+            f" {_format_bytes(r['peak_bytes']):>10}"
+        )
+    if save and len(results) > 0:
+        harness.append_results(results)
+
+
+def report(pattern: str, n_commits: int):
+    "Print best time and peak memory for the last `n_commits` commits of each benchmark"
+    by_benchmark: Dict[str, Dict[str, Dict[str, Any]]] = defaultdict(dict)
+    for r in harness.load_results():
+        if pattern in r["benchmark"]:
+            commit = (r["commit"] or "unknown")[:8] + ("+" if r["dirty"] else "")
+            # The latest run for a commit wins
+            by_benchmark[r["benchmark"]].pop(commit, None)
+            by_benchmark[r["benchmark"]][commit] = r
+
+    for name, runs in sorted(by_benchmark.items()):
+        print(name)
+        for commit, r in list(runs.items())[-n_commits:]:
+            print(
+                f"    {commit:10} {_format_time(r['best_s']):>10}"
+                f" {_format_bytes(r['peak_bytes']):>10}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("-k", default="", help="Only benchmarks with this in their name")
+    parser.add_argument("--no-save", action="store_true", help="Do not record the results")
+    parser.add_argument("--report", action="store_true", help="Show the recorded results")
+    parser.add_argument("--commits", type=int, default=10, help="Commits to show in the report")
+    args = parser.parse_args()
+
+    if args.report:
+        report(args.k, args.commits)
+    else:
+        run(args.k, not args.no_save)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,14 @@
 from .layer_servicex import edm_sx  # NOQA
 from .layer_awkward import edm_awk, add_awk_behavior  # NOQA
-from .base_layer import remap  # NOQA
+from .layer_uproot import edm_uproot  # NOQA
+from .layer_parquet import edm_from_parquet  # NOQA
+from .layer_dask import edm_dask  # NOQA
+from .base_layer import remap, filter, compact, gather_awkward  # NOQA
+from .util_cache import ResultCache  # NOQA
+from .util_columns import required_columns  # NOQA
+from .util_instrument import (  # NOQA
+    InstrumentCollector,
+    InstrumentEvent,
+    add_listener,
+    remove_listener,
+)
@@ -1,7 +1,8 @@
 from __future__ import annotations
 
+import asyncio
 from abc import ABC, abstractmethod
-from typing import Any, Callable, Optional
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
 
 import awkward as ak
 
@@ -9,6 +10,10 @@ import awkward as ak
 class BaseEDMLayer(ABC):
     "Base layer for the edm"
 
+    # A layer is created at every navigation step, so they are kept small. Subclasses
+    # must list any attributes they add.
+    __slots__ = ("_ds", "__weakref__")
+
     def __init__(self, ds):
         self._ds = ds
 
@@ -66,6 +71,91 @@ class BaseEDMLayer(ABC):
             ak.Array: array representation of the data
         """
 
+    async def as_awkward_async(self) -> ak.Array:
+        """Return an awkward array representation of this data, without blocking
+        while any queries run. Use with `gather_awkward` to run queries at the
+        same time.
+
+        The default renders with `as_awkward`.
+
+        Returns:
+            ak.Array: array representation of the data
+        """
+        return self.as_awkward()
+
+    def where(self, callback: Callable) -> Any:
+        """Filter the current expression, keeping only the entries for which
+        the callback is true (e.g. a `Where`).
+
+        Args:
+            callback (Callable): The lambda that returns True for entries to keep
+
+        Returns:
+            Any: The filtered expression
+        """
+        raise NotImplementedError(f"{type(self).__name__} does not support filtering")
+
+    def iterable_where(self, callback: Callable) -> Any:
+        """Filter the items of each sequence in the current expression, keeping
+        only the items for which the callback is true (e.g. an inner `Where`).
+
+        Args:
+            callback (Callable): The lambda that returns True for items to keep
+
+        Returns:
+            Any: The filtered expression
+        """
+        raise NotImplementedError(f"{type(self).__name__} does not support filtering")
+
+    def array_length(self) -> int:
+        """Return the number of entries `as_awkward` will return, without
+        rendering the data if at all possible.
+
+        The default renders the data - layers should override this with something
+        cheaper (a count query, `len`, etc.).
+
+        Returns:
+            int: Number of entries
+        """
+        return len(self.as_awkward())
+
+    def iter_chunks(self, step_size: int) -> Iterator[ak.Array]:
+        """Render the data as a sequence of awkward arrays, each with at most
+        `step_size` entries. Concatenated, they are the same as `as_awkward`.
+
+        Where the layer can be split (e.g. an in-memory awkward array) each chunk
+        is only built when it is needed. If the backend returns a partitioned
+        array (e.g. one partition per file), the partitions are visited one
+        at a time.
+
+        Args:
+            step_size (int): Maximum number of entries in each chunk
+
+        Returns:
+            Iterator[ak.Array]: The chunks
+        """
+        assert step_size > 0, "step_size must be positive"
+        for layer in self._chunk_layers(step_size):
+            data = layer.as_awkward()
+            for part in _partitions(data):
+                for start in range(0, len(part), step_size):
+                    stop = start + step_size
+                    yield part[start:stop]
+
+    def _chunk_layers(self, step_size: int) -> Iterator[BaseEDMLayer]:
+        """Split this layer into layers that each cover a consecutive range
+        of at most `step_size` entries.
+
+        The default can't split, and returns this layer.
+
+        Args:
+            step_size (int): Maximum number of entries in each layer
+
+        Returns:
+            Iterator[BaseEDMLayer]: The layers
+        """
+        yield self
+
     @abstractmethod
     def iterable_map(self, callback: Callable) -> BaseEDMLayer:
         """Return a new layer that is a map over some sequence - map function.
@@ -78,6 +168,111 @@ class BaseEDMLayer(ABC):
         """
         ...
 
+    def single_item_record_map(self, callbacks: Dict[str, Callable]) -> Optional[Any]:
+        """Apply several single item maps at once, returning a single expression
+        that yields a record with one field per callback.
+
+        Layers that can not (or choose not to) fuse maps return None, in which
+        case each field is rendered on its own.
+
+        Args:
+            callbacks (Dict[str, Callable]): Field name to lambda to apply
+
+        Returns:
+            Optional[Any]: The fused expression, or None if not supported
+        """
+        return None
+
+    def iterable_record_map(self, callbacks: Dict[str, Callable]) -> Optional[Any]:
+        """Like `single_item_record_map`, but each callback is mapped over a sequence.
+
+        Args:
+            callbacks (Dict[str, Callable]): Field name to lambda to apply
+
+        Returns:
+            Optional[Any]: The fused expression, or None if not supported
+        """
+        return None
+
+    def plan_layer(self) -> Optional[BaseEDMLayer]:
+        """For backends that run remaps and filters as soon as they are navigated to: a
+        stand-in for this layer that describes them without running them (see
+        `explain_remap`). `BaseTemplateEDMLayer.explain` uses it instead of navigating.
+
+        Returns:
+            Optional[BaseEDMLayer]: The stand-in, or None (the default) if navigating
+                runs nothing.
+        """
+        return None
+
+    def explain_remap(
+        self, callback: Union[Callable, str], caller_name: str = "remap"
+    ) -> BaseEDMLayer:
+        """On a stand-in (see `plan_layer`): the stand-in for the result of a remap
+        (or filter), for `explain_operation` to describe.
+
+        Args:
+            callback (Callable|str): The remap or filter lambda. The name of the
+                attribute for a template attribute with no remap (which is read from
+                the wrapped data).
+            caller_name (str): "remap" or "filter"
+
+        Returns:
+            BaseEDMLayer: The stand-in for the result
+        """
+        raise NotImplementedError(f"{type(self).__name__} is not a stand-in (see `plan_layer`)")
+
+    def explain_operation(self, length: bool = False) -> str:
+        """Describe what `as_awkward` (or `array_length`) will run, without running
+        it. See `BaseTemplateEDMLayer.explain`.
+
+        Args:
+            length (bool): Describe `array_length` rather than `as_awkward`
+
+        Returns:
+            str: The description
+        """
+        return f"{type(self).__name__}.{'array_length' if length else 'as_awkward'}()"
+
+    def explain_summary(self, operations: List[Tuple[BaseEDMLayer, bool]]) -> List[str]:
+        """Summarize the work needed to run several operations on layers built
+        from this one. See `BaseTemplateEDMLayer.explain`.
+
+        Args:
+            operations (List[Tuple[BaseEDMLayer, bool]]): Each layer, and whether it is
+                its length (see `explain_operation`) that is needed.
+
+        Returns:
+            List[str]: Lines of the summary
+        """
+        return [f"Operations: {len(operations)}"]
+
+
+async def gather_awkward(*layers: BaseEDMLayer) -> List[ak.Array]:
+    """Render several layers at once - all the queries they need are submitted
+    together, so the time taken is close to that of the slowest one.
+
+    ```
+    jets, electrons = await ledm.gather_awkward(data.jets, data.electrons)
+    ```
+
+    Args:
+        layers (BaseEDMLayer): The layers to render (from one or more datasets)
+
+    Returns:
+        List[ak.Array]: The rendered arrays, in the same order as `layers`
+    """
+    return list(await asyncio.gather(*(layer.as_awkward_async() for layer in layers)))
+
+
+def _partitions(data: ak.Array) -> Iterator[ak.Array]:
+    "Return the partitions of an awkward array (or the array if it is not partitioned)"
+    if ak.partitions(data) is None:
+        yield data
+    else:
+        for p in data.layout.partitions:
+            yield ak.Array(p, behavior=data.behavior)
+
 
 def remap(l_func: Optional[Callable] = lambda a: a) -> Callable:
     """Wrap a property to redirect how the item is actually accessed
@@ -113,3 +308,91 @@ def remap(l_func: Optional[Callable] = lambda a: a) -> Callable:
         return p
 
     return attach_lambda
+
+
+def filter(l_func: Callable) -> Callable:
+    """Class decorator to filter the data seen through a template.
+
+    ```
+    @ledm.edm_sx
+    @ledm.filter(lambda e: e.MissingET().First().met() > 50.0)
+    class evt:
+        ...
+    ```
+
+    Only events for which the lambda is true will be seen when accessing
+    any property of `evt`. The filter is sent to the backend, so for ServiceX
+    it becomes a `Where` in the query.
+
+    If the template is used as the element of a collection, then the filter
+    is applied to each object in the collection instead:
+
+    ```
+    @ledm.filter(lambda j: j.pt() > 30000.0)
+    class good_jet(jet):
+        ...
+
+    class evt:
+        @property
+        @ledm.remap(lambda e: e.Jets())
+        def good_jets(self) -> Iterable[good_jet]:
+            ...
+    ```
+
+    Notes:
+        * The `@ledm.filter` must come after the layer decorator (e.g. `@ledm.edm_sx`).
+        * The lambda is applied to the same thing the `remap` lambdas of the template
+          are applied to.
+        * Multiple filters can be given - they are applied in order, top to bottom.
+        * A template with a filter can't be used for a single object (`def met(self) -> met_t`):
+          dropping entries would misalign it with the other fields, so it raises `ValueError`.
+
+    Args:
+        l_func (Callable): The lambda function that returns True for the data to keep.
+
+    Returns:
+        Callable: Returns a function that can be used to wrap a class.
+    """
+
+    def attach_filter(class_to_wrap: type) -> type:
+        if "_ledm_filters" not in class_to_wrap.__dict__:
+            setattr(class_to_wrap, "_ledm_filters", [])
+        # Decorators are applied bottom up, so insert at the front to keep source order.
+        getattr(class_to_wrap, "_ledm_filters").insert(0, l_func)
+        return class_to_wrap
+
+    return attach_filter
+
+
+def compact(class_to_wrap: type) -> type:
+    """Class decorator to render a template as one contiguous record array.
+
+    ```
+    @ledm.compact
+    class p4:
+        @property
+        @ledm.remap(lambda j: j.pt())
+        def pt(self) -> float:
+            ...
+        ...
+    ```
+
+    By default each field of a rendered template is a virtual array that is only
+    fetched when it is used. A compact template fetches all its fields when it is
+    rendered, and zips them together - for small records (like 4-vectors) that are
+    always used whole this is faster, and the behavior methods run on contiguous
+    arrays.
+
+    Notes:
+        * The `@ledm.compact` must come after the layer decorator (e.g. `@ledm.edm_sx`).
+        * Templates whose fields are all terminal (`float`, etc.) are rendered this way
+          anyway when the backend can fetch all the fields with one query.
+
+    Args:
+        class_to_wrap (type): The template class
+
+    Returns:
+        type: The template class
+    """
+    setattr(class_to_wrap, "_ledm_compact", True)
+    return class_to_wrap
@@ -1,25 +1,142 @@
-from typing import Any, Callable, Optional, Union
+import ast
+import itertools
+import multiprocessing
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
 import awkward as ak
 
 from layered_edm.util_types import append_awk_behavior_to_class, class_behavior
 
 from .layer_nested import BaseTemplateEDMLayer
 from .base_layer import BaseEDMLayer
+from .util_ast import parse_remap
+from .util_vectorize import vectorize_remap
+
+
+# Smallest number of entries worth sending to another process
+_min_partition_size = 10000
+
+# The arrays and callbacks being mapped in parallel, by id. The worker processes
+# are forked after the work is added here, so they share the array's memory with
+# us rather than receiving a copy.
+_parallel_work: Dict[int, Tuple[ak.Array, Callable]] = {}
+_parallel_ids = itertools.count()
+
+
+def _map_partition(work_id: int, start: int, stop: int) -> Any:
+    "Run in a worker process: apply the callback to a range of entries"
+    data, callback = _parallel_work[work_id]
+    return callback(data[start:stop])
+
+
+def _parallel_map(data: ak.Array, callback: Callable, n_processes: Optional[int]) -> Any:
+    """Apply `callback` to `data`, split into ranges of entries that are each
+    processed by a different process. The results are concatenated.
+
+    Runs in this process if `n_processes` is None, `data` is too small to be
+    worth splitting, or the platform can not fork.
+
+    Args:
+        data (ak.Array): The array to map over
+        callback (Callable): The function to apply
+        n_processes (Optional[int]): Maximum number of processes to use
+
+    Returns:
+        Any: The result of `callback(data)`
+    """
+    n = min(n_processes or 1, len(data) // _min_partition_size)
+    if n < 2 or "fork" not in multiprocessing.get_all_start_methods():
+        return callback(data)
+
+    edges = [len(data) * i // n for i in range(n + 1)]
+    work_id = next(_parallel_ids)
+    _parallel_work[work_id] = (data, callback)
+    try:
+        with multiprocessing.get_context("fork").Pool(n) as pool:
+            parts = pool.starmap(
+                _map_partition,
+                [(work_id, start, stop) for start, stop in zip(edges[:-1], edges[1:])],
+            )
+    finally:
+        del _parallel_work[work_id]
+    return ak.concatenate(parts)
+
+
+def _array_size(data: Any) -> Tuple[Optional[int], bool]:
+    """The size of an array in bytes, and whether it has been read. The size of
+    an array that has not been read is estimated (None if it can't be).
+    """
+    layout = data.layout if isinstance(data, ak.Array) else data
+    if isinstance(layout, ak.partition.PartitionedArray):
+        sizes = [_array_size(p) for p in layout.partitions]
+        if any(size is None for size, _ in sizes):
+            return None, all(read for _, read in sizes)
+        return sum(size for size, _ in sizes), all(read for _, read in sizes)  # type: ignore
+    if isinstance(layout, ak.layout.VirtualArray):
+        form = layout.generator.form
+        if isinstance(form, ak.forms.NumpyForm):
+            return len(layout) * form.itemsize, False
+        return None, False
+    return getattr(layout, "nbytes", None), True
 
 
 class LEDMAwkward(BaseEDMLayer):
-    def __init__(self, awk_array: ak.Array):
+    __slots__ = ("_n_processes", "_func_adl_style")
+
+    def __init__(
+        self,
+        awk_array: ak.Array,
+        n_processes: Optional[int] = None,
+        func_adl_style: bool = False,
+    ):
+        """Wrap an awkward array.
+
+        Args:
+            awk_array (ak.Array): The array
+            n_processes (Optional[int]): If given, remaps and filters are run in (up to)
+                this many processes, each on a range of entries.
+            func_adl_style (bool): If True, remaps and filters are func_adl lambdas
+                (`e.Jets().Select(lambda j: j.pt())`), translated to array operations.
+        """
         super().__init__(awk_array)
+        self._n_processes = n_processes
+        self._func_adl_style = func_adl_style
 
     def wrap(self, s: Any) -> BaseEDMLayer:
-        return LEDMAwkward(s)
+        return LEDMAwkward(s, self._n_processes, self._func_adl_style)
+
+    def _apply(self, callback: Callable, caller_name: str = "remap") -> Any:
+        "Run a remap (or filter) on the array"
+        if self._func_adl_style:
+            callback = vectorize_remap(callback, caller_name)
+        return _parallel_map(self.ds, callback, self._n_processes)
 
     def single_item_map(self, callback: Callable) -> Any:
-        return callback(self.ds)
+        return self._apply(callback)
 
     def as_awkward(self):
         return self.ds
 
+    def array_length(self) -> int:
+        return len(self.ds)
+
+    def plan_layer(self) -> BaseEDMLayer:
+        "Remaps are run as soon as they are navigated to"
+        return _AwkwardPlan(self.ds, len(self.ds), func_adl_style=self._func_adl_style)
+
+    def _chunk_layers(self, step_size: int) -> Iterator[BaseEDMLayer]:
+        "Slice the source array"
+        for start in range(0, len(self.ds), step_size):
+            stop = start + step_size
+            yield self.wrap(self.ds[start:stop])
+
+    def where(self, callback: Callable) -> ak.Array:
+        "Build the mask once, and apply it"
+        return self.ds[self._apply(callback, "filter")]
+
+    def iterable_where(self, callback: Callable) -> ak.Array:
+        "The mask is jagged, but that is the same array operation"
+        return self.ds[self._apply(callback, "filter")]
+
     def add_behavior(self, b_name: str):
         """Add a behavior to the awkward array.
 
@@ -33,7 +150,128 @@ class LEDMAwkward(BaseEDMLayer):
 
     def iterable_map(self, callback: Callable) -> BaseEDMLayer:
         "Because everything is array operations, we just do this"
-        return callback(self.ds)
+        return self._apply(callback)
+
+
+def _field_path(function_ast: ast.Lambda, func_adl_style: bool) -> Optional[List[str]]:
+    """The fields a remap reads, if that is all it does (`lambda e: e.jets.pt` is
+    `["jets", "pt"]`). For func_adl style remaps `j.pt()` is the field `pt`.
+    """
+    path: List[str] = []
+    node = function_ast.body
+    while True:
+        if (
+            func_adl_style
+            and isinstance(node, ast.Call)
+            and isinstance(node.func, ast.Attribute)
+            and len(node.args) == 0
+            and len(node.keywords) == 0
+        ):
+            node = node.func
+        if not isinstance(node, ast.Attribute):
+            break
+        path.insert(0, node.attr)
+        node = node.value
+    if isinstance(node, ast.Name) and node.id == function_ast.args.args[0].arg:
+        return path
+    return None
+
+
+class _AwkwardPlan(BaseEDMLayer):
+    """Stands in for an awkward layer in `explain` (see `BaseEDMLayer.plan_layer`), so
+    no remap or filter is run. A remap that only reads fields (`lambda e: e.jets.pt`)
+    is a (zero-copy) projection of the source array - anything else has an unknown size.
+    Filters are not run, so after one the source array is an upper bound.
+    """
+
+    __slots__ = ("_length", "_filtered", "_func_adl_style")
+
+    def __init__(
+        self,
+        data: Optional[ak.Array],
+        length: Optional[int],
+        filtered: bool = False,
+        func_adl_style: bool = False,
+    ):
+        """Create the stand-in.
+
+        Args:
+            data (Optional[ak.Array]): What the remaps will return (None if unknown)
+            length (Optional[int]): The number of entries (None if unknown)
+            filtered (bool): If True, a filter has not been run, so `data` and `length`
+                are upper bounds.
+            func_adl_style (bool): The remaps are func_adl lambdas (see `LEDMAwkward`)
+        """
+        super().__init__(data)
+        self._length = length
+        self._filtered = filtered
+        self._func_adl_style = func_adl_style
+
+    def plan_layer(self) -> BaseEDMLayer:
+        return self
+
+    def explain_remap(
+        self, callback: Union[Callable, str], caller_name: str = "remap"
+    ) -> BaseEDMLayer:
+        if caller_name == "filter":
+            return _AwkwardPlan(self.ds, self._length, True, self._func_adl_style)
+
+        data = None
+        path = (
+            [callback]
+            if isinstance(callback, str)
+            else _field_path(parse_remap(callback, caller_name), self._func_adl_style)
+        )
+        if path is not None and self.ds is not None:
+            data = self.ds
+            for name in path:
+                if name not in ak.fields(data):
+                    # A behavior property - which would be calculated
+                    data = None
+                    break
+                data = data[name]
+        return _AwkwardPlan(data, self._length, self._filtered, self._func_adl_style)
+
+    def _entries(self) -> str:
+        if self._length is None:
+            return "unknown number of entries"
+        return f"{'at most ' if self._filtered else ''}{self._length} entries"
+
+    def explain_operation(self, length: bool = False) -> str:
+        "The size of the result, if it can be found without running anything"
+        if length:
+            return self._entries() if self._filtered else f"len() = {self._length}"
+        if self.ds is None:
+            return f"{self._entries()}, size unknown (remap not run)"
+        size, read = _array_size(self.ds)
+        if read:
+            return f"{self._entries()}, {size} bytes"
+        estimate = "size unknown" if size is None else f"~{size} bytes"
+        return f"{self._entries()}, {estimate} (not read yet)"
+
+    def explain_summary(self, operations: List[Tuple[BaseEDMLayer, bool]]) -> List[str]:
+        "The total size of the arrays"
+        sizes = [
+            (None, True) if layer.ds is None else _array_size(layer.ds)
+            for layer, length in operations
+            if isinstance(layer, _AwkwardPlan) and not length
+        ]
+        total = sum(size for size, _ in sizes if size is not None)
+        unread = sum(1 for _, read in sizes if not read)
+        unknown = " (some unknown)" if any(size is None for size, _ in sizes) else ""
+        return [f"Awkward arrays: {len(sizes)}, ~{total} bytes{unknown}, {unread} not read yet"]
+
+    def wrap(self, s: Any) -> BaseEDMLayer:
+        raise RuntimeError("Only used to explain a plan")
+
+    def single_item_map(self, callback: Callable) -> Any:
+        raise RuntimeError("Only used to explain a plan")
+
+    def iterable_map(self, callback: Callable) -> BaseEDMLayer:
+        raise RuntimeError("Only used to explain a plan")
+
+    def as_awkward(self) -> ak.Array:
+        raise RuntimeError("Only used to explain a plan")
 
 
 class LEDMAwkwardConverter(BaseEDMLayer):
@@ -41,14 +279,48 @@ class LEDMAwkwardConverter(BaseEDMLayer):
     into an awkward layer.
     """
 
+    __slots__ = ("_captured_ds", "_captured_record", "_fetched")
+
     def __init__(self, ds: BaseEDMLayer):
         super().__init__(None)
 
         self._captured_ds = ds
+        self._captured_record: Optional[ak.Array] = None
+
+        # Fields fetched before the record was built (to find its length)
+        self._fetched: Dict[str, ak.Array] = {}
 
     def __getattr__(self, name: str) -> Any:
-        "Access attributes on the captured guy, and convert to awk"
-        return getattr(self._captured_ds, name).as_awkward()
+        """Access attributes on the captured guy, and convert to awk.
+
+        If we captured a template, it is converted once, to a record array, and
+        its fields are served from that.
+        """
+        captured = self._captured_ds
+        if not isinstance(captured, BaseTemplateEDMLayer) or name not in captured.record_items():
+            return getattr(captured, name).as_awkward()
+        record = self._record(name)
+        return self._fetched[name] if name in self._fetched else record[name]
+
+    def _record(self, name: str) -> ak.Array:
+        """The captured template as a (virtual) record array. It is built when its
+        first field, `name`, is asked for: if that is a leaf, it is fetched first and
+        its length is the record's, so the backend is not asked for the length too.
+        """
+        if self._captured_record is None:
+            captured = self._captured_ds
+            assert isinstance(captured, BaseTemplateEDMLayer)
+            child = getattr(captured, name)
+            _, fused_expr, remaining = captured._record_plan()
+            if isinstance(child, BaseTemplateEDMLayer) or captured._is_dense(
+                fused_expr, remaining
+            ):
+                self._captured_record = captured.as_awkward()
+            else:
+                first = child.as_awkward()
+                self._fetched[name] = first
+                self._captured_record = captured.as_awkward(length=len(first))
+        return self._captured_record
 
     def wrap(self, s: Any) -> BaseEDMLayer:
         if isinstance(s, ak.Array):
@@ -62,6 +334,17 @@ class LEDMAwkwardConverter(BaseEDMLayer):
     def as_awkward(self) -> ak.Array:
         raise NotImplementedError()  # pragma: no cover
 
+    def array_length(self) -> int:
+        return self._captured_ds.array_length()
+
+    def plan_layer(self) -> BaseEDMLayer:
+        "The remaps run on the converted data - which would be fetched to explain them"
+        return _AwkwardPlan(None, None)
+
+    def _chunk_layers(self, step_size: int) -> Iterator[BaseEDMLayer]:
+        for layer in self._captured_ds._chunk_layers(step_size):
+            yield LEDMAwkwardConverter(layer)
+
     def iterable_map(self, callback: Callable) -> BaseEDMLayer:
         raise NotImplementedError()
 
@@ -69,12 +352,27 @@ class LEDMAwkwardConverter(BaseEDMLayer):
 def edm_awk(class_to_wrap: type) -> Callable:
     "Creates a class edm based on an awkward array"
 
-    def make_it(arr: Union[ak.Array, LEDMAwkward]):
+    def make_it(
+        arr: Union[ak.Array, LEDMAwkward],
+        n_processes: Optional[int] = None,
+        func_adl_style: bool = False,
+    ):
+        """Bind the template to the data.
+
+        Args:
+            arr (ak.Array|LEDMAwkward): The data
+            n_processes (Optional[int]): Run the remaps (and filters) on a raw awkward
+                array in up to this many processes, each on a range of entries. Only
+                worth it for expensive remaps on large arrays. Needs `fork` (not on Windows).
+            func_adl_style (bool): The template was written for ServiceX: translate its
+                func_adl remaps (`e.Jets().Select(lambda j: j.pt())`) into array operations
+                on a raw awkward array (`e.Jets.pt`).
+        """
         to_wrap = arr
 
         if isinstance(to_wrap, ak.Array):
             # Raw awkward array!
-            to_wrap = LEDMAwkward(to_wrap)
+            to_wrap = LEDMAwkward(to_wrap, n_processes, func_adl_style)
 
         if not isinstance(to_wrap, LEDMAwkward):
             # Convert from some non-awkward type
@@ -88,6 +386,8 @@ def edm_awk(class_to_wrap: type) -> Callable:
         # And create the base class
         return BaseTemplateEDMLayer(to_wrap, class_to_wrap)
 
+    # The decorated class, for `edm_from_parquet`
+    make_it.template = class_to_wrap  # type: ignore
     return make_it
 
 
@@ -96,7 +396,8 @@ def add_awk_behavior(
 ) -> Callable:
     """A decorator to add an awkward behavior to a EDM class.
 
-    You can add multiple behaviors, but only once per app right now!
+    You can add multiple behaviors - they are combined into a single behavior
+    the first time the class is bound.
 
     Args:
         behavior (type|str): Either the name of declared `ak.behavior` or
@@ -0,0 +1,199 @@
+import os
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Union
+
+import awkward as ak
+
+from .base_layer import BaseEDMLayer
+from .layer_nested import BaseTemplateEDMLayer
+from .util_types import class_behavior
+
+try:
+    import dask
+    from dask.delayed import Delayed, delayed
+except ImportError:  # pragma: no cover
+    dask = None
+
+
+def _require_dask():
+    if dask is None:
+        raise ImportError("The dask layer requires `dask` (`pip install dask`)")
+
+
+def _mask(data: ak.Array, callback: Callable) -> ak.Array:
+    "Keep the entries for which `callback` is true"
+    return data[callback(data)]
+
+
+def _record(data: ak.Array, callbacks: Dict[str, Callable]) -> ak.Array:
+    "Apply each callback, and put the results together as one record"
+    return ak.zip({k: cb(data) for k, cb in callbacks.items()}, depth_limit=1)
+
+
+def _with_name(data: ak.Array, name: str, behavior: Dict[Any, Any]) -> ak.Array:
+    "Attach a behavior - the worker processes do not have our `ak.behavior`"
+    return ak.Array(data, with_name=name, behavior=behavior)
+
+
+def _behavior_for(name: str) -> Dict[Any, Any]:
+    "The entries of `ak.behavior` for the behavior `name`"
+    return {
+        k: v for k, v in ak.behavior.items() if k == name or (isinstance(k, tuple) and name in k)
+    }
+
+
+def _split(data: ak.Array, npartitions: int) -> List[ak.Array]:
+    "Split an array into (at most) `npartitions` consecutive pieces of about the same size"
+    n = max(1, min(npartitions, len(data)))
+    edges = [len(data) * i // n for i in range(n + 1)]
+    return [data[start:stop] for start, stop in zip(edges[:-1], edges[1:])]
+
+
+class LEDMDask(BaseEDMLayer):
+    """An awkward array split into partitions, each one a `dask.delayed` task.
+
+    Every map and filter is applied to each partition, building up a task graph
+    that is only run (all partitions at once) when the data is rendered with
+    `as_awkward`.
+    """
+
+    __slots__ = ("_scheduler", "_lengths")
+
+    def __init__(
+        self,
+        partitions: Sequence[Any],
+        scheduler: str = "processes",
+        lengths: Optional[Sequence[int]] = None,
+    ):
+        """Create the layer.
+
+        Args:
+            partitions (Sequence[Any]): One `Delayed` awkward array per partition
+            scheduler (str): The dask scheduler used to run the graph
+            lengths (Optional[Sequence[int]]): The length of each partition, if known
+        """
+        super().__init__(list(partitions))
+        self._scheduler = scheduler
+        self._lengths = None if lengths is None else list(lengths)
+
+    def __getattr__(self, name: str) -> Any:
+        "Access the attribute on each partition"
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self.wrap([delayed(getattr)(p, name) for p in self.ds])
+
+    @property
+    def scheduler(self) -> str:
+        return self._scheduler
+
+    def wrap(self, s: Any) -> BaseEDMLayer:
+        "`s` is a list of partitions"
+        return LEDMDask(s, self._scheduler)
+
+    def single_item_map(self, callback: Callable) -> Any:
+        return [delayed(callback)(p) for p in self.ds]
+
+    def iterable_map(self, callback: Callable) -> Any:
+        "Everything is array operations, so this is the same as `single_item_map`"
+        return [delayed(callback)(p) for p in self.ds]
+
+    def single_item_record_map(self, callbacks: Dict[str, Callable]) -> Optional[Any]:
+        "Each partition renders all the fields at once"
+        return [delayed(_record)(p, callbacks) for p in self.ds]
+
+    def iterable_record_map(self, callbacks: Dict[str, Callable]) -> Optional[Any]:
+        return [delayed(_record)(p, callbacks) for p in self.ds]
+
+    def where(self, callback: Callable) -> Any:
+        return [delayed(_mask)(p, callback) for p in self.ds]
+
+    def iterable_where(self, callback: Callable) -> Any:
+        "The mask is jagged, but that is the same array operation"
+        return [delayed(_mask)(p, callback) for p in self.ds]
+
+    def add_behavior(self, b_name: str):
+        """Attach a behavior to each partition. The behavior classes are sent along
+        with each partition, so they work in other processes too.
+
+        Args:
+            b_name (str): The name of the behavior
+        """
+        behavior = _behavior_for(b_name)
+        self._ds = [delayed(_with_name)(p, b_name, behavior) for p in self.ds]
+
+    def as_awkward(self) -> ak.Array:
+        "Run the graph for all the partitions, and put them back together"
+        parts = dask.compute(*self.ds, scheduler=self._scheduler)
+        if len(parts) == 1:
+            return parts[0]
+        return ak.concatenate(parts)
+
+    def array_length(self) -> int:
+        if self._lengths is None:
+            self._lengths = list(
+                dask.compute(*[delayed(len)(p) for p in self.ds], scheduler=self._scheduler)
+            )
+        return sum(self._lengths)
+
+    def _chunk_layers(self, step_size: int) -> Iterator[BaseEDMLayer]:
+        "One layer per partition"
+        for i, p in enumerate(self.ds):
+            yield LEDMDask(
+                [p], self._scheduler, None if self._lengths is None else [self._lengths[i]]
+            )
+
+
+def edm_dask(class_to_wrap: type) -> Callable:
+    """Creates a class edm based on an awkward array split into partitions that
+    are processed in parallel with dask.
+
+    ```
+    @ledm.edm_dask
+    class evt:
+        @property
+        @ledm.remap(lambda e: e.met)
+        def met(self) -> float:
+            ...
+
+    events = evt(arr, npartitions=8)
+    events.met.as_awkward()  # Runs on 8 processes
+    ```
+    """
+
+    def make_it(
+        arr: Union[ak.Array, Sequence[ak.Array], LEDMDask],
+        npartitions: Optional[int] = None,
+        scheduler: str = "processes",
+    ):
+        """Bind the template to the data.
+
+        Args:
+            arr (ak.Array|Sequence[ak.Array]|LEDMDask): The data. A single array is split
+                into `npartitions`, a list of arrays is used as the partitions.
+            npartitions (Optional[int]): Number of partitions to split a single array into.
+                Defaults to the number of cores.
+            scheduler (str): The dask scheduler (see `dask.compute`). Ignored for `LEDMDask`.
+        """
+        _require_dask()
+        to_wrap = arr
+        if not isinstance(to_wrap, LEDMDask):
+            parts = (
+                _split(to_wrap, npartitions or os.cpu_count() or 1)
+                if isinstance(to_wrap, ak.Array)
+                else list(to_wrap)
+            )
+            to_wrap = LEDMDask(
+                [p if isinstance(p, Delayed) else delayed(p, pure=False) for p in parts],
+                scheduler,
+                None if any(isinstance(p, Delayed) for p in parts) else [len(p) for p in parts],
+            )
+
+        # Behaviors are attached to each partition
+        behaviors = class_behavior(class_to_wrap)
+        if behaviors is not None:
+            to_wrap.add_behavior(behaviors)
+
+        return BaseTemplateEDMLayer(to_wrap, class_to_wrap)
+
+    # The decorated class, for `edm_from_parquet`
+    make_it.template = class_to_wrap  # type: ignore
+    return make_it
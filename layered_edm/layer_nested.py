@@ -1,8 +1,34 @@
-from typing import Any, Callable, Optional, Tuple, Type, get_args, get_type_hints
+import asyncio
+import time
+import weakref
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from types import MappingProxyType
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Mapping,
+    MutableMapping,
+    Optional,
+    Tuple,
+    Type,
+    Union,
+    get_args,
+    get_type_hints,
+)
 
 import awkward as ak
 
 from layered_edm.base_layer import BaseEDMLayer
+from layered_edm.util_instrument import ARRAY_MATERIALIZED, emit, result_size
+from layered_edm.util_instrument import enabled as instrument_enabled
+from layered_edm.util_ast import parse_remap
+from layered_edm.util_compat import unparse
+from layered_edm.util_parquet import write_parquet
 from layered_edm.util_types import class_behavior, is_iterable
 
 
@@ -21,14 +47,137 @@ def _is_terminal(t: Type) -> bool:
     return False
 
 
+@dataclass(frozen=True)
+class TemplateAttribute:
+    "How an attribute of a template is resolved"
+
+    # The remapping function attached to the property (or None)
+    remap_func: Optional[Callable]
+
+    # The return type annotation of the property (or None)
+    return_type: Optional[Type]
+
+    # True if this is a simple value (float, etc.) rather than another template
+    is_terminal: bool
+
+    # True if this is a collection of another template
+    is_iterable: bool
+
+    # The template for the returned object (the element template for a collection)
+    element_type: Optional[Type]
+
+
+_template_tables: MutableMapping[
+    type, Mapping[str, TemplateAttribute]
+] = weakref.WeakKeyDictionary()
+
+
+def _compile_template_attribute(p: property) -> TemplateAttribute:
+    "Work out how to resolve a single template property"
+    l_callback = getattr(p.fget, "__remap_func", None)
+
+    # Get type hints back in case we are going for a second type of object for return.
+    hints = get_type_hints(p.fget)
+    rtn_type = hints.get("return", None)
+
+    if rtn_type is None or _is_terminal(rtn_type):
+        return TemplateAttribute(l_callback, rtn_type, True, False, None)
+    if is_iterable(rtn_type):
+        return TemplateAttribute(l_callback, rtn_type, False, True, get_args(rtn_type)[0])
+    return TemplateAttribute(l_callback, rtn_type, False, False, rtn_type)
+
+
+def template_table(template: type) -> Mapping[str, TemplateAttribute]:
+    """Return the resolution table for a template class: property name
+    to `TemplateAttribute`.
+
+    The table is built the first time a template is used, and is then
+    shared (read-only) by all layers that use that template.
+
+    Args:
+        template (type): The template class
+
+    Returns:
+        Mapping[str, TemplateAttribute]: The read-only table
+    """
+    table = _template_tables.get(template)
+    if table is None:
+        attributes = {}
+        for name in dir(template):
+            p = getattr(template, name, None)
+            if isinstance(p, property):
+                attributes[name] = _compile_template_attribute(p)
+        table = MappingProxyType(attributes)
+        _template_tables[template] = table
+    return table
+
+
+def template_filters(template: type) -> Tuple[Callable, ...]:
+    """Return all the filters attached to a template class (see `filter`),
+    including those on the classes it inherits from (applied first).
+
+    Args:
+        template (type): The template class
+
+    Returns:
+        Tuple[Callable, ...]: The filter lambdas, in the order they should be applied
+    """
+    return tuple(
+        f for c in reversed(template.__mro__) for f in c.__dict__.get("_ledm_filters", [])
+    )
+
+
+class _VirtualField:
+    """Generates a field of a record (see `BaseTemplateEDMLayer.as_awkward`), and
+    reports it (see `util_instrument`).
+    """
+
+    def __init__(self, field: str, generate: Callable[[], ak.Array]):
+        self._field = field
+        self._generate = generate
+
+        # What we generated. A nested template is itself made of virtual arrays, and
+        # their caches live only as long as the array that holds them.
+        self._generated: Optional[ak.Array] = None
+
+    def __call__(self) -> ak.Array:
+        start = time.perf_counter()
+        self._generated = self._generate()
+        result = ak.repartition(self._generated, None)
+        if instrument_enabled():
+            emit(
+                ARRAY_MATERIALIZED,
+                field=self._field,
+                duration=time.perf_counter() - start,
+                **result_size(result),
+            )
+        return result
+
+
+def _zip_record(items: Dict[str, ak.Array], behavior_name: Optional[str]) -> ak.Array:
+    """Zip the (already fetched) fields into one record array. The records are
+    placed as deep as the shallowest field (inside the jagged lists of a collection).
+    """
+    fields = {k: ak.repartition(v, None) for k, v in items.items()}
+    depth = min(v.ndim for v in fields.values())
+    return ak.zip(fields, depth_limit=depth, with_name=behavior_name)
+
+
 class BaseTemplateEDMLayer(BaseEDMLayer):
     "Wrap a template that deals with a particular data type"
 
+    __slots__ = ("_template", "_attributes", "_expression", "_children")
+
     def __init__(self, wrapped: BaseEDMLayer, template: type):
         super().__init__(wrapped)
         self._template: type = template
+        self._attributes = template_table(template)
         self._expression: Optional[BaseEDMLayer] = None
 
+        # The layers of the template attributes navigated to so far. The children do
+        # not refer back to us, so they do not keep us alive.
+        self._children: Optional[Dict[str, Any]] = None
+
     def _get_expression(self) -> BaseEDMLayer:
         """Returns the expression that represents this layer.
 
@@ -36,39 +185,87 @@ class BaseTemplateEDMLayer(BaseEDMLayer):
             BaseEDMLayer: The expression representing this layer.
         """
         if self._expression is None:
-            self._expression = self.ds._get_expression()
+            expr = self.ds._get_expression()
+            for f in template_filters(self._template):
+                expr = expr.wrap(self._make_filter_call(expr, f))
+            self._expression = expr
         return self._expression
 
     def __getattr__(self, name: str) -> Any:
         """Get the attribute, using the template as a mapping.
         If we can't find it, then we will let whatever we wrap try.
 
+        The layer for a template attribute is built once: navigating the same
+        path again returns the same layer. The layer holds on to every child
+        layer it has built - and so to any array they hold, like the result of
+        an expensive awkward remap - for as long as it lives. Bind the template
+        again to start from nothing.
+
         Args:
             name (str): The name of the attribute to find
 
         Returns:
             Any: Result of fetching the attribute
         """
-        mod_call, rtn_type = self._find_template_attr(name)
-        if mod_call is None:
+        children = self._children
+        if children is not None and name in children:
+            return children[name]
+
+        attr = self._find_template_attr(name)
+        if attr is None or attr.remap_func is None:
             return getattr(self.ds, name)
 
+        if children is None:
+            children = self._children = {}
+        child = self._attribute_layer(attr)
+        children[name] = child
+        return child
+
+    def _attribute_layer(self, attr: TemplateAttribute) -> Any:
+        """Build the layer for a template attribute.
+
+        Args:
+            attr (TemplateAttribute): The attribute, which has a remapping function
+
+        Returns:
+            Any: The layer
+        """
         # Now, call remapping function. To do this we need the current
         # expression we are working on, and then wrap it back up.
         expr = self._get_expression()
-        new_expr = self._make_expr_call(mod_call)
+        new_expr = self._make_expr_call(attr.remap_func)
         new_expr_wrapped = expr.wrap(new_expr)
 
         # If the return type is not a simple type (float, int), then we need to
         # create a new template so we can follow it!
-        if rtn_type is not None and not _is_terminal(rtn_type):
-            if is_iterable(rtn_type):
-                args = get_args(rtn_type)
-                return IterableTemplateEDMLayer(new_expr_wrapped, args[0])
-            else:
-                return BaseTemplateEDMLayer(new_expr_wrapped, rtn_type)
+        if attr.is_terminal:
+            return new_expr_wrapped
+        return self._child_layer(attr, new_expr_wrapped)
+
+    def _child_layer(self, attr: TemplateAttribute, expr: BaseEDMLayer) -> BaseEDMLayer:
+        """Create the layer for an attribute that returns another template.
+
+        Args:
+            attr (TemplateAttribute): The attribute
+            expr (BaseEDMLayer): The expression the attribute maps to
+
+        Returns:
+            BaseEDMLayer: The template layer wrapping `expr`
 
-        return new_expr_wrapped
+        Raises:
+            ValueError: If a single object (not a collection) template has a filter
+        """
+        if attr.is_iterable:
+            return IterableTemplateEDMLayer(expr, attr.element_type)  # type: ignore
+        template: type = attr.element_type  # type: ignore
+        if len(template_filters(template)) > 0:
+            # Dropping entries would leave it misaligned with the other fields
+            raise ValueError(
+                f"Template {template.__name__} has a filter, so it can only be the top-level "
+                f"template or the element of a collection - not a single object of "
+                f"{self._template.__name__}"
+            )
+        return BaseTemplateEDMLayer(expr, template)
 
     def _make_expr_call(self, callback: Callable) -> BaseEDMLayer:
         """Make a call to a remapping function.
@@ -83,29 +280,66 @@ class BaseTemplateEDMLayer(BaseEDMLayer):
         expr = self._get_expression()
         return expr.single_item_map(callback)
 
-    def _find_template_attr(self, name: str) -> Tuple[Optional[Callable], Optional[Type]]:
-        """Find some sort of remapping function for a given attribute from the
-        template.
+    def _make_filter_call(self, expr: BaseEDMLayer, callback: Callable) -> Any:
+        """Apply a template filter to an expression.
+
+        Args:
+            expr (BaseEDMLayer): The expression to filter
+            callback (Callable): The filter function
+
+        Returns:
+            Any: The filtered expression
+        """
+        return expr.where(callback)
 
-        1. A remap function attached to a template attribute
-        1. Return None
+    def _make_record_expr_call(self, callbacks: Dict[str, Callable]) -> Optional[Any]:
+        """Make a single call to a set of remapping functions, returning a record.
+
+        Args:
+            callbacks (Dict[str, Callable]): Field name to remapping function
+
+        Returns:
+            Optional[Any]: The fused expression, or None if the backend can't do it.
+        """
+        expr = self._get_expression()
+        return expr.single_item_record_map(callbacks)
+
+    def _leaf_callbacks(self, items: List[str]) -> Dict[str, Callable]:
+        """Find the remapping functions for all the items that are terminal (not
+        another template).
+
+        Args:
+            items (List[str]): The template attributes to look at
+
+        Returns:
+            Dict[str, Callable]: Attribute name to remapping function
+        """
+        result = {}
+        for item in items:
+            attr = self._find_template_attr(item)
+            if attr is not None and attr.remap_func is not None and attr.is_terminal:
+                result[item] = attr.remap_func
+        return result
+
+    def _find_template_attr(self, name: str) -> Optional[TemplateAttribute]:
+        """Find how to resolve an attribute from the template.
 
         Args:
             name (str): The attribute name
 
         Returns:
-            Optional[Callable]: If a remapping function is found, this will be it. None otherwise.
+            Optional[TemplateAttribute]: The resolution info, or None if the template
+                does not have this attribute.
         """
-        t = getattr(self._template, name, None)
-        if t is None:
-            return None, None
-        l_callback = getattr(t.fget, "__remap_func", None)
+        return self._attributes.get(name)
 
-        # Get type hints back in case we are going for a second type of object for return.
-        hints = get_type_hints(t.fget)
-        rtn_type = hints.get("return", None)
+    def array_length(self) -> int:
+        return self._get_expression().array_length()
 
-        return l_callback, rtn_type
+    def _chunk_layers(self, step_size: int) -> Iterator[BaseEDMLayer]:
+        "Split what we wrap, and put this template on top of each piece"
+        for layer in self.ds._chunk_layers(step_size):
+            yield type(self)(layer, self._template)
 
     def wrap(self, s: Any) -> BaseEDMLayer:
         raise RuntimeError("Should never need to wrap a template class")
@@ -116,41 +350,267 @@ class BaseTemplateEDMLayer(BaseEDMLayer):
     def iterable_map(self, callback: Callable) -> BaseEDMLayer:
         raise NotImplementedError()
 
-    def as_awkward(self) -> ak.Array:
+    def record_items(self) -> List[str]:
+        """The attributes of the template that are fields of its records (see `as_awkward`).
+
+        Returns:
+            List[str]: The attribute names
+        """
+        return [item for item in self._attributes if not item.startswith("_")]
+
+    def _field_name(self, item: str) -> str:
+        "Name of a field of our records, for reporting"
+        return f"{self._template.__qualname__}.{item}"
+
+    def _record_plan(self) -> Tuple[List[str], Optional[Any], List[str]]:
+        """Work out how to render all the items of this template.
+
+        Returns:
+            Tuple[List[str], Optional[Any], List[str]]: The items rendered by the fused
+                expression, the fused expression (None if the backend can't fuse), and the
+                items to render one at a time.
+        """
+        all_items = self.record_items()
+        assert len(all_items) > 0, "Template has no items"
+
+        # If the backend can render all the leaf items with one query, do that.
+        leaf_callbacks = self._leaf_callbacks(all_items)
+        fused_expr = (
+            self._make_record_expr_call(leaf_callbacks) if len(leaf_callbacks) > 1 else None
+        )
+        if fused_expr is None:
+            return [], None, all_items
+
+        fused_items = list(leaf_callbacks)
+        return fused_items, fused_expr, [item for item in all_items if item not in fused_items]
+
+    def _is_dense(self, fused_expr: Optional[Any], remaining: List[str]) -> bool:
+        """True if the records should be rendered as one contiguous array rather than
+        one virtual array per field: the template is marked `compact`, or one fused
+        expression renders all of it.
+        """
+        return getattr(self._template, "_ledm_compact", False) or (
+            fused_expr is not None and len(remaining) == 0
+        )
+
+    def as_awkward(self, length: Optional[int] = None) -> ak.Array:
         """Generate awkward array for a single object (e.g not a collection)
 
+        Args:
+            length (Optional[int]): The number of entries, if it is already known. A
+                nested template has one entry for each entry of its parent, so it is
+                given its parent's length rather than asking the backend for it.
+
         Returns:
             ak.Array: The resulting info
         """
         behavior_name = class_behavior(self._template)
+        fused_items, fused_expr, remaining = self._record_plan()
+
+        if self._is_dense(fused_expr, remaining):
+            # Fetch everything now, and zip it together
+            return _VirtualField(
+                self._template.__qualname__,
+                lambda: self._dense_record(fused_items, fused_expr, remaining, behavior_name),
+            )()
 
         # Determine the length so that we do not cause everything to be generated
         # on creation.
-        all_items = [item for item in dir(self._template) if not item.startswith("_")]
-        assert len(all_items) > 0, "Template has no items"
-
-        first_item = getattr(self, all_items[0]).as_awkward()
-        n_items = len(first_item)
-
-        items = {
-            item: ak.virtual(
-                lambda o, itm: ak.repartition(getattr(o, itm).as_awkward(), None),
+        n_items = self.array_length() if length is None else length
+
+        items: Dict[str, ak.Array] = {}
+        if fused_expr is not None:
+            fetch_fused = lru_cache(maxsize=1)(self._get_expression().wrap(fused_expr).as_awkward)
+            for item in fused_items:
+                items[item] = ak.virtual(
+                    _VirtualField(
+                        self._field_name(item), lambda f=fetch_fused, itm=item: f()[itm]
+                    ),
+                    length=n_items,
+                )
+
+        for item in remaining:
+            items[item] = ak.virtual(
+                _VirtualField(
+                    self._field_name(item), lambda itm=item: self._render_child(itm, n_items)
+                ),
                 length=n_items,
-                args=(self, item),
             )
-            for item in all_items[1:]
-        }
-
-        items[all_items[0]] = ak.virtual(lambda: ak.repartition(first_item, None), length=n_items)
 
         # Build the array
         a = ak.Array(items)
         return ak.with_parameter(a, "__record__", behavior_name)
 
+    def _render_child(self, item: str, length: int) -> ak.Array:
+        "Render the layer of the attribute `item`, passing a nested template our `length`"
+        child = getattr(self, item)
+        if isinstance(child, BaseTemplateEDMLayer):
+            return child.as_awkward(length=length)
+        return child.as_awkward()
+
+    def _dense_record(
+        self,
+        fused_items: List[str],
+        fused_expr: Optional[Any],
+        remaining: List[str],
+        behavior_name: Optional[str],
+    ) -> ak.Array:
+        "Fetch all the fields (see `_record_plan`), and zip them into one record array"
+        fields: Dict[str, ak.Array] = {}
+        if fused_expr is not None:
+            fused = ak.repartition(self._get_expression().wrap(fused_expr).as_awkward(), None)
+            for item in fused_items:
+                fields[item] = fused[item]
+        for item in remaining:
+            fields[item] = getattr(self, item).as_awkward()
+        return _zip_record(fields, behavior_name)
+
+    async def as_awkward_async(self) -> ak.Array:
+        """Generate the awkward array for this object, submitting every query
+        it needs (including those of nested templates) at the same time.
+
+        Unlike `as_awkward` the result is not virtual - all the data is fetched.
+
+        Returns:
+            ak.Array: The resulting info
+        """
+        behavior_name = class_behavior(self._template)
+        fused_items, fused_expr, remaining = self._record_plan()
+
+        pending = [getattr(self, item).as_awkward_async() for item in remaining]
+        if fused_expr is not None:
+            pending.append(self._get_expression().wrap(fused_expr).as_awkward_async())
+        results = await asyncio.gather(*pending)
+
+        items: Dict[str, ak.Array] = {}
+        if fused_expr is not None:
+            fused = ak.repartition(results[-1], None)
+            for item in fused_items:
+                items[item] = fused[item]
+        for item, r in zip(remaining, results):
+            items[item] = ak.repartition(r, None)
+
+        if self._is_dense(fused_expr, remaining):
+            return _zip_record(items, behavior_name)
+        a = ak.Array(items)
+        return ak.with_parameter(a, "__record__", behavior_name)
+
+    def explain(self):
+        """Print what rendering this layer (see `as_awkward`) will run, without
+        running anything: the backend operation behind each field (for ServiceX the
+        query, for awkward the size of the result where a remap only reads fields - no
+        remap or filter is run), and a summary of the work (for ServiceX the number of
+        transforms and the sub-queries they share).
+        """
+        name = self._template.__name__
+        steps = self._plan(name, length_known=False)
+        lines = [f"Plan for {name}: {len(steps)} operations"]
+        for fields, remap_text, layer, length in steps:
+            label = f"length of {fields[0]}" if length else ", ".join(fields)
+            lines.append(f"  {label}" + ("" if remap_text is None else f"  ({remap_text})"))
+            lines.append(f"      {layer.explain_operation(length)}")
+        summary = self.ds._get_expression().plan_layer() or self._get_expression()
+        lines.extend(summary.explain_summary([(s[2], s[3]) for s in steps]))
+        print("\n".join(lines))
+
+    def _plan(
+        self, path: str, length_known: bool
+    ) -> List[Tuple[List[str], Optional[str], BaseEDMLayer, bool]]:
+        """The backend operations `as_awkward` will run.
+
+        Args:
+            path (str): The name of this layer (`evt.jets`)
+            length_known (bool): True if the length is passed in by the parent layer
+
+        Returns:
+            List[Tuple[List[str], Optional[str], BaseEDMLayer, bool]]: For each operation,
+                the fields it renders, the text of their remap (if there is one field),
+                the layer, and whether it is the length of the layer that is needed.
+        """
+        stand_in = self.ds._get_expression().plan_layer()
+        if stand_in is not None:
+            return self._plan_stand_in(path, length_known, stand_in)
+
+        fused_items, fused_expr, remaining = self._record_plan()
+
+        steps: List[Tuple[List[str], Optional[str], BaseEDMLayer, bool]] = []
+        if not length_known and not self._is_dense(fused_expr, remaining):
+            steps.append(([path], None, self._get_expression(), True))
+        if fused_expr is not None:
+            fused = self._get_expression().wrap(fused_expr)
+            steps.append(([f"{path}.{item}" for item in fused_items], None, fused, False))
+
+        for item in remaining:
+            child = getattr(self, item)
+            if isinstance(child, BaseTemplateEDMLayer):
+                steps.extend(child._plan(f"{path}.{item}", length_known=True))
+                continue
+            steps.append(([f"{path}.{item}"], self._remap_text(item), child, False))
+        return steps
+
+    def _plan_stand_in(
+        self, path: str, length_known: bool, expr: BaseEDMLayer
+    ) -> List[Tuple[List[str], Optional[str], BaseEDMLayer, bool]]:
+        """`_plan` for a backend that runs remaps and filters as soon as they are navigated
+        to. Nothing is navigated: `expr` stands in for the data (see `BaseEDMLayer.plan_layer`).
+        """
+        for f in self._planned_filters():
+            expr = expr.explain_remap(f, "filter")
+
+        remaining = self.record_items()
+        steps: List[Tuple[List[str], Optional[str], BaseEDMLayer, bool]] = []
+        if not length_known and not self._is_dense(None, remaining):
+            steps.append(([path], None, expr, True))
+
+        for item in remaining:
+            attr = self._find_template_attr(item)
+            child = expr.explain_remap(self._planned_remap(item))
+            if attr is not None and not attr.is_terminal:
+                layer = self._child_layer(attr, child)
+                steps.extend(layer._plan(f"{path}.{item}", length_known=True))
+                continue
+            steps.append(([f"{path}.{item}"], self._remap_text(item), child, False))
+        return steps
+
+    def _planned_filters(self) -> Tuple[Callable, ...]:
+        "The filters `_get_expression` applies"
+        return template_filters(self._template)
+
+    def _planned_remap(self, item: str) -> Union[Callable, str]:
+        "The remap of the attribute `item` - its name if it has none (see `explain_remap`)"
+        attr = self._find_template_attr(item)
+        return item if attr is None or attr.remap_func is None else attr.remap_func
+
+    def _remap_text(self, item: str) -> Optional[str]:
+        "The text of the remap of the attribute `item` (None if it has none)"
+        attr = self._find_template_attr(item)
+        if attr is None or attr.remap_func is None:
+            return None
+        return unparse(parse_remap(attr.remap_func))
+
+    def save(self, path: Union[str, Path]):
+        """Render this layer (see `as_awkward`) and write it to a Parquet file,
+        one column per field. Use `edm_from_parquet` to bind the template to it again.
+
+        Args:
+            path (str|Path): The file to write
+        """
+        template = self._template
+        write_parquet(
+            self.as_awkward(),
+            path,
+            {
+                "template": f"{template.__module__}.{template.__qualname__}",
+                "behavior": class_behavior(template) or "",
+                "iterable": "true" if isinstance(self, IterableTemplateEDMLayer) else "false",
+            },
+        )
+
 
 class IterableTemplateEDMLayer(BaseTemplateEDMLayer):
     "Wrap a template that deals with a collection (list, etc.) of a particular data type"
-    ...
+
+    __slots__ = ()
 
     def __init__(self, wrapped: BaseEDMLayer, template: type):
         super().__init__(wrapped, template)
@@ -158,3 +618,10 @@ class IterableTemplateEDMLayer(BaseTemplateEDMLayer):
     def _make_expr_call(self, callback: Callable) -> BaseEDMLayer:
         expr = self._get_expression()
         return expr.iterable_map(callback)
+
+    def _make_record_expr_call(self, callbacks: Dict[str, Callable]) -> Optional[Any]:
+        expr = self._get_expression()
+        return expr.iterable_record_map(callbacks)
+
+    def _make_filter_call(self, expr: BaseEDMLayer, callback: Callable) -> Any:
+        return expr.iterable_where(callback)
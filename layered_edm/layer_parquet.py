@@ -0,0 +1,126 @@
+import logging
+import operator
+import weakref
+from dataclasses import replace
+from pathlib import Path
+from types import MappingProxyType
+from typing import Callable, Mapping, MutableMapping, Optional, Tuple, Union
+
+from .base_layer import BaseEDMLayer
+from .layer_awkward import LEDMAwkward
+from .layer_nested import (
+    BaseTemplateEDMLayer,
+    IterableTemplateEDMLayer,
+    TemplateAttribute,
+    template_table,
+)
+from .util_parquet import read_parquet
+from .util_types import class_behavior
+
+_stored_tables: MutableMapping[type, Mapping[str, TemplateAttribute]] = weakref.WeakKeyDictionary()
+
+
+def stored_template_table(template: type) -> Mapping[str, TemplateAttribute]:
+    """Return the resolution table for a template bound to saved data: each
+    attribute is the column of the same name.
+
+    Args:
+        template (type): The template class
+
+    Returns:
+        Mapping[str, TemplateAttribute]: The read-only table
+    """
+    table = _stored_tables.get(template)
+    if table is None:
+        table = MappingProxyType(
+            {
+                name: replace(attr, remap_func=operator.itemgetter(name))
+                for name, attr in template_table(template).items()
+            }
+        )
+        _stored_tables[template] = table
+    return table
+
+
+class StoredTemplateEDMLayer(BaseTemplateEDMLayer):
+    """Wrap a template bound to data saved with `BaseTemplateEDMLayer.save`.
+
+    The remap functions and filters of the template were applied before the data
+    was saved, so each attribute is just the stored column of the same name.
+    """
+
+    __slots__ = ()
+
+    def __init__(self, wrapped: BaseEDMLayer, template: type):
+        super().__init__(wrapped, template)
+        self._attributes = stored_template_table(template)
+
+    def _get_expression(self) -> BaseEDMLayer:
+        "The saved data was already filtered"
+        return self.ds._get_expression()
+
+    def _planned_filters(self) -> Tuple[Callable, ...]:
+        return ()
+
+    def _planned_remap(self, item: str) -> Union[Callable, str]:
+        "Each attribute is the column of the same name"
+        return item
+
+    def _remap_text(self, item: str) -> Optional[str]:
+        return None
+
+    def _child_layer(self, attr: TemplateAttribute, expr: BaseEDMLayer) -> BaseEDMLayer:
+        if attr.is_iterable:
+            return IterableStoredTemplateEDMLayer(expr, attr.element_type)  # type: ignore
+        return StoredTemplateEDMLayer(expr, attr.element_type)  # type: ignore
+
+
+class IterableStoredTemplateEDMLayer(StoredTemplateEDMLayer, IterableTemplateEDMLayer):
+    "Wrap a template for a collection bound to saved data"
+
+    __slots__ = ()
+
+
+def edm_from_parquet(
+    template: Union[type, Callable], path: Union[str, Path]
+) -> BaseTemplateEDMLayer:
+    """Bind a template to data saved with `save`. The file is read lazily, one
+    column at a time, as the data is needed.
+
+    ```
+    events.jets.save("jets.parquet")
+    ...
+    jets = ledm.edm_from_parquet(jet, "jets.parquet")
+    ```
+
+    Args:
+        template (type): The template the data was saved with. A template decorated
+            with `edm_awk`, `edm_sx`, ... can be passed as is.
+        path (str|Path): The Parquet file
+
+    Returns:
+        BaseTemplateEDMLayer: The template layer
+
+    Raises:
+        TypeError: If `template` is not a template class
+    """
+    template = getattr(template, "template", template)
+    if not isinstance(template, type):
+        raise TypeError(f"{template!r} is not a template class")
+
+    array, metadata = read_parquet(path)
+
+    name = f"{template.__module__}.{template.__qualname__}"
+    if metadata.get("template", name) != name:
+        logging.getLogger(__name__).warning(
+            f"{path} was saved from template {metadata['template']}, not {name}"
+        )
+
+    layer = LEDMAwkward(array)
+    behavior = class_behavior(template) or metadata.get("behavior")
+    if behavior:
+        layer.add_behavior(behavior)
+
+    if metadata.get("iterable") == "true":
+        return IterableStoredTemplateEDMLayer(layer, template)
+    return StoredTemplateEDMLayer(layer, template)
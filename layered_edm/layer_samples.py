@@ -0,0 +1,140 @@
+import ast
+import asyncio
+import copy
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Union
+
+import awkward as ak
+import numpy as np
+from func_adl import ObjectStream
+from make_it_sync import make_sync
+
+from .util_compat import unparse
+
+
+def _rebase_query(query: ast.AST, base: ast.AST, new_base: ast.AST) -> ast.AST:
+    """Return `query` with the `base` query it was built on (found by following
+    the first argument of each call) replaced by `new_base`. Only the nodes
+    along that path are copied.
+    """
+    if query is base:
+        return new_base
+    if not isinstance(query, ast.Call) or len(query.args) == 0:
+        raise ValueError(f"Query {unparse(query)} is not built on {unparse(base)}")
+    rebased = copy.copy(query)
+    rebased.args = [_rebase_query(query.args[0], base, new_base)] + query.args[1:]
+    return rebased
+
+
+@dataclass(frozen=True)
+class _SampleTarget:
+    "Where queries built on the `base` stream should be sent instead"
+
+    # The query of the stream the layers were built on
+    base: ast.AST
+
+    # The stream of the sample's dataset
+    stream: ObjectStream
+
+    # Identity of the sample's dataset for the cache keys (or None)
+    dataset_id: Optional[str]
+
+    def rebase(self, s: ObjectStream) -> ObjectStream:
+        return ObjectStream(
+            _rebase_query(s.query_ast, self.base, self.stream.query_ast), s.item_type
+        )
+
+
+# Set while rendering one sample of a sample set: all queries are sent to its dataset.
+_active_sample: ContextVar[Optional[_SampleTarget]] = ContextVar(
+    "ledm_active_sample", default=None
+)
+
+
+def _concatenate_samples(by_sample: Dict[str, ak.Array]) -> ak.Array:
+    """Concatenate the results of all samples, adding a `sample_index` field (the
+    position of the sample in the set). Results that are not records are put
+    in a `value` field.
+    """
+    parts = []
+    for index, data in enumerate(by_sample.values()):
+        data = ak.repartition(data, None)
+        sample_index = np.full(len(data), index)
+        if len(ak.fields(data)) > 0:
+            parts.append(ak.with_field(data, sample_index, "sample_index"))
+        else:
+            parts.append(ak.zip({"value": data, "sample_index": sample_index}, depth_limit=1))
+    return ak.concatenate(parts)
+
+
+class LEDMSampleSet:
+    """The same template bound to several datasets (samples).
+
+    The queries are built once, against the first dataset, and then moved onto
+    each sample's dataset when rendered. All samples are rendered at the same
+    time, at most `max_concurrent` at once.
+
+    ```
+    samples = evt({"zee": ds_zee, "ttbar": ds_ttbar}, max_concurrent=4)
+    jet_pt = samples.jets.pt.as_awkward()
+    jet_pt["zee"]
+    ```
+    """
+
+    __slots__ = ("_layer", "_targets", "_max_concurrent", "__weakref__")
+
+    def __init__(self, layer: Any, targets: Dict[str, _SampleTarget], max_concurrent: int):
+        """Create a sample set.
+
+        Args:
+            layer (Any): The layer, built against the dataset of the first sample
+            targets (Dict[str, _SampleTarget]): Sample name to where its queries go
+            max_concurrent (int): Maximum number of samples rendered at once
+        """
+        assert max_concurrent > 0, "max_concurrent must be positive"
+        self._layer = layer
+        self._targets = targets
+        self._max_concurrent = max_concurrent
+
+    @property
+    def samples(self) -> List[str]:
+        "The names of the samples, in the order of `sample_index`"
+        return list(self._targets)
+
+    @property
+    def layer(self) -> Any:
+        "The layer for the first sample"
+        return self._layer
+
+    def __getattr__(self, name: str) -> "LEDMSampleSet":
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return LEDMSampleSet(getattr(self._layer, name), self._targets, self._max_concurrent)
+
+    async def as_awkward_async(
+        self, concatenate: bool = False
+    ) -> Union[Dict[str, ak.Array], ak.Array]:
+        """Render every sample.
+
+        Args:
+            concatenate (bool): Return a single array, with a `sample_index` field,
+                rather than one array per sample.
+
+        Returns:
+            Union[Dict[str, ak.Array], ak.Array]: Sample name to its data, or all
+                the data concatenated.
+        """
+        semaphore = asyncio.Semaphore(self._max_concurrent)
+
+        async def render(target: _SampleTarget) -> ak.Array:
+            async with semaphore:
+                # Each sample runs in its own task, and so has its own context.
+                _active_sample.set(target)
+                return await self._layer.as_awkward_async()
+
+        results = await asyncio.gather(*(render(t) for t in self._targets.values()))
+        by_sample = dict(zip(self._targets, results))
+        return _concatenate_samples(by_sample) if concatenate else by_sample
+
+    as_awkward = make_sync(as_awkward_async)
@@ -1,57 +1,581 @@
 import ast
-from typing import Callable, Union
+import copy
 import logging
+import time
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Mapping,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
 
+import awkward as ak
 from func_adl import ObjectStream
-from func_adl.util_ast import parse_as_ast
 
 from layered_edm.layer_nested import BaseTemplateEDMLayer
 
 from .base_layer import BaseEDMLayer
+from .layer_samples import LEDMSampleSet, _active_sample, _SampleTarget
+from .util_ast import ExpressionGraph, clone_ast, free_names, parse_remap_lambda
+from .util_cache import ResultCache
 from .util_compat import unparse
+from .util_instrument import (
+    QUERY_BUILT,
+    QUERY_SUBMITTED,
+    RESULT_RECEIVED,
+    emit,
+    result_size,
+)
+from .util_instrument import enabled as instrument_enabled
 
-# TODO: the parse_as_ast should that be exported or put in a separate package?
+
+def _used_names(asts: Iterable[ast.AST]) -> Set[str]:
+    "Return all variable and argument names used anywhere in the `asts`"
+    names = set()
+    for a in asts:
+        for node in ast.walk(a):
+            if isinstance(node, ast.Name):
+                names.add(node.id)
+            elif isinstance(node, ast.arg):
+                names.add(node.arg)
+    return names
+
+
+def _fresh_name(stem: str, used: Set[str]) -> str:
+    "Return a variable name based on `stem` that is not in `used`"
+    name = stem
+    index = 0
+    while name in used:
+        index += 1
+        name = f"{stem}{index}"
+    return name
+
+
+def _fresh_arg_name(stem: str, function_asts: Iterable[ast.Lambda]) -> str:
+    """Return a name that every one of the lambdas can have its argument renamed to
+    without it colliding with any other name in its body.
+    """
+    function_asts = list(function_asts)
+    name = stem
+    index = 0
+    while not all(
+        name == f.args.args[0].arg or name not in _used_names([f.body]) for f in function_asts
+    ):
+        index += 1
+        name = f"{stem}{index}"
+    return name
+
+
+class _rename_arg(ast.NodeTransformer):
+    "Rename all free uses of a variable (so respect any lambda that re-binds it)"
+
+    def __init__(self, old_name: str, new_name: str):
+        self._old = old_name
+        self._new = new_name
+
+    def visit_Name(self, node: ast.Name) -> ast.AST:
+        if node.id == self._old:
+            return ast.copy_location(ast.Name(id=self._new, ctx=node.ctx), node)
+        return node
+
+    def visit_Lambda(self, node: ast.Lambda) -> ast.AST:
+        if any(a.arg == self._old for a in node.args.args):
+            return node
+        return self.generic_visit(node)
+
+
+def _lambda_body_as(function_ast: ast.Lambda, arg_name: str) -> ast.AST:
+    """Return the body of a single argument lambda, with the argument renamed
+    to `arg_name`.
+    """
+    assert len(function_ast.args.args) == 1, "remap lambda must take exactly one argument"
+    old_name = function_ast.args.args[0].arg
+    return _rename_arg(old_name, arg_name).visit(clone_ast(function_ast.body))
+
+
+def _make_lambda(arg_name: str, body: ast.AST) -> ast.Lambda:
+    "Build a single argument lambda"
+    args = ast.arguments(
+        posonlyargs=[],
+        args=[ast.arg(arg=arg_name, annotation=None)],
+        vararg=None,
+        kwonlyargs=[],
+        kw_defaults=[],
+        kwarg=None,
+        defaults=[],
+    )
+    return ast.Lambda(args=args, body=body)
+
+
+def _make_sequence_call(arg_name: str, method: str, function_ast: ast.Lambda) -> ast.Call:
+    "Build `arg_name.method(function_ast)` (e.g. `items.Select(lambda j: j.pt())`)"
+    return ast.Call(
+        func=ast.Attribute(
+            value=ast.Name(id=arg_name, ctx=ast.Load()), attr=method, ctx=ast.Load()
+        ),
+        args=[function_ast],
+        keywords=[],
+    )
+
+
+def _make_dict(items: Dict[str, ast.AST]) -> ast.Dict:
+    "Build a dictionary with string keys"
+    return ast.Dict(
+        keys=[ast.Constant(value=k) for k in items.keys()], values=list(items.values())
+    )
+
+
+# Expressions that can be calculated once and used by several fields of a record
+_hoistable_nodes = (ast.Call, ast.Attribute, ast.Subscript)
+
+
+def _child_fields(node: ast.AST) -> Iterable[Tuple[ast.AST, bool]]:
+    "The child nodes of `node`, and whether each is the function of a call (`e.Jets().Select`)"
+    for f, value in ast.iter_fields(node):
+        is_func = isinstance(node, ast.Call) and f == "func"
+        for child in value if isinstance(value, list) else [value]:
+            if isinstance(child, ast.AST):
+                yield child, is_func
+
+
+def _rebinds(node: ast.AST, arg_name: str) -> bool:
+    "True if `node` is a lambda with an argument called `arg_name`"
+    return isinstance(node, ast.Lambda) and any(a.arg == arg_name for a in node.args.args)
+
+
+def _hoistable(node: ast.AST, arg_name: str, is_func: bool) -> bool:
+    """True if `node` depends only on `arg_name`, so it can be calculated first. A bound
+    method (the function of a call) is not a value that can be passed on.
+    """
+    return not is_func and isinstance(node, _hoistable_nodes) and free_names(node) == {arg_name}
+
+
+def _hoist_candidates(node: ast.AST, arg_name: str, is_func: bool = False) -> Iterable[ast.AST]:
+    """The sub-expressions of `node` that could be calculated before it. Nothing inside
+    a lambda that re-binds `arg_name` refers to it.
+    """
+    if _rebinds(node, arg_name):
+        return
+    if _hoistable(node, arg_name, is_func):
+        yield node
+    for child, child_is_func in _child_fields(node):
+        yield from _hoist_candidates(child, arg_name, child_is_func)
+
+
+def _hoist_shared(
+    arg_name: str, bodies: Dict[str, ast.AST]
+) -> Optional[Tuple[Dict[str, ast.AST], Dict[str, ast.AST]]]:
+    """Find the sub-expressions of `bodies` that depend only on `arg_name` and
+    appear more than once (e.g. `e.MissingET().First()` in both
+    `e.MissingET().First().mpx()` and `e.MissingET().First().mpy()`), so they
+    can be calculated once in an earlier `Select`.
+
+    Args:
+        arg_name (str): The argument of the lambdas the bodies come from
+        bodies (Dict[str, ast.AST]): Field name to lambda body
+
+    Returns:
+        Optional[Tuple[Dict[str, ast.AST], Dict[str, ast.AST]]]: The expressions to
+            calculate first (by name), and the bodies rewritten to use them (as
+            `arg_name.name`). None if nothing is shared.
+    """
+    graph = ExpressionGraph()
+    bodies = {k: graph.intern(b) for k, b in bodies.items()}
+
+    counts: Dict[int, int] = {}
+    for b in bodies.values():
+        for node in _hoist_candidates(b, arg_name):
+            k = graph.key(node)
+            counts[k] = counts.get(k, 0) + 1
+    shared = {k for k, c in counts.items() if c > 1}
+    if len(shared) == 0:
+        return None
+
+    first: Dict[int, Tuple[str, ast.AST]] = {}
+    uses_arg = False
+
+    def contains_shared(node: ast.AST) -> bool:
+        return any(graph.key(n) in shared for n in _hoist_candidates(node, arg_name))
+
+    def rewrite(node: ast.AST, is_func: bool = False) -> ast.AST:
+        nonlocal uses_arg
+        if _rebinds(node, arg_name):
+            return clone_ast(node)
+        if _hoistable(node, arg_name, is_func):
+            k = graph.key(node)
+            if k in shared or not contains_shared(node):
+                if k not in first:
+                    first[k] = (f"h{len(first)}", node)
+                return ast.Attribute(
+                    value=ast.Name(id=arg_name, ctx=ast.Load()), attr=first[k][0], ctx=ast.Load()
+                )
+        if isinstance(node, ast.Name) and node.id == arg_name:
+            uses_arg = True
+        result = copy.copy(node)
+        for f, value in ast.iter_fields(node):
+            child_is_func = isinstance(node, ast.Call) and f == "func"
+            if isinstance(value, list):
+                setattr(
+                    result,
+                    f,
+                    [rewrite(v, child_is_func) if isinstance(v, ast.AST) else v for v in value],
+                )
+            elif isinstance(value, ast.AST):
+                setattr(result, f, rewrite(value, child_is_func))
+        return result
+
+    new_bodies = {k: rewrite(b) for k, b in bodies.items()}
+    if uses_arg:
+        # The argument itself is used - and it can't be passed through the first `Select`.
+        return None
+    return {name: expr for name, expr in first.values()}, new_bodies
+
+
+def _length_stream(ds: ObjectStream) -> ObjectStream:
+    "A query with one (constant) entry for each entry of `ds`"
+    return ds.Select(ast.parse("lambda e: 0", mode="eval").body)  # type: ignore
 
 
 class LEDMServiceX(BaseEDMLayer):
-    def __init__(self, stream: ObjectStream):
+    __slots__ = ("_fuse_queries", "_cache", "_dataset_id", "_graph")
+
+    def __init__(
+        self,
+        stream: ObjectStream,
+        fuse_queries: bool = False,
+        cache: Optional[ResultCache] = None,
+        dataset_id: Optional[str] = None,
+        graph: Optional[ExpressionGraph] = None,
+    ):
+        """Wrap a func_adl `ObjectStream`.
+
+        Args:
+            stream (ObjectStream): The stream (query) this layer represents
+            fuse_queries (bool): If True, when a record (template) is converted
+                to awkward, all the leaf fields are fetched with a single query.
+            cache (ResultCache): If not None, results are looked up in, and saved to,
+                this cache.
+            dataset_id (str): Identity of the dataset used in cache keys. Nothing is
+                cached without it.
+            graph (ExpressionGraph): Where the queries of all the layers built from
+                this one are stored, so they share their common sub-expressions.
+        """
         super().__init__(stream)
+        self._fuse_queries = fuse_queries
+        self._cache = cache
+        self._dataset_id = dataset_id
+        self._graph = graph if graph is not None else ExpressionGraph()
+
+    @property
+    def graph(self) -> ExpressionGraph:
+        "The store of the queries built from this layer"
+        return self._graph
 
     def as_sx(self) -> ObjectStream:
         return self.ds
 
     def as_awkward(self):
+        ds, dataset_id = self._target()
+        return self._value(ds.query_ast, dataset_id, lambda: ds.AsAwkwardArray().value())
+
+    async def as_awkward_async(self) -> ak.Array:
+        ds, dataset_id = self._target()
+        return await self._value_async(
+            ds.query_ast, dataset_id, lambda: ds.AsAwkwardArray().value_async()
+        )
+
+    def array_length(self) -> int:
+        """Length from a query that returns a single (constant) column - which is much
+        cheaper than fetching data. ServiceX only returns data, so it can't run a
+        bare `Count`.
+        """
+        ds, dataset_id = self._target()
+        length_stream = _length_stream(ds)
+        return len(
+            self._value(
+                length_stream.query_ast,
+                dataset_id,
+                lambda: length_stream.AsAwkwardArray().value(),
+            )
+        )
+
+    def _target(self) -> Tuple[ObjectStream, Optional[str]]:
+        """The stream to run, and the dataset identity for the cache. When rendering
+        a sample of a sample set, this is our query moved onto the sample's dataset.
+        """
+        sample = _active_sample.get()
+        if sample is None:
+            return self.ds, self._dataset_id
+        return sample.rebase(self.ds), sample.dataset_id
+
+    def _value(self, query: ast.AST, dataset_id: Optional[str], run: Callable[[], Any]) -> Any:
+        """Run a query, using the cache if we have one.
+
+        Args:
+            query (ast.AST): The query (used to look up results in the cache)
+            dataset_id (Optional[str]): Identity of the dataset for the cache key
+            run (Callable[[], Any]): Executes the query
+
+        Returns:
+            Any: The result of the query
+        """
+        key, result = self._cache_lookup(query, dataset_id)
+        if result is not None:
+            return result
+        start = self._submitted(query)
+        return self._cache_store(key, self._received(query, start, run()))
+
+    async def _value_async(
+        self, query: ast.AST, dataset_id: Optional[str], run: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        "Like `_value`, but `run` returns an awaitable"
+        key, result = self._cache_lookup(query, dataset_id)
+        if result is not None:
+            return result
+        start = self._submitted(query)
+        return self._cache_store(key, self._received(query, start, await run()))
+
+    def _cache_lookup(
+        self, query: ast.AST, dataset_id: Optional[str]
+    ) -> Tuple[Optional[str], Any]:
+        "Return the cache key for a query (if we have a cache) and the cached result (or None)"
         logger = logging.getLogger(__name__)
-        logger.debug(f"Issuing ServiceX Query for {unparse(self.ds.query_ast)}")
-        return self.ds.AsAwkwardArray().value()
+
+        key = self._cache_key(query, dataset_id)
+        if key is not None:
+            assert self._cache is not None
+            result = self._cache.get(key)
+            if result is not None:
+                logger.debug(f"Using cached result for {unparse(query)}")
+                if instrument_enabled():
+                    emit(RESULT_RECEIVED, query=unparse(query), cached=True, **result_size(result))
+                return key, result
+
+        logger.debug(f"Issuing ServiceX Query for {unparse(query)}")
+        return key, None
+
+    def _cache_key(self, query: ast.AST, dataset_id: Optional[str]) -> Optional[str]:
+        """The cache key for a query, or None if we do not have a cache. The dataset
+        object can't identify itself (its `id()` is reused once it is gone), so nothing
+        is cached for a dataset without a `dataset_id`.
+        """
+        if self._cache is None or dataset_id is None:
+            return None
+        return self._cache.key(query, dataset_id)
+
+    def _submitted(self, query: ast.AST) -> float:
+        "Report a query is about to run, and return the time"
+        if instrument_enabled():
+            emit(QUERY_SUBMITTED, query=unparse(query))
+        return time.perf_counter()
+
+    def _received(self, query: ast.AST, start: float, result: Any) -> Any:
+        "Report the result of a query has arrived"
+        if instrument_enabled():
+            emit(
+                RESULT_RECEIVED,
+                query=unparse(query),
+                duration=time.perf_counter() - start,
+                **result_size(result),
+            )
+        return result
+
+    def _cache_store(self, key: Optional[str], result: Any) -> Any:
+        "Store a result in the cache (if it has a key)"
+        if key is not None:
+            assert self._cache is not None
+            self._cache.put(key, result)
+        return result
+
+    def _planned_query(self, length: bool) -> Tuple[ast.AST, bool]:
+        "The query `as_awkward` (or `array_length`) runs, and whether its result is cached"
+        ds, dataset_id = self._target()
+        query = _length_stream(ds).query_ast if length else ds.query_ast
+        key = self._cache_key(query, dataset_id)
+        return query, key is not None and key in self._cache  # type: ignore
+
+    def explain_operation(self, length: bool = False) -> str:
+        "The query that will run"
+        query, cached = self._planned_query(length)
+        return unparse(query) + ("  [cached]" if cached else "")
+
+    def explain_summary(self, operations: List[Tuple[BaseEDMLayer, bool]]) -> List[str]:
+        "The number of ServiceX transforms, and the sub-queries they share"
+        planned: Dict[str, Tuple[ast.AST, bool]] = {}
+        for layer, length in operations:
+            if isinstance(layer, LEDMServiceX):
+                query, cached = layer._planned_query(length)
+                planned.setdefault(unparse(query), (query, cached))
+
+        n_cached = sum(1 for _, cached in planned.values() if cached)
+        lines = [f"ServiceX transforms: {len(planned) - n_cached} to run, {n_cached} cached"]
+        prefixes = self._graph.common_prefixes(
+            [query for query, cached in planned.values() if not cached]
+        )
+        if len(prefixes) > 0:
+            lines.append("Shared sub-queries:")
+            lines.extend(f"  {unparse(p)}" for p in prefixes)
+        return lines
 
     def wrap(self, s: ObjectStream):
-        return LEDMServiceX(s)
+        query = self._graph.intern(s.query_ast)
+        if query is not s.query_ast:
+            s = s.clone_with_new_ast(query, s.item_type)
+        if instrument_enabled():
+            emit(QUERY_BUILT, query=unparse(query))
+        return LEDMServiceX(
+            s,
+            fuse_queries=self._fuse_queries,
+            cache=self._cache,
+            dataset_id=self._dataset_id,
+            graph=self._graph,
+        )
 
     def iterable_map(self, callback: Callable) -> BaseEDMLayer:
         "Simulate call on make loop"
-        function_ast = parse_as_ast(callback, "remap")
-        my_func = ast.parse("lambda items: items.Select(function_ast)").body[0].value  # type: ignore
-        my_func.body.args[0] = function_ast
-        return self.ds.Select(my_func)
+        function_ast = clone_ast(parse_remap_lambda(callback))
+        return self.ds.Select(
+            _make_lambda("items", _make_sequence_call("items", "Select", function_ast))
+        )
 
     def single_item_map(self, callback: Callable) -> ObjectStream:
         "Call on a single item"
+        return self.ds.Select(clone_ast(parse_remap_lambda(callback)))
+
+    def where(self, callback: Callable) -> ObjectStream:
+        "Filter the stream"
+        return self.ds.Where(clone_ast(parse_remap_lambda(callback, "filter")))
+
+    def iterable_where(self, callback: Callable) -> ObjectStream:
+        "Filter the items in each sequence of the stream"
+        function_ast = clone_ast(parse_remap_lambda(callback, "filter"))
+        return self.ds.Select(
+            _make_lambda("items", _make_sequence_call("items", "Where", function_ast))
+        )
+
+    def single_item_record_map(self, callbacks: Dict[str, Callable]) -> Optional[ObjectStream]:
+        """Fuse all the `callbacks` into a single `Select` that returns a dictionary:
+        `Select(lambda e: {"f1": ..., "f2": ...})`. Sub-expressions used by more than
+        one field are calculated once, in a `Select` before that one.
+
+        Only done if this layer was created with `fuse_queries`.
+        """
+        if not self._fuse_queries:
+            return None
 
-        # We can't pick it out, necessarily, so help the ast parser find it.
-        function_ast = parse_as_ast(callback, "remap")
+        function_asts = {k: parse_remap_lambda(cb) for k, cb in callbacks.items()}
+        arg_name = _fresh_arg_name("e", function_asts.values())
+        bodies = {k: _lambda_body_as(f, arg_name) for k, f in function_asts.items()}
 
-        return self.ds.Select(function_ast)
+        # Anything used by more than one field is calculated once, in an earlier `Select`
+        stream = self.ds
+        hoisted = _hoist_shared(arg_name, bodies)
+        if hoisted is not None:
+            first, bodies = hoisted
+            stream = stream.Select(_make_lambda(arg_name, _make_dict(first)))
+        return stream.Select(_make_lambda(arg_name, _make_dict(bodies)))
+
+    def iterable_record_map(self, callbacks: Dict[str, Callable]) -> Optional[ObjectStream]:
+        """Fuse all the `callbacks` into a single `Select` that returns a dictionary
+        of sequences: `Select(lambda items: {"f1": items.Select(...), ...})`. Sub-expressions
+        used by more than one field are calculated once for each item, before that.
+
+        Only done if this layer was created with `fuse_queries`.
+        """
+        if not self._fuse_queries:
+            return None
+
+        function_asts = {k: clone_ast(parse_remap_lambda(cb)) for k, cb in callbacks.items()}
+        arg_name = _fresh_name("items", _used_names(function_asts.values()))
+
+        # Anything used by more than one field is calculated once per item, in an
+        # earlier `Select`
+        stream = self.ds
+        item_name = _fresh_arg_name("x", function_asts.values())
+        hoisted = _hoist_shared(
+            item_name, {k: _lambda_body_as(f, item_name) for k, f in function_asts.items()}
+        )
+        if hoisted is not None:
+            first, bodies = hoisted
+            first_lambda = _make_lambda(item_name, _make_dict(first))
+            stream = stream.Select(
+                _make_lambda(arg_name, _make_sequence_call(arg_name, "Select", first_lambda))
+            )
+            function_asts = {k: _make_lambda(item_name, b) for k, b in bodies.items()}
+
+        body = _make_dict(
+            {k: _make_sequence_call(arg_name, "Select", f) for k, f in function_asts.items()}
+        )
+        return stream.Select(_make_lambda(arg_name, body))
 
 
 def edm_sx(class_to_wrap: type) -> Callable:
     "Creates a class edm based on an servicex dataset."
 
-    def make_it(arr: Union[ObjectStream, LEDMServiceX]):
+    def make_it(
+        arr: Union[ObjectStream, LEDMServiceX, Mapping[str, ObjectStream]],
+        fuse_queries: bool = False,
+        cache: Optional[ResultCache] = None,
+        dataset_id: Optional[Union[str, Mapping[str, str]]] = None,
+        max_concurrent: int = 8,
+    ):
+        """Bind the template to a dataset, or to several datasets (samples).
+
+        The options are only used if `arr` is an `ObjectStream` or a mapping.
+
+        Args:
+            arr (ObjectStream|LEDMServiceX|Mapping[str, ObjectStream]): The dataset or layer
+                to wrap, or sample name to dataset (see `LEDMSampleSet`).
+            fuse_queries (bool): Fetch all the leaf fields of a record with a single
+                query when it is turned into an awkward array.
+            cache (ResultCache): Cache to look up and store query results
+            dataset_id (str|Mapping[str, str]): Identity of the dataset for the cache keys
+                (sample name to identity for several datasets). Required with `cache`.
+            max_concurrent (int): Maximum number of samples rendered at once.
+        """
+        if (
+            cache is not None
+            and not isinstance(arr, LEDMServiceX)
+            and (
+                dataset_id is None
+                or (isinstance(arr, Mapping) and any(name not in dataset_id for name in arr))
+            )
+        ):
+            raise ValueError(
+                "A `cache` needs a `dataset_id` to identify each dataset in the cache keys"
+            )
+
+        if isinstance(arr, Mapping):
+            assert len(arr) > 0, "Need at least one sample"
+            assert dataset_id is None or isinstance(dataset_id, Mapping)
+            first = next(iter(arr.values()))
+            targets = {
+                name: _SampleTarget(
+                    first.query_ast, ds, None if dataset_id is None else dataset_id.get(name)
+                )
+                for name, ds in arr.items()
+            }
+            layer = BaseTemplateEDMLayer(
+                LEDMServiceX(first, fuse_queries=fuse_queries, cache=cache), class_to_wrap
+            )
+            return LEDMSampleSet(layer, targets, max_concurrent)
+
+        assert dataset_id is None or isinstance(dataset_id, str)
         to_wrap = arr
         if isinstance(to_wrap, ObjectStream):
-            to_wrap = LEDMServiceX(to_wrap)
+            to_wrap = LEDMServiceX(
+                to_wrap, fuse_queries=fuse_queries, cache=cache, dataset_id=dataset_id
+            )
 
         return BaseTemplateEDMLayer(to_wrap, class_to_wrap)  # type: ignore
 
+    # The decorated class, for `edm_from_parquet`
+    make_it.template = class_to_wrap  # type: ignore
     return make_it
@@ -0,0 +1,99 @@
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Union
+
+import awkward as ak
+import uproot
+
+from .layer_awkward import edm_awk
+from .util_columns import required_columns
+
+FileSpec = Union[str, Path, List[Union[str, Path]]]
+
+
+def _open_lazy(
+    files: FileSpec,
+    tree_name: Optional[str],
+    filter_name: Optional[Any],
+    step_size: Union[int, str],
+) -> ak.Array:
+    """Open the TTree in all the files as a single lazy array. No branch is
+    read until its data is actually needed.
+
+    Args:
+        files (FileSpec): A file or list of files. If `tree_name` is None, each must be
+            of the form `file.root:tree`.
+        tree_name (Optional[str]): Name of the TTree in each file
+        filter_name (Optional[Any]): Only expose these branches (see `uproot.lazy`)
+        step_size (int|str): Size of the partitions read at once (see `uproot.lazy`)
+
+    Returns:
+        ak.Array: Lazy array with one entry per TTree entry
+    """
+    file_list = [files] if isinstance(files, (str, Path)) else files
+    spec: Union[Dict[str, str], List[str]] = (
+        {str(f): tree_name for f in file_list}
+        if tree_name is not None
+        else [str(f) for f in file_list]
+    )
+
+    options: Dict[str, Any] = {"step_size": step_size}
+    if filter_name is not None:
+        options["filter_name"] = filter_name
+    return uproot.lazy(spec, **options)
+
+
+def edm_uproot(class_to_wrap: type) -> Callable:
+    """Creates a class edm based on TTrees in ROOT files, read with uproot.
+
+    The files are opened lazily: a branch is only read when a template property
+    that references it is turned into data.
+
+    ```
+    @ledm.edm_uproot
+    class evt:
+        @property
+        @ledm.remap(lambda e: e.met)
+        def met(self) -> float:
+            ...
+
+    events = evt(["f1.root", "f2.root"], tree_name="mini", entry_stop=1000)
+    ```
+    """
+    make_awk = edm_awk(class_to_wrap)
+
+    def make_it(
+        files: FileSpec,
+        tree_name: Optional[str] = None,
+        entry_start: Optional[int] = None,
+        entry_stop: Optional[int] = None,
+        filter_name: Optional[Any] = None,
+        step_size: Union[int, str] = "100 MB",
+        prune_branches: bool = False,
+        func_adl_style: bool = False,
+    ):
+        """Bind the template to a set of ROOT files.
+
+        Args:
+            files (FileSpec): A file or list of files. If `tree_name` is None, each
+                must be of the form `file.root:tree`.
+            tree_name (Optional[str]): Name of the TTree in each file.
+            entry_start (Optional[int]): First entry (across all files) to use.
+            entry_stop (Optional[int]): Entry (across all files) to stop before.
+            filter_name (Optional[Any]): Only expose these branches (see `uproot.lazy`).
+            step_size (int|str): Size of the partitions read at once (see `uproot.lazy`).
+            prune_branches (bool): Only expose the branches the template references
+                (see `required_columns`). Ignored if `filter_name` is given.
+            func_adl_style (bool): The template was written for ServiceX - translate its
+                func_adl remaps into array operations (see `edm_awk`).
+        """
+        if filter_name is None and prune_branches:
+            filter_name = sorted({c.split(".")[0] for c in required_columns(class_to_wrap)})
+
+        arr = _open_lazy(files, tree_name, filter_name, step_size)
+        if entry_start is not None or entry_stop is not None:
+            arr = arr[entry_start:entry_stop]
+        return make_awk(arr, func_adl_style=func_adl_style)
+
+    # The decorated class, for `edm_from_parquet`
+    make_it.template = class_to_wrap  # type: ignore
+    return make_it
@@ -0,0 +1,356 @@
+import ast
+import copy
+import weakref
+from types import CodeType
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Hashable,
+    Iterable,
+    List,
+    MutableMapping,
+    Optional,
+    Set,
+    Tuple,
+)
+
+from func_adl.util_ast import parse_as_ast
+
+from .base_layer import remap
+from .util_compat import unparse
+
+# Parsed remap lambdas, by function and then by the values it captures.
+_remap_ast_cache: MutableMapping[
+    Callable, Dict[Hashable, ast.Lambda]
+] = weakref.WeakKeyDictionary()
+
+
+def clone_ast(a: Any) -> Any:
+    """Copy an ast, visiting only the ast fields.
+
+    Unlike `copy.deepcopy` this does not copy any extra attributes attached
+    to the nodes (func_adl attaches the dataset and its executor to the root
+    `EventDataset` node), so it is cheap and safe.
+
+    Args:
+        a (Any): The ast (or list of ast's, or a constant) to copy
+
+    Returns:
+        Any: The copy
+    """
+    if isinstance(a, ast.AST):
+        return type(a)(**{f: clone_ast(getattr(a, f, None)) for f in a._fields})
+    if isinstance(a, list):
+        return [clone_ast(i) for i in a]
+    return a
+
+
+class _canonical_names(ast.NodeTransformer):
+    """Rename every lambda argument to a name that depends only on the
+    order in which it is declared. Respects shadowing by nested lambdas.
+    """
+
+    def __init__(self):
+        self._scopes: List[Dict[str, str]] = []
+        self._count = 0
+
+    def visit_Lambda(self, node: ast.Lambda) -> ast.AST:
+        mapping = {}
+        for a in node.args.args:
+            mapping[a.arg] = f"a{self._count}"
+            self._count += 1
+            a.arg = mapping[a.arg]
+
+        self._scopes.append(mapping)
+        node.body = self.visit(node.body)
+        self._scopes.pop()
+        return node
+
+    def visit_Name(self, node: ast.Name) -> ast.AST:
+        for scope in reversed(self._scopes):
+            if node.id in scope:
+                node.id = scope[node.id]
+                break
+        return node
+
+
+def canonical_ast(a: ast.AST) -> ast.AST:
+    """Return a copy of the query `a` with all lambda arguments renamed
+    to canonical names. Two queries that differ only by the names of their
+    lambda arguments (`lambda j: j.pt()` vs `lambda jet: jet.pt()`) will
+    have the same canonical ast.
+
+    Args:
+        a (ast.AST): The query to normalize
+
+    Returns:
+        ast.AST: Normalized copy of the query
+    """
+    return _canonical_names().visit(clone_ast(a))
+
+
+def canonical_unparse(a: ast.AST) -> str:
+    """Return the text of the normalized query `a`. See `canonical_ast`.
+
+    Args:
+        a (ast.AST): The query to render
+
+    Returns:
+        str: Text that is identical for identical queries
+    """
+    return unparse(canonical_ast(a))
+
+
+def free_names(a: ast.AST) -> Set[str]:
+    """Return the names used in `a` that are not bound by a lambda inside `a`.
+
+    Args:
+        a (ast.AST): The expression
+
+    Returns:
+        Set[str]: The free names
+    """
+    if isinstance(a, ast.Name):
+        return {a.id}
+    if isinstance(a, ast.Lambda):
+        return free_names(a.body) - {arg.arg for arg in a.args.args}
+    result: Set[str] = set()
+    for child in ast.iter_child_nodes(a):
+        result |= free_names(child)
+    return result
+
+
+def _same_value(a: Any, b: Any) -> bool:
+    if isinstance(a, list) and isinstance(b, list):
+        return len(a) == len(b) and all(x is y for x, y in zip(a, b))
+    return a is b
+
+
+class ExpressionGraph:
+    """A hash-consed store of query ast's.
+
+    Sub-expressions that are the same are stored once: `intern` rebuilds a query
+    from the shared nodes, so identical sub-expressions of different queries
+    are the same object. Lambdas that differ only by the names of their
+    arguments (`lambda j: j.pt()` and `lambda jet: jet.pt()`) are the same.
+
+    ```
+    graph = ExpressionGraph()
+    q1 = graph.intern(jets_pt_query)
+    q2 = graph.intern(jets_eta_query)
+    graph.common_prefixes([q1, q2])  # The `e.Jets()` query they both use
+    ```
+    """
+
+    def __init__(self):
+        # Structure (node type and the ids of its children) to id
+        self._ids: Dict[Hashable, int] = {}
+
+        # id to the shared node with that structure
+        self._nodes: Dict[int, ast.AST] = {}
+
+        # `id()` of each shared node to its id
+        self._node_ids: Dict[int, int] = {}
+
+    def __len__(self) -> int:
+        "Number of distinct sub-expressions stored"
+        return len(self._nodes)
+
+    def key(self, a: ast.AST) -> int:
+        """Return an id for the structure of `a`. Two sub-expressions have the
+        same id if (and only if) they are the same.
+
+        Args:
+            a (ast.AST): The expression
+
+        Returns:
+            int: The id
+        """
+        return self._key(a, ())
+
+    def intern(self, a: ast.AST) -> ast.AST:
+        """Return the shared version of `a`. Nodes are only copied if one of
+        their children has been replaced by a shared node - `a` is never modified.
+
+        Args:
+            a (ast.AST): The expression to store
+
+        Returns:
+            ast.AST: The expression, built from shared nodes
+        """
+        if isinstance(a, list):
+            return [self.intern(i) for i in a]  # type: ignore
+        if not isinstance(a, ast.AST):
+            return a
+
+        known = self._node_ids.get(id(a))
+        if known is not None and self._nodes[known] is a:
+            return a
+
+        node = a
+        # The root of a func_adl query carries the dataset - so it is never copied.
+        fields = (
+            {}
+            if hasattr(a, "_eds_object")
+            else {f: self.intern(getattr(a, f, None)) for f in a._fields}
+        )
+        if not all(_same_value(v, getattr(a, f, None)) for f, v in fields.items()):
+            node = copy.copy(a)
+            for f, v in fields.items():
+                setattr(node, f, v)
+
+        k = self._key(node, ())
+        shared = self._nodes.setdefault(k, node)
+        self._node_ids[id(shared)] = k
+        return shared
+
+    def common_prefixes(self, queries: Iterable[ast.AST]) -> List[ast.AST]:
+        """Find the sub-queries that more than one of `queries` is built on. A
+        query is built on the first argument of each of its calls
+        (`Select(Select(EventDataset(), f1), f2)` is built on `Select(EventDataset(), f1)`).
+        Only the longest shared sub-queries are returned, and a dataset by itself
+        is not a prefix.
+
+        Args:
+            queries (Iterable[ast.AST]): The queries
+
+        Returns:
+            List[ast.AST]: The shared sub-queries
+        """
+        chains = []
+        counts: Dict[int, int] = {}
+        for q in queries:
+            chain = []
+            node = self.intern(q)
+            while isinstance(node, ast.Call) and len(node.args) > 0:
+                chain.append(node)
+                node = node.args[0]
+            for k in {self.key(n) for n in chain}:
+                counts[k] = counts.get(k, 0) + 1
+            chains.append(chain)
+
+        result: Dict[int, ast.AST] = {}
+        for chain in chains:
+            for node in chain:
+                k = self.key(node)
+                if counts[k] > 1:
+                    result.setdefault(k, node)
+                    break
+        return list(result.values())
+
+    def _key(self, a: Any, bound: Tuple[str, ...]) -> int:
+        """Id of the structure of `a`. Names in `bound` are arguments of lambdas
+        that contain `a` - they are replaced by their distance to their lambda, so
+        the names of lambda arguments do not matter.
+        """
+        if len(bound) == 0 and isinstance(a, ast.AST):
+            known = self._node_ids.get(id(a))
+            if known is not None and self._nodes[known] is a:
+                return known
+
+        structure: Hashable
+        if isinstance(a, ast.Name) and a.id in bound:
+            structure = ("arg", bound[::-1].index(a.id))
+        elif isinstance(a, ast.Lambda):
+            args = tuple(arg.arg for arg in a.args.args)
+            structure = ("Lambda", len(args), self._key(a.body, bound + args))
+        elif isinstance(a, ast.AST):
+            # func_adl attaches the dataset to the root of the query
+            eds = getattr(a, "_eds_object", None)
+            structure = (type(a).__name__, None if eds is None else id(eds)) + tuple(
+                self._key(getattr(a, f, None), bound) for f in a._fields
+            )
+        elif isinstance(a, list):
+            structure = ("list",) + tuple(self._key(i, bound) for i in a)
+        else:
+            structure = ("value", type(a).__name__, a)
+        return self._ids.setdefault(structure, len(self._ids))
+
+
+def _global_names(code: CodeType) -> Set[str]:
+    "The names `code`, and the functions (nested lambdas) defined in it, may look up as globals"
+    names = set(code.co_names)
+    for c in code.co_consts:
+        if isinstance(c, CodeType):
+            names |= _global_names(c)
+    return names
+
+
+def _captured_values_key(callback: Callable) -> Optional[Tuple]:
+    """Return a hashable key made from the values `callback` captures (closure
+    cells and referenced globals). func_adl bakes these values into the parsed
+    lambda, so a change in any of them requires a new parse.
+
+    Returns None if any of the values can't be hashed.
+    """
+    code = getattr(callback, "__code__", None)
+    if code is None:
+        return None
+
+    cells = getattr(callback, "__closure__", None) or ()
+    f_globals = getattr(callback, "__globals__", {})
+    try:
+        key = (
+            tuple(c.cell_contents for c in cells),
+            tuple((n, f_globals[n]) for n in sorted(_global_names(code)) if n in f_globals),
+        )
+        hash(key)
+    except (TypeError, ValueError):
+        # Unhashable captured value, or a cell that is not filled yet.
+        return None
+    return key
+
+
+def parse_remap_lambda(callback: Callable, caller_name: str = "remap") -> ast.Lambda:
+    """Return the ast for a `remap` (or `filter`) lambda.
+
+    Parsing requires inspecting the source code, so the result is cached
+    for each function and set of captured values.
+
+    Notes:
+        * The returned ast is shared - do not modify it (see `clone_ast`).
+
+    Args:
+        callback (Callable): The lambda passed to `remap`
+        caller_name (str): Name of the decorator the lambda was passed to. Used
+            to find the lambda in the source code.
+
+    Returns:
+        ast.Lambda: The parsed lambda
+    """
+    key = _captured_values_key(callback)
+    if key is None:
+        return parse_as_ast(callback, caller_name)
+
+    try:
+        by_captures = _remap_ast_cache.get(callback)
+    except TypeError:
+        # Not something we can hold a weak reference to
+        return parse_as_ast(callback, caller_name)
+
+    if by_captures is None:
+        by_captures = {}
+        _remap_ast_cache[callback] = by_captures
+
+    function_ast = by_captures.get((caller_name, key))
+    if function_ast is None:
+        function_ast = parse_as_ast(callback, caller_name)
+        by_captures[(caller_name, key)] = function_ast
+    return function_ast
+
+
+def parse_remap(callback: Callable, caller_name: str = "remap") -> ast.Lambda:
+    """Return the ast for a `remap` (or `filter`) lambda, like `parse_remap_lambda`,
+    including the default `remap()` identity (which is not in the user's source).
+
+    Args:
+        callback (Callable): The lambda passed to `remap`
+        caller_name (str): Name of the decorator the lambda was passed to
+
+    Returns:
+        ast.Lambda: The parsed lambda
+    """
+    if callback is remap.__defaults__[0]:  # type: ignore
+        return ast.parse("lambda a: a", mode="eval").body  # type: ignore
+    return parse_remap_lambda(callback, caller_name)
@@ -0,0 +1,173 @@
+import ast
+import hashlib
+import json
+import logging
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional, Union
+
+import awkward as ak
+import numpy as np
+
+from .util_ast import canonical_unparse
+
+
+class ResultCache:
+    """Content addressed cache of query results.
+
+    Results are keyed by the normalized text of the query and the identity of
+    the dataset the query runs against. There are two tiers:
+
+    * An in-memory LRU, limited by the total `nbytes` of the arrays it holds.
+    * An optional on-disk store (awkward buffers in a `npz` file), limited by
+      the total size of the files. Least recently used files are removed first.
+
+    ```
+    cache = ledm.ResultCache(cache_dir="~/.ledm_cache")
+    events = evt(ds, cache=cache, dataset_id="mc16.zee")
+    ```
+    """
+
+    def __init__(
+        self,
+        max_memory_bytes: int = 1024**3,
+        cache_dir: Optional[Union[str, Path]] = None,
+        max_disk_bytes: int = 20 * 1024**3,
+    ):
+        """Create a new cache.
+
+        Args:
+            max_memory_bytes (int): Maximum size of the arrays held in memory.
+            cache_dir (str|Path): Directory for the on-disk tier. None means memory only.
+            max_disk_bytes (int): Maximum size of the on-disk tier.
+        """
+        self._max_memory_bytes = max_memory_bytes
+        self._max_disk_bytes = max_disk_bytes
+        self._memory: "OrderedDict[str, ak.Array]" = OrderedDict()
+        self._memory_sizes: Dict[str, int] = {}
+
+        self._cache_dir = None if cache_dir is None else Path(cache_dir).expanduser()
+        if self._cache_dir is not None:
+            self._cache_dir.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def key(query: ast.AST, dataset_id: str) -> str:
+        """Generate the cache key for a query.
+
+        Args:
+            query (ast.AST): The query
+            dataset_id (str): Identity of the dataset the query runs on
+
+        Returns:
+            str: The key
+        """
+        text = f"{dataset_id}\n{canonical_unparse(query)}"
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    @property
+    def memory_bytes(self) -> int:
+        "Total size of the arrays held in memory"
+        return sum(self._memory_sizes.values())
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._memory or (
+            self._cache_dir is not None and self._meta_path(key).exists()
+        )
+
+    def get(self, key: str) -> Optional[ak.Array]:
+        """Look up a result.
+
+        Args:
+            key (str): The key (see `key`)
+
+        Returns:
+            Optional[ak.Array]: The result, or None if it is not in the cache.
+        """
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return self._memory[key]
+
+        if self._cache_dir is None or not self._meta_path(key).exists():
+            return None
+
+        data = self._load(key)
+        self._put_memory(key, data)
+        return data
+
+    def put(self, key: str, data: ak.Array):
+        """Store a result in the cache.
+
+        Args:
+            key (str): The key (see `key`)
+            data (ak.Array): The result to store.
+        """
+        self._put_memory(key, data)
+        if self._cache_dir is not None and isinstance(data, ak.Array):
+            self._save(key, data)
+            self._evict_disk()
+
+    def invalidate(self, key: Optional[str] = None):
+        """Remove an entry from the cache, in memory and on disk.
+
+        Args:
+            key (Optional[str]): The key to remove. If None, the whole cache is cleared.
+        """
+        keys = list(self._memory.keys()) if key is None else [key]
+        for k in keys:
+            self._memory.pop(k, None)
+            self._memory_sizes.pop(k, None)
+
+        if self._cache_dir is not None:
+            if key is None:
+                files = list(self._cache_dir.glob("*.npz")) + list(self._cache_dir.glob("*.json"))
+            else:
+                files = [self._data_path(key), self._meta_path(key)]
+            for f in files:
+                if f.exists():
+                    f.unlink()
+
+    def _put_memory(self, key: str, data: ak.Array):
+        self._memory[key] = data
+        self._memory.move_to_end(key)
+        self._memory_sizes[key] = data.nbytes if isinstance(data, ak.Array) else 0
+
+        while self.memory_bytes > self._max_memory_bytes and len(self._memory) > 1:
+            old_key, _ = self._memory.popitem(last=False)
+            del self._memory_sizes[old_key]
+
+    def _data_path(self, key: str) -> Path:
+        assert self._cache_dir is not None
+        return self._cache_dir / f"{key}.npz"
+
+    def _meta_path(self, key: str) -> Path:
+        assert self._cache_dir is not None
+        return self._cache_dir / f"{key}.json"
+
+    def _save(self, key: str, data: ak.Array):
+        form, length, container = ak.to_buffers(ak.repartition(data, None))
+        # Write the data first - a file is only valid once the metadata is there.
+        with self._data_path(key).open("wb") as f:
+            np.savez(f, **container)
+        self._meta_path(key).write_text(json.dumps({"form": form.tojson(), "length": length}))
+
+    def _load(self, key: str) -> ak.Array:
+        logging.getLogger(__name__).debug(f"Loading cached result {key} from disk")
+        meta = json.loads(self._meta_path(key).read_text())
+        data_path = self._data_path(key)
+        data_path.touch()
+        with np.load(data_path) as container:
+            return ak.from_buffers(
+                ak.forms.Form.fromjson(meta["form"]), meta["length"], dict(container)
+            )
+
+    def _evict_disk(self):
+        assert self._cache_dir is not None
+        files = sorted(self._cache_dir.glob("*.npz"), key=lambda p: p.stat().st_mtime)
+        total = sum(f.stat().st_size for f in files)
+        while total > self._max_disk_bytes and len(files) > 1:
+            f = files.pop(0)
+            total -= f.stat().st_size
+            meta = f.with_suffix(".json")
+            if meta.exists():
+                meta.unlink()
+            f.unlink()
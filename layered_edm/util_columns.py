@@ -0,0 +1,219 @@
+import ast
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from .layer_nested import template_filters, template_table
+from .util_ast import parse_remap
+
+# A column is a path of field names from the source (e.g. `("jets", "pt")`)
+ColumnPath = Tuple[str, ...]
+
+# Sequence operators that take a lambda, and what they return:
+# "select" - the result of the lambda, "same" - the sequence itself, None - something new
+_lambda_operators: Dict[str, Optional[str]] = {
+    "Select": "select",
+    "Where": "same",
+    "OrderBy": "same",
+    "OrderByDescending": "same",
+    "SelectMany": "select",
+    "Any": None,
+    "All": None,
+}
+
+# Sequence operators that use the sequence, and what they return
+_sequence_operators: Dict[str, Optional[str]] = {
+    "First": "same",
+    "Last": "same",
+    "ElementAt": "same",
+    "Count": None,
+    "Sum": None,
+    "Max": None,
+    "Min": None,
+}
+
+
+class _column_finder:
+    """Find the source columns an expression uses.
+
+    `evaluate` returns the column path the expression is equivalent to (if it is
+    a simple chain of field accesses from a lambda argument), and records every
+    other column path that is used along the way.
+    """
+
+    def __init__(self, columns: Set[ColumnPath]):
+        self._columns = columns
+
+    def use(self, path: Optional[ColumnPath]):
+        "Record that a column is needed"
+        if path is not None and len(path) > 0:
+            self._columns.add(path)
+
+    def evaluate_lambda(
+        self,
+        function_ast: ast.Lambda,
+        arg_paths: List[Optional[ColumnPath]],
+        env: Optional[Dict[str, Optional[ColumnPath]]] = None,
+    ) -> Optional[ColumnPath]:
+        "Evaluate a lambda with its arguments bound to the given columns"
+        inner_env = dict(env) if env is not None else {}
+        inner_env.update({a.arg: p for a, p in zip(function_ast.args.args, arg_paths)})
+        return self.evaluate(function_ast.body, inner_env)
+
+    def evaluate(
+        self, node: ast.AST, env: Dict[str, Optional[ColumnPath]]
+    ) -> Optional[ColumnPath]:
+        if isinstance(node, ast.Name):
+            return env.get(node.id, None)
+
+        if isinstance(node, ast.Attribute):
+            p = self.evaluate(node.value, env)
+            return None if p is None else p + (node.attr,)
+
+        if isinstance(node, ast.Subscript):
+            p = self.evaluate(node.value, env)
+            index = node.slice.value if isinstance(node.slice, ast.Index) else node.slice  # type: ignore
+            if isinstance(index, ast.Constant) and isinstance(index.value, str):
+                return None if p is None else p + (index.value,)
+            self.use(self.evaluate(index, env))
+            return p
+
+        if isinstance(node, ast.Lambda):
+            # A lambda we do not know how it is called - its arguments are not columns
+            self.use(self.evaluate_lambda(node, [None] * len(node.args.args), env))
+            return None
+
+        if isinstance(node, ast.Call):
+            return self._evaluate_call(node, env)
+
+        # Anything else uses all the columns it refers to, and is not a column itself.
+        for child in ast.iter_child_nodes(node):
+            self.use(self.evaluate(child, env))
+        return None
+
+    def _evaluate_call(
+        self, node: ast.Call, env: Dict[str, Optional[ColumnPath]]
+    ) -> Optional[ColumnPath]:
+        if not isinstance(node.func, ast.Attribute):
+            # A function call, like `abs(e.x)`
+            self.use(self.evaluate(node.func, env))
+            for a in node.args:
+                self.use(self.evaluate(a, env))
+            return None
+
+        name = node.func.attr
+        receiver = self.evaluate(node.func.value, env)
+        lambdas = [a for a in node.args if isinstance(a, ast.Lambda)]
+
+        if name in _lambda_operators and len(lambdas) > 0:
+            results = [self.evaluate_lambda(lam, [receiver], env) for lam in lambdas]
+            kind = _lambda_operators[name]
+            if kind == "select" and results[0] is not None:
+                return results[0]
+            if kind == "same":
+                for r in results:
+                    self.use(r)
+                return receiver
+            for r in results:
+                self.use(r)
+            self.use(receiver)
+            return None
+
+        if name in _sequence_operators:
+            for a in node.args:
+                self.use(self.evaluate(a, env))
+            if _sequence_operators[name] == "same":
+                return receiver
+            self.use(receiver)
+            return None
+
+        # Method call that is really a field access (`e.Jets()`, `j.pt()`)
+        for a in node.args:
+            self.use(self.evaluate(a, env))
+        return None if receiver is None else receiver + (name,)
+
+
+def _group_attributes(
+    attributes: Optional[Iterable[str]],
+) -> Optional[Dict[str, Optional[List[str]]]]:
+    """Turn `["jets.pt", "jets.eta", "met"]` into `{"jets": ["pt", "eta"], "met": None}`.
+    None means everything.
+    """
+    if attributes is None:
+        return None
+    result: Dict[str, Optional[List[str]]] = {}
+    for a in attributes:
+        first, _, rest = a.partition(".")
+        if rest == "" or (first in result and result[first] is None):
+            result[first] = None
+        else:
+            sub = result.setdefault(first, [])
+            assert sub is not None
+            sub.append(rest)
+    return result
+
+
+def _template_columns(
+    template: type,
+    prefix: ColumnPath,
+    attributes: Optional[Iterable[str]],
+    finder: _column_finder,
+    expanding: Tuple[type, ...] = (),
+):
+    "Find the columns used by the attributes of `template`, applied to `prefix`"
+    if attributes is None and template in expanding:
+        # A recursive template - everything under here is needed.
+        finder.use(prefix)
+        return
+
+    for f in template_filters(template):
+        finder.use(finder.evaluate_lambda(parse_remap(f, "filter"), [prefix]))
+
+    table = template_table(template)
+    grouped = _group_attributes(attributes)
+    names = [n for n in table if not n.startswith("_")] if grouped is None else list(grouped)
+
+    for name in names:
+        attr = table.get(name)
+        if attr is None or attr.remap_func is None:
+            # Falls through to the object we wrap
+            finder.use(prefix + (name,))
+            continue
+
+        path = finder.evaluate_lambda(parse_remap(attr.remap_func), [prefix])
+        if attr.is_terminal or path is None:
+            finder.use(path)
+        else:
+            assert attr.element_type is not None
+            _template_columns(
+                attr.element_type,
+                path,
+                None if grouped is None else grouped[name],
+                finder,
+                expanding + (template,),
+            )
+
+
+def required_columns(template: type, attributes: Optional[Iterable[str]] = None) -> Set[str]:
+    """Work out which source columns (branches) are needed to render some
+    attributes of a template.
+
+    The `remap` (and `filter`) lambdas of the template, and of the templates it
+    returns, are analyzed (not run). Chains of field accesses and method calls
+    from the lambda argument (`e.jets.pt`, `e.Jets().Select(lambda j: j.pt())`)
+    are tracked through to the columns they refer to.
+
+    ```
+    >>> ledm.required_columns(evt, ["jets.pt", "met"])
+    {"jet_pt", "met"}
+    ```
+
+    Args:
+        template (type): The template class
+        attributes (Optional[Iterable[str]]): Attributes requested, with nested
+            templates separated by a `.` (`"jets.pt"`). None means all of them.
+
+    Returns:
+        Set[str]: The columns, nested fields separated by a `.`.
+    """
+    columns: Set[ColumnPath] = set()
+    _template_columns(template, (), attributes, _column_finder(columns))
+    return {".".join(c) for c in columns}
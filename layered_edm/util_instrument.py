@@ -0,0 +1,206 @@
+import json
+import logging
+import sys
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, TextIO, Union
+
+import awkward as ak
+
+# The events that are reported
+QUERY_BUILT = "query_built"
+QUERY_SUBMITTED = "query_submitted"
+RESULT_RECEIVED = "result_received"
+ARRAY_MATERIALIZED = "array_materialized"
+
+
+@dataclass(frozen=True)
+class InstrumentEvent:
+    "Something that happened while building, running or rendering a query"
+
+    # One of `QUERY_BUILT`, `QUERY_SUBMITTED`, `RESULT_RECEIVED` or `ARRAY_MATERIALIZED`
+    kind: str
+
+    # When it happened (`time.perf_counter()`)
+    time: float
+
+    # The text of the query (None for arrays that don't come from a single query)
+    query: Optional[str] = None
+
+    # The template attribute (`template.attribute`) of a materialized array
+    field: Optional[str] = None
+
+    # How long it took (seconds)
+    duration: Optional[float] = None
+
+    # The number of entries in the result
+    rows: Optional[int] = None
+
+    # The size of the result
+    nbytes: Optional[int] = None
+
+    # True if the result came from the cache
+    cached: bool = False
+
+
+Listener = Callable[[InstrumentEvent], None]
+
+_listeners: List[Listener] = []
+
+
+def add_listener(listener: Listener) -> Listener:
+    """Call `listener` with an `InstrumentEvent` each time a query is built,
+    submitted or returns, and each time an array is materialized.
+
+    Args:
+        listener (Callable[[InstrumentEvent], None]): Called with each event
+
+    Returns:
+        Callable[[InstrumentEvent], None]: The listener (so this can be used as a decorator)
+    """
+    _listeners.append(listener)
+    return listener
+
+
+def remove_listener(listener: Listener):
+    """Stop calling `listener`.
+
+    Args:
+        listener (Callable[[InstrumentEvent], None]): A listener added with `add_listener`
+    """
+    if listener in _listeners:
+        _listeners.remove(listener)
+
+
+def enabled() -> bool:
+    "True if anyone is listening - use to skip the work of building an event"
+    return len(_listeners) > 0
+
+
+def emit(kind: str, **info: Any):
+    """Send an event to all the listeners. Errors in a listener are logged, and
+    never stop the query or the rendering.
+
+    Args:
+        kind (str): What happened
+        info (Any): The other fields of `InstrumentEvent`
+    """
+    if not enabled():
+        return
+    event = InstrumentEvent(kind, time.perf_counter(), **info)
+    for listener in list(_listeners):
+        try:
+            listener(event)
+        except Exception:
+            logging.getLogger(__name__).exception(f"Instrumentation listener {listener} failed")
+
+
+def result_size(result: Any) -> Dict[str, Optional[int]]:
+    "The `rows` and `nbytes` of a result, if it has them"
+    if isinstance(result, ak.Array):
+        return {"rows": len(result), "nbytes": result.nbytes}
+    return {"rows": None, "nbytes": None}
+
+
+@dataclass
+class _Totals:
+    count: int = 0
+    cached: int = 0
+    duration: float = 0.0
+    rows: int = 0
+    nbytes: int = 0
+
+    def add(self, event: InstrumentEvent):
+        self.count += 1
+        self.cached += 1 if event.cached else 0
+        self.duration += event.duration or 0.0
+        self.rows += event.rows or 0
+        self.nbytes += event.nbytes or 0
+
+
+class InstrumentCollector:
+    """Collect all the events, and summarize them by query and by template field.
+
+    ```
+    with ledm.InstrumentCollector() as collector:
+        data.as_awkward().jets.pt
+    collector.dump()
+    ```
+    """
+
+    def __init__(self):
+        self._events: List[InstrumentEvent] = []
+
+    def __call__(self, event: InstrumentEvent):
+        self._events.append(event)
+
+    def __enter__(self) -> "InstrumentCollector":
+        add_listener(self)
+        return self
+
+    def __exit__(self, *args):
+        remove_listener(self)
+
+    @property
+    def events(self) -> List[InstrumentEvent]:
+        "Everything collected so far, in order"
+        return list(self._events)
+
+    def clear(self):
+        "Forget everything collected so far"
+        self._events.clear()
+
+    def by_query(self) -> Dict[str, _Totals]:
+        "Totals of the results received for each query"
+        return self._totals(RESULT_RECEIVED, lambda e: e.query)
+
+    def by_field(self) -> Dict[str, _Totals]:
+        "Totals of the arrays materialized for each template field"
+        return self._totals(ARRAY_MATERIALIZED, lambda e: e.field)
+
+    def _totals(self, kind: str, key: Callable[[InstrumentEvent], Optional[str]]):
+        result: Dict[str, _Totals] = {}
+        for e in self._events:
+            k = key(e)
+            if e.kind == kind and k is not None:
+                result.setdefault(k, _Totals()).add(e)
+        return dict(sorted(result.items(), key=lambda i: -i[1].duration))
+
+    def report(self) -> str:
+        """A text report: the queries and the fields, most expensive first.
+
+        Returns:
+            str: The report
+        """
+        lines = [f"Queries built: {sum(1 for e in self._events if e.kind == QUERY_BUILT)}"]
+        for title, totals in (("Query", self.by_query()), ("Field", self.by_field())):
+            lines.append("")
+            lines.append(
+                f"{'time (s)':>10} {'n':>5} {'cached':>6} {'rows':>10} {'bytes':>12}  {title}"
+            )
+            for name, t in totals.items():
+                lines.append(
+                    f"{t.duration:10.3f} {t.count:5d} {t.cached:6d} {t.rows:10d} {t.nbytes:12d}"
+                    f"  {name}"
+                )
+        return "\n".join(lines)
+
+    def dump(self, destination: Union[None, str, Path, TextIO] = None):
+        """Write the report (see `report`).
+
+        Args:
+            destination (None|str|Path|TextIO): Where to write it. A path ending in
+                `.jsonl` gets one JSON line per event instead. Defaults to `sys.stdout`.
+        """
+        if destination is None or not isinstance(destination, (str, Path)):
+            print(self.report(), file=destination or sys.stdout)
+            return
+
+        path = Path(destination)
+        if path.suffix == ".jsonl":
+            with path.open("w") as f:
+                for e in self._events:
+                    f.write(json.dumps(asdict(e)) + "\n")
+        else:
+            path.write_text(self.report() + "\n")
@@ -0,0 +1,56 @@
+from pathlib import Path
+from typing import Dict, Tuple, Union
+
+import awkward as ak
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover
+    pq = None
+
+# Our keys in the Parquet file metadata start with this
+_metadata_prefix = "ledm."
+
+
+def _require_pyarrow():
+    if pq is None:
+        raise ImportError(
+            "Saving to and loading from Parquet files requires `pyarrow` (`pip install pyarrow`)"
+        )
+
+
+def write_parquet(array: ak.Array, path: Union[str, Path], metadata: Dict[str, str]):
+    """Write an array to a Parquet file, one column per field.
+
+    Args:
+        array (ak.Array): The data. Virtual arrays are materialized as they are written.
+        path (str|Path): The file to write
+        metadata (Dict[str, str]): Stored with the file, see `read_parquet`
+    """
+    _require_pyarrow()
+    table = ak.to_arrow_table(ak.repartition(array, None))
+    file_metadata = dict(table.schema.metadata or {})
+    file_metadata.update(
+        {f"{_metadata_prefix}{k}".encode("utf-8"): v.encode("utf-8") for k, v in metadata.items()}
+    )
+    pq.write_table(table.replace_schema_metadata(file_metadata), str(path))
+
+
+def read_parquet(path: Union[str, Path]) -> Tuple[ak.Array, Dict[str, str]]:
+    """Open a Parquet file written by `write_parquet`. Nothing is read until it
+    is needed, and then one column at a time.
+
+    Args:
+        path (str|Path): The file to read
+
+    Returns:
+        Tuple[ak.Array, Dict[str, str]]: The lazy array and the metadata stored with it
+    """
+    _require_pyarrow()
+    file_metadata = pq.read_schema(str(path)).metadata or {}
+    metadata = {}
+    for k, v in file_metadata.items():
+        key = k.decode("utf-8")
+        if key.startswith(_metadata_prefix):
+            metadata[key.replace(_metadata_prefix, "", 1)] = v.decode("utf-8")
+    return ak.from_parquet(str(path), lazy=True), metadata
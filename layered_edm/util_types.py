@@ -1,5 +1,4 @@
 from dataclasses import dataclass
-import uuid
 from typing import Any, Callable, Dict, List, Optional, Type, TypeVar, Union, get_args
 
 import awkward as ak
@@ -108,6 +107,20 @@ class AkBehaviorInfo:
     register_callback: Optional[Callable[[], None]]
 
 
+@dataclass
+class _AkBehaviorMemo:
+    "What `class_behavior` found for a class"
+
+    # The name the behavior is registered under
+    name: str
+
+    # The behavior class we created and registered (or None if it was declared elsewhere)
+    behavior_object: Optional[type]
+
+    # The `ak.behavior` it was registered in
+    registry: Dict
+
+
 def append_awk_behavior_to_class(
     class_to_wrap: type,
     behavior_name: Union[str, type],
@@ -117,11 +130,30 @@ def append_awk_behavior_to_class(
     if not hasattr(class_to_wrap, "_awk_behaviors"):
         setattr(class_to_wrap, "_awk_behaviors", [])
     getattr(class_to_wrap, "_awk_behaviors").append(AkBehaviorInfo(behavior_name, reg_function))
+    if "_awk_behavior_memo" in vars(class_to_wrap):
+        delattr(class_to_wrap, "_awk_behavior_memo")
+
+
+def _combined_behavior_name(class_to_wrap: Callable, behavior_object: type) -> str:
+    """Name to register the behavior that combines several behaviors under. It is
+    built from the class name, with a suffix only if another class has that name.
+    """
+    base_name = f"{class_to_wrap.__module__}.{class_to_wrap.__qualname__}"
+    name = base_name
+    index = 0
+    while ak.behavior.get(("*", name), behavior_object) is not behavior_object:
+        index += 1
+        name = f"{base_name}_{index}"
+    return name
 
 
 def class_behavior(class_to_wrap: Callable) -> Optional[str]:
     """Scan a given class for any defined behaviors.
 
+    The result is remembered on the class: the registration callbacks are only
+    called again (and the behavior re-registered) if `ak.behavior` has been
+    replaced or the behavior removed from it.
+
     Args:
         class_to_wrap (type): Class to scan
 
@@ -132,6 +164,10 @@ def class_behavior(class_to_wrap: Callable) -> Optional[str]:
     if behavior_list is None:
         return None
 
+    memo: Optional[_AkBehaviorMemo] = vars(class_to_wrap).get("_awk_behavior_memo", None)
+    if memo is not None and memo.registry is ak.behavior and ("*", memo.name) in ak.behavior:
+        return memo.name
+
     # Call all the callback functions
     for cb in behavior_list:
         if cb.register_callback is not None:
@@ -144,11 +180,17 @@ def class_behavior(class_to_wrap: Callable) -> Optional[str]:
         behavior_object = None if isinstance(behavior_list[0].name, str) else behavior_list[0].name
     else:
         # Multiple behaviors are done by multiple inheritance.
-        class all_behaviors(*(_get_behavior_object(c.name) for c in behavior_list)):  # type: ignore
-            pass
+        if memo is not None and memo.behavior_object is not None:
+            behavior_object = memo.behavior_object
+        else:
+
+            class all_behaviors(
+                *(_get_behavior_object(c.name) for c in behavior_list)  # type: ignore
+            ):
+                pass
 
-        behavior_name = str(uuid.uuid4())
-        behavior_object = all_behaviors
+            behavior_object = all_behaviors
+        behavior_name = _combined_behavior_name(class_to_wrap, behavior_object)
 
     # Make sure the behavior is registered
     if ("*", behavior_name) not in ak.behavior:
@@ -158,4 +200,11 @@ def class_behavior(class_to_wrap: Callable) -> Optional[str]:
         else:
             raise ValueError(f'Awkward behavior "{behavior_name}" is not declared to awkward')
 
+    setattr(
+        class_to_wrap,
+        "_awk_behavior_memo",
+        _AkBehaviorMemo(
+            behavior_name, behavior_object if len(behavior_list) > 1 else None, ak.behavior
+        ),
+    )
     return behavior_name
@@ -0,0 +1,289 @@
+import ast
+import functools
+import operator
+import sys
+from typing import Any, Callable, Dict, Tuple
+
+import awkward as ak
+import numpy as np
+
+from .util_ast import parse_remap
+from .util_compat import unparse
+
+# A value while evaluating: the array, and how many sequences deep it is (0 for
+# one entry per event, 1 for one entry per jet in each event, ...).
+_Value = Tuple[Any, int]
+
+_binary_operators: Dict[type, Callable] = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+    ast.Pow: operator.pow,
+    ast.BitAnd: operator.and_,
+    ast.BitOr: operator.or_,
+}
+
+_unary_operators: Dict[type, Callable] = {
+    ast.USub: operator.neg,
+    ast.UAdd: operator.pos,
+    ast.Not: np.logical_not,
+    ast.Invert: operator.invert,
+}
+
+_comparisons: Dict[type, Callable] = {
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+}
+
+# Functions that can be called by name (`abs(x)`) or from a module (`math.sqrt(x)`)
+_functions: Dict[str, Callable] = {
+    "abs": np.abs,
+    "sqrt": np.sqrt,
+    "exp": np.exp,
+    "log": np.log,
+    "sin": np.sin,
+    "cos": np.cos,
+    "tan": np.tan,
+    "sinh": np.sinh,
+    "cosh": np.cosh,
+    "tanh": np.tanh,
+    "atan": np.arctan,
+    "atan2": np.arctan2,
+}
+_modules = {"math", "np", "numpy"}
+
+# Sequence methods that turn a sequence into one value per entry
+_reductions: Dict[str, Callable] = {
+    "Count": ak.num,
+    "First": ak.firsts,
+    "Sum": ak.sum,
+    "Max": ak.max,
+    "Min": ak.min,
+}
+
+
+def _error(node: ast.AST) -> ValueError:
+    return ValueError(f"Can not translate `{unparse(node)}` to awkward array operations")
+
+
+def _field(value: Any, name: str) -> Any:
+    "A field, or (if there is no field of that name) an attribute like a behavior property"
+    if isinstance(value, (ak.Array, ak.Record)) and name in ak.fields(value):
+        return value[name]
+    return getattr(value, name)
+
+
+class _Evaluator:
+    """Evaluate a func_adl lambda on an awkward array. The lambda argument is
+    bound to the whole array, so every operation is done on all the entries at
+    once.
+    """
+
+    def __init__(self):
+        self._scopes: Dict[str, _Value] = {}
+
+    def call(self, function_ast: ast.AST, value: _Value) -> _Value:
+        "Evaluate the body of a one argument lambda with its argument bound to `value`"
+        if not isinstance(function_ast, ast.Lambda) or len(function_ast.args.args) != 1:
+            raise _error(function_ast)
+        name = function_ast.args.args[0].arg
+        outer = self._scopes.get(name)
+        self._scopes[name] = value
+        try:
+            return self.evaluate(function_ast.body)
+        finally:
+            if outer is None:
+                del self._scopes[name]
+            else:
+                self._scopes[name] = outer
+
+    def evaluate(self, node: ast.AST) -> _Value:
+        method = getattr(self, f"_eval_{type(node).__name__}", None)
+        if method is None:
+            raise _error(node)
+        return method(node)
+
+    def _eval_Name(self, node: ast.Name) -> _Value:
+        if node.id not in self._scopes:
+            raise _error(node)
+        return self._scopes[node.id]
+
+    def _eval_Constant(self, node: ast.Constant) -> _Value:
+        return node.value, 0
+
+    def _eval_Attribute(self, node: ast.Attribute) -> _Value:
+        value, depth = self.evaluate(node.value)
+        return _field(value, node.attr), depth
+
+    def _eval_Subscript(self, node: ast.Subscript) -> _Value:
+        value, depth = self.evaluate(node.value)
+        index = node.slice
+        if sys.version_info < (3, 9) and isinstance(index, ast.Index):  # pragma: no cover
+            index = index.value  # type: ignore
+        key, _ = self.evaluate(index)
+        if isinstance(key, str):
+            return value[key], depth
+        # Index into the sequence (which is the axis after the entries we are at)
+        return value[(slice(None),) * (depth + 1) + (key,)], depth
+
+    def _eval_BinOp(self, node: ast.BinOp) -> _Value:
+        op = _binary_operators.get(type(node.op))
+        if op is None:
+            raise _error(node)
+        left, l_depth = self.evaluate(node.left)
+        right, r_depth = self.evaluate(node.right)
+        return op(left, right), max(l_depth, r_depth)
+
+    def _eval_UnaryOp(self, node: ast.UnaryOp) -> _Value:
+        op = _unary_operators.get(type(node.op))
+        if op is None:
+            raise _error(node)  # pragma: no cover
+        value, depth = self.evaluate(node.operand)
+        return op(value), depth
+
+    def _eval_BoolOp(self, node: ast.BoolOp) -> _Value:
+        op = operator.and_ if isinstance(node.op, ast.And) else operator.or_
+        values = [self.evaluate(v) for v in node.values]
+        return (
+            functools.reduce(op, [v for v, _ in values]),
+            max(d for _, d in values),
+        )
+
+    def _eval_Compare(self, node: ast.Compare) -> _Value:
+        "`a < b < c` is `(a < b) & (b < c)`"
+        left, depth = self.evaluate(node.left)
+        result = None
+        for op_node, right_node in zip(node.ops, node.comparators):
+            op = _comparisons.get(type(op_node))
+            if op is None:
+                raise _error(node)
+            right, r_depth = self.evaluate(right_node)
+            depth = max(depth, r_depth)
+            test = op(left, right)
+            result = test if result is None else result & test
+            left = right
+        return result, depth
+
+    def _eval_IfExp(self, node: ast.IfExp) -> _Value:
+        values = [self.evaluate(n) for n in (node.test, node.body, node.orelse)]
+        return ak.where(*[v for v, _ in values]), max(d for _, d in values)
+
+    def _eval_Dict(self, node: ast.Dict) -> _Value:
+        "A record, with one field per key"
+        if not all(isinstance(k, ast.Constant) and isinstance(k.value, str) for k in node.keys):
+            raise _error(node)
+        values = {k.value: self.evaluate(v) for k, v in zip(node.keys, node.values)}  # type: ignore
+        depth = max((d for _, d in values.values()), default=0)
+        return ak.zip({k: v for k, (v, _) in values.items()}, depth_limit=depth + 1), depth
+
+    def _eval_Call(self, node: ast.Call) -> _Value:
+        func = node.func
+        if isinstance(func, ast.Name) and func.id in _functions:
+            return self._function(node, _functions[func.id])
+        if not isinstance(func, ast.Attribute):
+            raise _error(node)
+        if (
+            isinstance(func.value, ast.Name)
+            and func.value.id in _modules
+            and func.value.id not in self._scopes
+        ):
+            if func.attr not in _functions:
+                raise _error(node)
+            return self._function(node, _functions[func.attr])
+
+        value, depth = self.evaluate(func.value)
+        method = getattr(self, f"_sequence_{func.attr}", None)
+        if method is not None:
+            return method(node, value, depth), depth
+        if func.attr in _reductions and len(node.args) == 0:
+            return _reductions[func.attr](value, axis=depth + 1), depth
+
+        # `j.pt()` is the column (or behavior property) `pt`. Behavior methods are called.
+        attr = _field(value, func.attr)
+        if callable(attr):
+            return attr(*[self.evaluate(a)[0] for a in node.args]), depth
+        if len(node.args) > 0 or len(node.keywords) > 0:
+            raise _error(node)
+        return attr, depth
+
+    def _function(self, node: ast.Call, function: Callable) -> _Value:
+        args = [self.evaluate(a) for a in node.args]
+        return function(*[v for v, _ in args]), max((d for _, d in args), default=0)
+
+    def _lambda_arg(self, node: ast.Call) -> ast.AST:
+        if len(node.args) != 1:
+            raise _error(node)
+        return node.args[0]
+
+    def _sequence_Select(self, node: ast.Call, value: Any, depth: int) -> Any:
+        "The lambda is applied to all the items at once"
+        result, r_depth = self.call(self._lambda_arg(node), (value, depth + 1))
+        if r_depth <= depth:
+            # Something that does not depend on the item (`lambda j: 1.0`) - one per item
+            result = ak.broadcast_arrays(result, ak.local_index(value, axis=depth + 1))[0]
+        return result
+
+    def _sequence_Where(self, node: ast.Call, value: Any, depth: int) -> Any:
+        "A jagged mask"
+        mask, _ = self.call(self._lambda_arg(node), (value, depth + 1))
+        return value[mask]
+
+    def _sequence_Any(self, node: ast.Call, value: Any, depth: int) -> Any:
+        mask, _ = self.call(self._lambda_arg(node), (value, depth + 1))
+        return ak.any(mask, axis=depth + 1)
+
+    def _sequence_All(self, node: ast.Call, value: Any, depth: int) -> Any:
+        mask, _ = self.call(self._lambda_arg(node), (value, depth + 1))
+        return ak.all(mask, axis=depth + 1)
+
+
+def vectorize_lambda(function_ast: ast.Lambda) -> Callable[[Any], Any]:
+    """Turn a func_adl lambda into a function that runs on a whole awkward array
+    at once.
+
+    The argument of the lambda is bound to the array, so:
+
+    * `Select` is broadcast field access (`e.Jets().Select(lambda j: j.pt())` is `e.Jets.pt`)
+    * `Where` is a (jagged) mask
+    * `Count`, `First`, `Sum`, `Max` and `Min` are `ak.num`, `ak.firsts`, `ak.sum`, ... on the
+      sequence
+    * Calling a method with no arguments (`j.pt()`) is the field of that name
+    * Arithmetic, comparisons and `abs`, `sqrt`, ... are element-wise
+
+    Each array is assumed to have one list dimension per level of nesting: an
+    array of event records, a jagged array of jet records, etc.
+
+    Args:
+        function_ast (ast.Lambda): A one argument lambda, as parsed by func_adl
+
+    Returns:
+        Callable[[Any], Any]: The function. Raises `ValueError` if it uses
+            something that can't be translated.
+    """
+
+    def run(data: Any) -> Any:
+        depth = data.ndim - 1 if isinstance(data, ak.Array) else 0
+        return _Evaluator().call(function_ast, (data, depth))[0]
+
+    return run
+
+
+def vectorize_remap(callback: Callable, caller_name: str = "remap") -> Callable[[Any], Any]:
+    """Return a function that runs the func_adl style `remap` (or `filter`)
+    lambda `callback` on an awkward array. See `vectorize_lambda`.
+
+    Args:
+        callback (Callable): The lambda passed to `remap`
+        caller_name (str): Name of the decorator the lambda was passed to
+
+    Returns:
+        Callable[[Any], Any]: The function
+    """
+    return vectorize_lambda(parse_remap(callback, caller_name))
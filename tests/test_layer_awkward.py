@@ -1,7 +1,12 @@
 # import pytest
+import asyncio
+import gc
+import os
+import weakref
 from dataclasses import dataclass
 from typing import Any, Callable, Iterable
 import awkward as ak
+import numpy as np
 import pytest
 import layered_edm as ledm
 from layered_edm.base_layer import BaseEDMLayer
@@ -328,3 +333,536 @@ def test_aw_jets_behavior_late_decl(simple_ds, ak_behavior):
     print(ak.type(data.ds.ds))
 
     assert ak.all(data.x2.as_awkward() == data.x.as_awkward() * 2)
+
+
+def test_aw_array_length(simple_ds):
+    @ledm.edm_awk
+    class my_evt:
+        @property
+        @ledm.remap(lambda e: e.x)
+        def met(self):
+            ...
+
+    data = my_evt(simple_ds)
+    assert data.array_length() == 3
+    assert data.met.array_length() == 3
+
+
+def test_aw_as_awkward_async(simple_ds):
+    @ledm.edm_awk
+    class my_evt:
+        @property
+        @ledm.remap(lambda e: e.x)
+        def met(self):
+            ...
+
+    data = my_evt(simple_ds)
+    r = asyncio.run(data.met.as_awkward_async())
+    assert r.tolist() == [[1, 2, 3], [], [4, 5]]
+
+
+def test_aw_filter_event_level():
+    @ledm.edm_awk
+    @ledm.filter(lambda e: e.met > 1)
+    class my_evt:
+        @property
+        @ledm.remap(lambda e: e.met)
+        def met(self) -> float:
+            ...
+
+        @property
+        @ledm.remap(lambda e: e.jets)
+        def jets(self) -> Iterable[jet]:
+            ...
+
+    data = my_evt(
+        ak.Array(
+            [
+                {"met": 1, "jets": [{"x": 1, "y": 2, "z": 3}]},
+                {"met": 2, "jets": [{"x": 4, "y": 5, "z": 6}]},
+                {"met": 3, "jets": []},
+            ]
+        )
+    )
+
+    assert data.met.as_awkward().tolist() == [2, 3]
+    assert data.jets.x.as_awkward().tolist() == [[4], []]
+    assert data.array_length() == 2
+
+
+def test_aw_nested_record_outlives_layer():
+    "The virtual fields of a nested record stay valid after the layers are gone"
+
+    class my_jet:
+        @property
+        @ledm.remap(lambda j: j.x)
+        def pt(self) -> float:
+            ...
+
+    @ledm.edm_awk
+    class my_evt:
+        @property
+        @ledm.remap(lambda e: e.jets)
+        def jets(self) -> Iterable[my_jet]:
+            ...
+
+    data = my_evt(ak.Array([{"jets": [{"x": 1}, {"x": 2}]}, {"jets": []}]))
+    r = data.as_awkward()
+    del data
+    gc.collect()
+
+    assert r.jets.pt.tolist() == [[1, 2], []]
+    assert r.tolist() == [{"jets": {"pt": [1, 2]}}, {"jets": {"pt": []}}]
+
+
+def test_aw_layers_are_slotted(simple_ds):
+    "Layers are created at each navigation step - they should not carry a `__dict__`"
+
+    @ledm.edm_awk
+    class my_evt:
+        @property
+        @ledm.remap()
+        def p4(self) -> Iterable[jet]:
+            ...
+
+    data = my_evt(simple_ds)
+    for layer in [data, data.ds, data.p4, data.p4.x]:
+        with pytest.raises(AttributeError):
+            object.__getattribute__(layer, "__dict__")
+        assert weakref.ref(layer)() is layer
+
+
+def test_aw_filter_inherited():
+    @ledm.filter(lambda e: e.met > 1)
+    class base_evt:
+        @property
+        @ledm.remap(lambda e: e.met)
+        def met(self) -> float:
+            ...
+
+    @ledm.edm_awk
+    @ledm.filter(lambda e: e.met < 3)
+    class my_evt(base_evt):
+        ...
+
+    data = my_evt(ak.Array([{"met": 1}, {"met": 2}, {"met": 3}]))
+
+    assert data.met.as_awkward().tolist() == [2]
+    assert len(base_evt._ledm_filters) == 1  # type: ignore
+
+
+def test_aw_filter_object_level():
+    class my_jet:
+        @property
+        @ledm.remap(lambda j: j.x)
+        def x(self) -> float:
+            ...
+
+    @ledm.filter(lambda j: j.x > 1)
+    class my_good_jet(my_jet):
+        ...
+
+    @ledm.edm_awk
+    class my_evt:
+        @property
+        @ledm.remap(lambda e: e.jets)
+        def jets(self) -> Iterable[my_jet]:
+            ...
+
+        @property
+        @ledm.remap(lambda e: e.jets)
+        def good_jets(self) -> Iterable[my_good_jet]:
+            ...
+
+    data = my_evt(ak.Array([{"jets": [{"x": 1}, {"x": 2}]}, {"jets": []}, {"jets": [{"x": 3}]}]))
+
+    assert data.jets.x.as_awkward().tolist() == [[1, 2], [], [3]]
+    assert data.good_jets.x.as_awkward().tolist() == [[2], [], [3]]
+    assert len(data.good_jets.as_awkward()) == 3
+
+
+def test_aw_iter_chunks_record():
+    @ledm.edm_awk
+    class my_evt:
+        @property
+        @ledm.remap(lambda e: e.met)
+        def met(self) -> float:
+            ...
+
+        @property
+        @ledm.remap(lambda e: e.jets)
+        def jets(self) -> Iterable[jet]:
+            ...
+
+    data = my_evt(ak.Array([{"met": i, "jets": [{"x": i, "y": 0, "z": 0}] * i} for i in range(5)]))
+
+    chunks = list(data.iter_chunks(2))
+    assert [len(c) for c in chunks] == [2, 2, 1]
+    assert [c.met.tolist() for c in chunks] == [[0, 1], [2, 3], [4]]
+
+    jet_chunks = list(data.jets.x.iter_chunks(3))
+    assert [c.tolist() for c in jet_chunks] == [[[], [1], [2, 2]], [[3, 3, 3], [4, 4, 4, 4]]]
+
+
+def test_aw_iter_chunks_filtered():
+    @ledm.edm_awk
+    @ledm.filter(lambda e: e.met % 2 == 0)
+    class my_evt:
+        @property
+        @ledm.remap(lambda e: e.met)
+        def met(self) -> float:
+            ...
+
+    data = my_evt(ak.Array([{"met": i} for i in range(10)]))
+
+    chunks = list(data.iter_chunks(4))
+    assert all(len(c) <= 4 for c in chunks)
+    assert sum((c.met.tolist() for c in chunks), []) == [0, 2, 4, 6, 8]
+
+
+def _pids(a) -> np.ndarray:
+    "The process each entry was processed in"
+    return np.full(len(a), os.getpid())
+
+
+class evt_heavy:
+    @property
+    @ledm.remap(lambda e: e.met * 2)
+    def met2(self) -> float:
+        ...
+
+    @property
+    @ledm.remap(lambda e: _pids(e.met))
+    def pid(self) -> int:
+        ...
+
+    @property
+    @ledm.remap(lambda e: e.jets)
+    def jets(self) -> Iterable[jet]:
+        ...
+
+
+@pytest.fixture
+def heavy_events():
+    return ak.Array(
+        [{"met": i, "jets": [{"x": j, "y": 0, "z": 0} for j in range(i % 3)]} for i in range(8)]
+    )
+
+
+def test_aw_parallel(heavy_events, mocker):
+    mocker.patch("layered_edm.layer_awkward._min_partition_size", 2)
+    data = ledm.edm_awk(evt_heavy)(heavy_events, n_processes=3)
+
+    assert data.met2.as_awkward().tolist() == [i * 2 for i in range(8)]
+    assert data.jets.x.as_awkward().tolist() == [list(range(i % 3)) for i in range(8)]
+
+    pids = set(data.pid.as_awkward().tolist())
+    assert len(pids) == 3
+    assert os.getpid() not in pids
+
+
+def test_aw_parallel_filter(heavy_events, mocker):
+    mocker.patch("layered_edm.layer_awkward._min_partition_size", 2)
+
+    @ledm.filter(lambda e: e.met % 2 == 0)
+    class evt_filtered(evt_heavy):
+        ...
+
+    data = ledm.edm_awk(evt_filtered)(heavy_events, n_processes=2)
+    assert data.met2.as_awkward().tolist() == [0, 4, 8, 12]
+
+
+def test_aw_parallel_small_array(heavy_events):
+    "Not worth splitting up"
+    data = ledm.edm_awk(evt_heavy)(heavy_events, n_processes=3)
+    assert set(data.pid.as_awkward().tolist()) == {os.getpid()}
+
+
+def test_aw_parallel_no_fork(heavy_events, mocker):
+    mocker.patch("layered_edm.layer_awkward._min_partition_size", 2)
+    mocker.patch("multiprocessing.get_all_start_methods", return_value=["spawn"])
+
+    data = ledm.edm_awk(evt_heavy)(heavy_events, n_processes=3)
+    assert set(data.pid.as_awkward().tolist()) == {os.getpid()}
+    assert data.met2.as_awkward().tolist() == [i * 2 for i in range(8)]
+
+
+def test_aw_explain(capsys):
+    @ledm.edm_awk
+    class my_evt:
+        @property
+        @ledm.remap(lambda e: e.met)
+        def met(self) -> float:
+            ...
+
+        @property
+        @ledm.remap(lambda e: e.jets)
+        def jets(self) -> Iterable[jet]:
+            ...
+
+    data = my_evt(
+        ak.Array(
+            [
+                {"met": 1.0, "jets": [{"x": 1.0, "y": 2.0, "z": 3.0}]},
+                {"met": 2.0, "jets": []},
+            ]
+        )
+    )
+    data.explain()
+    out = capsys.readouterr().out
+
+    assert "length of my_evt\n      len() = 2" in out
+    assert "my_evt.met  (lambda e: e.met)\n      2 entries, 16 bytes" in out
+    assert "my_evt.jets.x" in out
+    assert "Awkward arrays: 4, " in out
+
+
+def test_aw_explain_lazy(capsys):
+    "Arrays that have not been read yet are not read, and their size is estimated"
+    calls = []
+
+    def generate():
+        calls.append(1)
+        return ak.Array([1.0, 2.0, 3.0])
+
+    @ledm.edm_awk
+    class my_evt:
+        @property
+        @ledm.remap(lambda e: e.met)
+        def met(self) -> float:
+            ...
+
+    data = my_evt(
+        ak.Array({"met": ak.virtual(generate, length=3, form=ak.Array([1.0]).layout.form)})
+    )
+    data.explain()
+    out = capsys.readouterr().out
+
+    assert len(calls) == 0
+    assert "3 entries, ~24 bytes (not read yet)" in out
+    assert "Awkward arrays: 1, ~24 bytes, 1 not read yet" in out
+
+
+def test_aw_explain_runs_nothing(capsys):
+    "The remaps and filters are described, not run"
+    calls = []
+
+    def counted(value):
+        calls.append(1)
+        return value
+
+    class c_jet:
+        @property
+        @ledm.remap(lambda j: counted(j.x) * 2)
+        def x2(self) -> float:
+            ...
+
+        @property
+        @ledm.remap(lambda j: j.y)
+        def y(self) -> float:
+            ...
+
+    @ledm.edm_awk
+    @ledm.filter(lambda e: counted(e.met) > 0)
+    class my_evt:
+        @property
+        @ledm.remap(lambda e: counted(e.met) + 1)
+        def met1(self) -> float:
+            ...
+
+        @property
+        @ledm.remap(lambda e: e.jets)
+        def jets(self) -> Iterable[c_jet]:
+            ...
+
+    data = my_evt(
+        ak.Array(
+            [
+                {"met": 1.0, "jets": [{"x": 1.0, "y": 2.0}]},
+                {"met": 2.0, "jets": []},
+            ]
+        ),
+        n_processes=2,
+    )
+    data.explain()
+    out = capsys.readouterr().out
+
+    assert len(calls) == 0
+    assert "length of my_evt\n      at most 2 entries" in out
+    assert (
+        "my_evt.met1  (lambda e: counted(e.met) + 1)\n"
+        "      at most 2 entries, size unknown (remap not run)"
+    ) in out
+    assert "my_evt.jets.y  (lambda j: j.y)\n      at most 2 entries, " in out
+    assert "Awkward arrays: 3, " in out
+
+
+class sx_jet:
+    @property
+    @ledm.remap(lambda j: j.pt() / 1000.0)
+    def pt(self) -> float:
+        ...
+
+    @property
+    @ledm.remap(lambda j: j.tracks().Count())
+    def n_tracks(self) -> int:
+        ...
+
+
+@ledm.filter(lambda e: e.Jets().Count() > 0)
+class sx_evt:
+    @property
+    @ledm.remap(lambda e: e.met() * 2)
+    def met2(self) -> float:
+        ...
+
+    @property
+    @ledm.remap(lambda e: e.Jets().Where(lambda j: j.pt() > 25000.0))
+    def jets(self) -> Iterable[sx_jet]:
+        ...
+
+    @property
+    @ledm.remap(lambda e: e.Jets().Select(lambda j: j.pt()).Sum())
+    def ht(self) -> float:
+        ...
+
+
+@pytest.fixture
+def sx_events():
+    return ak.Array(
+        [
+            {
+                "met": 1.0,
+                "Jets": [
+                    {"pt": 50000.0, "tracks": [{"q": 1}, {"q": -1}]},
+                    {"pt": 20000.0, "tracks": [{"q": 1}]},
+                ],
+            },
+            {"met": 2.0, "Jets": []},
+            {"met": 3.0, "Jets": [{"pt": 30000.0, "tracks": []}]},
+        ]
+    )
+
+
+def test_aw_func_adl_style(sx_events):
+    "A template written for ServiceX runs unchanged on an awkward array"
+    data = ledm.edm_awk(sx_evt)(sx_events, func_adl_style=True)
+
+    assert data.met2.as_awkward().tolist() == [2.0, 6.0]
+    assert data.ht.as_awkward().tolist() == [70000.0, 30000.0]
+    assert data.jets.pt.as_awkward().tolist() == [[50.0], [30.0]]
+    assert data.jets.n_tracks.as_awkward().tolist() == [[2], [0]]
+
+
+def test_aw_func_adl_style_untranslatable(sx_events):
+    "Collections with arguments can't be found in the array"
+
+    @ledm.filter(lambda e: e.Jets("AntiKt4").Count() > 0)
+    class sx_evt_named:
+        @property
+        @ledm.remap(lambda e: e.met())
+        def met(self) -> float:
+            ...
+
+    data = ledm.edm_awk(sx_evt_named)(sx_events, func_adl_style=True)
+    with pytest.raises(ValueError) as e:
+        data.met.as_awkward()
+    assert "AntiKt4" in str(e.value)
+
+
+def test_aw_compact(simple_ds, ak_behavior):
+    "A compact template is rendered as one zipped record array, with its behavior"
+
+    class awk_p4(ak.Array):
+        @property
+        def x2(self):
+            return self.x * 2
+
+    ak.behavior["test_aw_compact"] = awk_p4
+    ak.behavior["*", "test_aw_compact"] = awk_p4
+
+    @ledm.compact
+    @ledm.add_awk_behavior("test_aw_compact")
+    class p4:
+        @property
+        @ledm.remap(lambda j: j.x)
+        def x(self) -> float:
+            ...
+
+        @property
+        @ledm.remap(lambda j: j.x + 1)
+        def y(self) -> float:
+            ...
+
+    @ledm.edm_awk
+    class my_evt:
+        @property
+        @ledm.remap()
+        def jets(self) -> Iterable[p4]:
+            ...
+
+    jets = my_evt(simple_ds).jets.as_awkward()
+
+    assert isinstance(jets.layout, ak.layout.ListOffsetArray64)
+    assert isinstance(jets.layout.content, ak.layout.RecordArray)
+    assert jets.y.tolist() == [[2, 3, 4], [], [5, 6]]
+    assert jets.x2.tolist() == [[2, 4, 6], [], [8, 10]]
+
+
+def test_aw_compact_nested(simple_ds):
+    "A compact template with a nested template zips that in as well"
+
+    @ledm.compact
+    class my_evt:
+        @property
+        @ledm.remap(lambda e: ak.num(e, axis=1))
+        def n(self) -> int:
+            ...
+
+        @property
+        @ledm.remap()
+        def jets(self) -> Iterable[jet]:
+            ...
+
+    data = ledm.edm_awk(my_evt)(simple_ds).as_awkward()
+
+    assert isinstance(data.layout, ak.layout.RecordArray)
+    assert data.n.tolist() == [3, 0, 2]
+    assert data.jets.x.tolist() == [[1, 2, 3], [], [4, 5]]
+
+
+def test_aw_compact_async(simple_ds):
+    @ledm.compact
+    class my_evt:
+        @property
+        @ledm.remap(lambda e: ak.num(e, axis=1))
+        def n(self) -> int:
+            ...
+
+    data = asyncio.run(ledm.edm_awk(my_evt)(simple_ds).as_awkward_async())
+
+    assert isinstance(data.layout, ak.layout.RecordArray)
+    assert data.n.tolist() == [3, 0, 2]
+
+
+def test_aw_filter_single_object():
+    "A filter on a template for a single object would misalign it with its siblings"
+
+    @ledm.filter(lambda m: m.value > 1)
+    class met_t:
+        @property
+        @ledm.remap(lambda m: m.value)
+        def value(self) -> float:
+            ...
+
+    @ledm.edm_awk
+    class my_evt:
+        @property
+        @ledm.remap(lambda e: e.met)
+        def met(self) -> met_t:
+            ...
+
+    data = my_evt(ak.Array([{"met": {"value": 1}}, {"met": {"value": 2}}]))
+    with pytest.raises(ValueError) as e:
+        data.met
+    assert "met_t" in str(e.value)
@@ -0,0 +1,149 @@
+from typing import Iterable
+
+import awkward as ak
+import layered_edm as ledm
+import pytest
+
+pytest.importorskip("dask")
+
+from dask.delayed import Delayed  # noqa: E402
+from layered_edm.layer_dask import LEDMDask  # noqa: E402
+
+
+class jet:
+    @property
+    @ledm.remap(lambda j: j.x)
+    def pt(self) -> float:
+        ...
+
+
+@ledm.filter(lambda j: j.x > 1)
+class good_jet(jet):
+    ...
+
+
+@ledm.filter(lambda e: e.met > 1)
+class my_evt:
+    @property
+    @ledm.remap(lambda e: e.met)
+    def met(self) -> float:
+        ...
+
+    @property
+    @ledm.remap(lambda e: e.met * 2)
+    def met2(self) -> float:
+        ...
+
+    @property
+    @ledm.remap(lambda e: e.jets)
+    def jets(self) -> Iterable[good_jet]:
+        ...
+
+
+@pytest.fixture
+def events_array():
+    return ak.Array(
+        [
+            {"met": 1, "jets": [{"x": 1}]},
+            {"met": 2, "jets": [{"x": 1}, {"x": 2}]},
+            {"met": 3, "jets": []},
+            {"met": 4, "jets": [{"x": 3}]},
+            {"met": 5, "jets": [{"x": 4}, {"x": 5}]},
+        ]
+    )
+
+
+def test_dask_navigation(events_array):
+    data = ledm.edm_dask(my_evt)(events_array, npartitions=2, scheduler="sync")
+
+    assert isinstance(data.ds, LEDMDask)
+    assert len(data.ds.ds) == 2
+    assert data.met.as_awkward().tolist() == [2, 3, 4, 5]
+    assert data.jets.pt.as_awkward().tolist() == [[2], [], [3], [4, 5]]
+    assert data.array_length() == 4
+
+
+def test_dask_record(events_array):
+    data = ledm.edm_dask(my_evt)(events_array, npartitions=3, scheduler="sync")
+    r = data.as_awkward()
+
+    assert r.met2.tolist() == [4, 6, 8, 10]
+    assert r.jets.pt.tolist() == [[2], [], [3], [4, 5]]
+
+
+def test_dask_graph_is_lazy(events_array):
+    data = ledm.edm_dask(my_evt)(events_array, npartitions=2, scheduler="sync")
+    met = data.met
+
+    assert all(isinstance(p, Delayed) for p in met.ds)
+
+
+def test_dask_partitions_list(events_array):
+    data = ledm.edm_dask(my_evt)([events_array[:1], events_array[1:]], scheduler="sync")
+
+    assert len(data.ds.ds) == 2
+    assert data.met.as_awkward().tolist() == [2, 3, 4, 5]
+
+
+def test_dask_more_partitions_than_entries():
+    data = ledm.edm_dask(my_evt)(ak.Array([{"met": 2, "jets": []}]), npartitions=8)
+
+    assert len(data.ds.ds) == 1
+
+
+def test_dask_iter_chunks(events_array):
+    data = ledm.edm_dask(my_evt)(events_array, npartitions=2, scheduler="sync")
+    chunks = list(data.met.iter_chunks(1))
+
+    assert [c.tolist() for c in chunks] == [[2], [3], [4], [5]]
+
+
+def test_dask_behavior(events_array, ak_behavior):
+    class awk_my_behavior(ak.Array):
+        @property
+        def met_doubled(self):
+            return self.met * 2
+
+    @ledm.edm_dask
+    @ledm.add_awk_behavior(awk_my_behavior)
+    class evt_with_behavior:
+        @property
+        @ledm.remap(lambda e: e.met)
+        def met(self) -> float:
+            ...
+
+    data = evt_with_behavior(events_array, npartitions=2, scheduler="sync")
+
+    assert data.met_doubled.as_awkward().tolist() == [2, 4, 6, 8, 10]
+
+
+def test_dask_processes(events_array):
+    "Run on the multiprocessing scheduler"
+    data = ledm.edm_dask(my_evt)(events_array, npartitions=2)
+
+    assert data.ds.scheduler == "processes"
+    assert data.jets.pt.as_awkward().tolist() == [[2], [], [3], [4, 5]]
+
+
+class _awk_doubled(ak.Array):
+    @property
+    def met_doubled(self):
+        return self.met * 2
+
+
+def test_dask_behavior_processes(events_array, ak_behavior):
+    "Remaps that use a behavior work in the worker processes"
+
+    @ledm.edm_dask
+    @ledm.add_awk_behavior(_awk_doubled)
+    class evt_with_behavior:
+        @property
+        @ledm.remap(lambda e: e.met_doubled + 1)
+        def met_doubled_1(self) -> float:
+            ...
+
+    data = evt_with_behavior(events_array, npartitions=2)
+
+    assert data.ds.scheduler == "processes"
+    assert data.met_doubled_1.as_awkward().tolist() == [3, 5, 7, 9, 11]
+    assert data.met_doubled.as_awkward().tolist() == [2, 4, 6, 8, 10]
@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+import gc
+import weakref
 from dataclasses import dataclass
 from typing import Callable, Iterable, List
 
@@ -7,7 +9,8 @@ import awkward as ak
 import layered_edm as ledm
 import pytest
 from layered_edm.base_layer import BaseEDMLayer
-from layered_edm.layer_nested import BaseTemplateEDMLayer
+from layered_edm import layer_nested
+from layered_edm.layer_nested import BaseTemplateEDMLayer, template_table
 
 
 class simple_array_layer(BaseEDMLayer):
@@ -163,3 +166,115 @@ def test_sub_object_remap_collection(mock_layer, mocker):
     result = d.subs.as_awkward()
 
     assert isinstance(result, ak.Array)
+
+
+def test_navigation_memoized(mock_layer):
+    "Navigating the same path twice gives the same layer, and builds it once"
+
+    class main_obj:
+        @property
+        @ledm.remap(lambda ds: ds.sub_objs())
+        def sub(self) -> _test_sub_obj_remap:
+            ...
+
+    d = BaseTemplateEDMLayer(mock_layer, main_obj)
+
+    assert d.sub is d.sub
+    assert d.sub.my_prop is d.sub.my_prop
+    mock_layer.ds.sub_objs.assert_called_once()
+    mock_layer.ds.sub_objs.return_value.my_prop.assert_called_once()
+
+
+def test_navigation_pass_thru_not_memoized(dummy_layer):
+    "Attributes that are not in the template go to the wrapped layer each time"
+
+    class second_level:
+        ...
+
+    d = BaseTemplateEDMLayer(dummy_layer, second_level)
+    first = d.forker
+    dummy_layer.ds.forker = [4, 5]
+
+    assert first.ds == [1, 2, 3]
+    assert d.forker.ds == [4, 5]
+
+
+def test_navigation_child_does_not_keep_parent(mock_layer):
+    class main_obj:
+        @property
+        @ledm.remap(lambda ds: ds.sub_objs())
+        def sub(self) -> _test_sub_obj_remap:
+            ...
+
+    d = BaseTemplateEDMLayer(mock_layer, main_obj)
+    sub = d.sub
+    parent = weakref.ref(d)
+    del d
+    gc.collect()
+
+    assert parent() is None
+    assert isinstance(sub.my_prop, simple_array_layer)
+
+
+def test_template_table_compiled_once(dummy_layer, mocker):
+    "The template is only inspected the first time it is used"
+
+    class second_level:
+        @property
+        @ledm.remap(lambda ds: ds.forker)
+        def met(self) -> float:
+            ...
+
+        @property
+        def not_remapped(self) -> float:
+            ...
+
+        def method(self):
+            ...
+
+    spy = mocker.spy(layer_nested, "get_type_hints")
+
+    d1 = BaseTemplateEDMLayer(dummy_layer, second_level)
+    d2 = BaseTemplateEDMLayer(dummy_layer, second_level)
+    d1.met
+    d2.met
+    d1.met
+
+    assert spy.call_count == 2
+    assert set(template_table(second_level).keys()) == {"met", "not_remapped"}
+    assert template_table(second_level) is template_table(second_level)
+
+
+def test_template_table_entries():
+    "Check the resolution info"
+
+    class main_obj:
+        @property
+        @ledm.remap(lambda ds: ds.x)
+        def x(self) -> float:
+            ...
+
+        @property
+        @ledm.remap()
+        def sub(self) -> _test_sub_obj_remap:
+            ...
+
+        @property
+        @ledm.remap()
+        def subs(self) -> Iterable[_test_sub_obj_remap]:
+            ...
+
+    table = template_table(main_obj)
+
+    assert table["x"].is_terminal
+    assert table["x"].remap_func is not None
+
+    assert not table["sub"].is_terminal
+    assert not table["sub"].is_iterable
+    assert table["sub"].element_type is _test_sub_obj_remap
+
+    assert table["subs"].is_iterable
+    assert table["subs"].element_type is _test_sub_obj_remap
+
+    with pytest.raises(TypeError):
+        table["y"] = table["x"]  # type: ignore
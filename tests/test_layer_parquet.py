@@ -0,0 +1,158 @@
+from typing import Iterable
+
+import awkward as ak
+import layered_edm as ledm
+import pytest
+
+pytest.importorskip("pyarrow")
+
+
+class jet:
+    @property
+    @ledm.remap(lambda j: j.x)
+    def pt(self) -> float:
+        ...
+
+
+@ledm.filter(lambda j: j.x > 1)
+class good_jet(jet):
+    ...
+
+
+class my_evt:
+    @property
+    @ledm.remap(lambda e: e.missing_et * 2)
+    def met(self) -> float:
+        ...
+
+    @property
+    @ledm.remap(lambda e: e.jets)
+    def jets(self) -> Iterable[jet]:
+        ...
+
+    @property
+    @ledm.remap(lambda e: e.jets)
+    def good_jets(self) -> Iterable[good_jet]:
+        ...
+
+
+@pytest.fixture
+def events():
+    return ledm.edm_awk(my_evt)(
+        ak.Array(
+            [
+                {"missing_et": 1.0, "jets": [{"x": 1.0}, {"x": 2.0}]},
+                {"missing_et": 2.0, "jets": []},
+                {"missing_et": 3.0, "jets": [{"x": 3.0}]},
+            ]
+        )
+    )
+
+
+def test_save_and_load(events, tmp_path):
+    events.save(tmp_path / "events.parquet")
+    data = ledm.edm_from_parquet(my_evt, tmp_path / "events.parquet")
+
+    # The remaps and filters were applied before saving
+    assert data.met.as_awkward().tolist() == [2.0, 4.0, 6.0]
+    assert data.jets.pt.as_awkward().tolist() == [[1.0, 2.0], [], [3.0]]
+    assert data.good_jets.pt.as_awkward().tolist() == [[2.0], [], [3.0]]
+    assert data.array_length() == 3
+
+
+def test_load_is_lazy(events, tmp_path):
+    events.save(tmp_path / "events.parquet")
+    data = ledm.edm_from_parquet(my_evt, tmp_path / "events.parquet")
+
+    layout = data.ds.ds.layout
+    assert set(layout.keys()) == {"met", "jets", "good_jets"}
+    assert all(isinstance(layout.field(k), ak.layout.VirtualArray) for k in layout.keys())
+
+
+@ledm.edm_awk
+class decorated_evt:
+    @property
+    @ledm.remap(lambda e: e.missing_et * 2)
+    def met(self) -> float:
+        ...
+
+    @property
+    @ledm.remap(lambda e: e.jets)
+    def jets(self) -> Iterable[jet]:
+        ...
+
+
+def test_save_and_load_decorated(tmp_path):
+    "The template replaced by its decorator is found again"
+    events = decorated_evt(ak.Array([{"missing_et": 1.0, "jets": [{"x": 1.0}]}]))
+    events.save(tmp_path / "events.parquet")
+    data = ledm.edm_from_parquet(decorated_evt, tmp_path / "events.parquet")
+
+    assert data.met.as_awkward().tolist() == [2.0]
+    assert data.jets.pt.as_awkward().tolist() == [[1.0]]
+    assert data.as_awkward().met.tolist() == [2.0]
+
+
+def test_explain_stored(events, tmp_path, capsys):
+    "Each attribute is a column - the filters were already applied"
+    events.save(tmp_path / "events.parquet")
+    ledm.edm_from_parquet(my_evt, tmp_path / "events.parquet").explain()
+    out = capsys.readouterr().out
+
+    assert "length of my_evt\n      len() = 3" in out
+    assert "my_evt.good_jets.pt\n      3 entries, " in out
+    assert "Awkward arrays: 3, " in out
+
+
+def test_load_not_a_template(tmp_path):
+    with pytest.raises(TypeError):
+        ledm.edm_from_parquet(lambda e: e, tmp_path / "events.parquet")
+
+
+def test_save_iterable(events, tmp_path):
+    events.good_jets.save(tmp_path / "jets.parquet")
+    data = ledm.edm_from_parquet(good_jet, tmp_path / "jets.parquet")
+
+    assert isinstance(data, ledm.layer_parquet.IterableStoredTemplateEDMLayer)
+    assert data.pt.as_awkward().tolist() == [[2.0], [], [3.0]]
+
+
+def test_save_stored(events, tmp_path):
+    "A reloaded layer can be saved again"
+    events.save(tmp_path / "events.parquet")
+    ledm.edm_from_parquet(my_evt, tmp_path / "events.parquet").save(tmp_path / "again.parquet")
+    data = ledm.edm_from_parquet(my_evt, tmp_path / "again.parquet")
+
+    assert data.met.as_awkward().tolist() == [2.0, 4.0, 6.0]
+
+
+def test_behavior_kept(tmp_path, ak_behavior):
+    class awk_my_behavior(ak.Array):
+        @property
+        def met2(self):
+            return self.met * 2
+
+    @ledm.add_awk_behavior(awk_my_behavior)
+    class evt_with_behavior:
+        @property
+        @ledm.remap(lambda e: e.missing_et)
+        def met(self) -> float:
+            ...
+
+    ledm.edm_awk(evt_with_behavior)(ak.Array([{"missing_et": 1.0}, {"missing_et": 2.0}])).save(
+        tmp_path / "events.parquet"
+    )
+    data = ledm.edm_from_parquet(evt_with_behavior, tmp_path / "events.parquet")
+
+    assert data.met2.as_awkward().tolist() == [2.0, 4.0]
+    assert ak.parameters(data.as_awkward())["__record__"] == ledm.util_types.class_behavior(
+        evt_with_behavior
+    )
+
+
+def test_wrong_template(events, tmp_path, caplog):
+    events.save(tmp_path / "events.parquet")
+    data = ledm.edm_from_parquet(jet, tmp_path / "events.parquet")
+
+    assert "my_evt, not" in caplog.text
+    assert len(data.ds.ds) == 3
@@ -0,0 +1,185 @@
+import ast
+import asyncio
+from typing import Any, Iterable, List, Optional
+
+import awkward as ak
+import layered_edm as ledm
+import pytest
+from func_adl import EventDataset
+from layered_edm.layer_samples import _rebase_query
+
+from .conftest import unparse
+
+
+class _sample_ds(EventDataset):
+    "Each dataset returns different numbers, and tracks the queries it is sent"
+
+    def __init__(self, offset: int, n_events: int = 3, delay: float = 0.02):
+        super().__init__()
+        self._offset = offset
+        self._n_events = n_events
+        self._delay = delay
+        self.queries: List[ast.AST] = []
+
+    async def execute_result_async(self, a: ast.AST, _title: Optional[str] = None) -> Any:
+        self.queries.append(a)
+        _sample_ds.in_flight += 1
+        _sample_ds.max_in_flight = max(_sample_ds.max_in_flight, _sample_ds.in_flight)
+        try:
+            await asyncio.sleep(self._delay)
+        finally:
+            _sample_ds.in_flight -= 1
+
+        values = [self._offset + i for i in range(self._n_events)]
+        select_lambda = a.args[0].args[1]
+        if isinstance(select_lambda.body, ast.Dict):
+            return ak.Array({k.value: values for k in select_lambda.body.keys})
+        return ak.Array(values)
+
+    in_flight = 0
+    max_in_flight = 0
+
+
+@pytest.fixture(autouse=True)
+def reset_in_flight():
+    _sample_ds.in_flight = 0
+    _sample_ds.max_in_flight = 0
+
+
+@ledm.edm_sx
+class _evt:
+    @property
+    @ledm.remap(lambda e: e.met_x())
+    def met_x(self) -> float:
+        ...
+
+    @property
+    @ledm.remap(lambda e: e.met_y())
+    def met_y(self) -> float:
+        ...
+
+
+def test_samples_by_name():
+    ds_a, ds_b = _sample_ds(0), _sample_ds(100)
+    samples = _evt({"a": ds_a, "b": ds_b})
+
+    r = samples.met_x.as_awkward()
+
+    assert samples.samples == ["a", "b"]
+    assert r["a"].tolist() == [0, 1, 2]
+    assert r["b"].tolist() == [100, 101, 102]
+    assert len(ds_a.queries) == 1
+    assert len(ds_b.queries) == 1
+    assert unparse(ds_b.queries[0].args[0]) == unparse(
+        "Select(EventDataset(), lambda e: e.met_x())"
+    )
+
+
+def test_samples_query_built_once():
+    "Only the base of the query changes from sample to sample"
+    ds_a, ds_b = _sample_ds(0), _sample_ds(100)
+    samples = _evt({"a": ds_a, "b": ds_b})
+    met_x = samples.met_x
+
+    met_x.as_awkward()
+
+    lambda_a = ds_a.queries[0].args[0].args[1]
+    lambda_b = ds_b.queries[0].args[0].args[1]
+    assert lambda_a is lambda_b
+    assert met_x.layer.ds.query_ast.args[0] is ds_a.query_ast
+
+
+def test_samples_concurrent():
+    datasets = {f"s{i}": _sample_ds(i) for i in range(5)}
+    samples = _evt(datasets)
+
+    samples.met_x.as_awkward()
+
+    assert _sample_ds.max_in_flight == 5
+
+
+def test_samples_concurrent_limit():
+    datasets = {f"s{i}": _sample_ds(i) for i in range(5)}
+    samples = _evt(datasets, max_concurrent=2)
+
+    samples.met_x.as_awkward()
+
+    assert _sample_ds.max_in_flight == 2
+    assert all(len(ds.queries) == 1 for ds in datasets.values())
+
+
+def test_samples_record():
+    ds_a, ds_b = _sample_ds(0), _sample_ds(100, n_events=2)
+    samples = _evt({"a": ds_a, "b": ds_b}, fuse_queries=True)
+
+    r = samples.as_awkward()
+
+    assert r["a"].met_y.tolist() == [0, 1, 2]
+    assert r["b"].met_x.tolist() == [100, 101]
+    assert len(ds_b.queries) == 1
+
+
+def test_samples_concatenate():
+    ds_a, ds_b = _sample_ds(0), _sample_ds(100, n_events=2)
+    samples = _evt({"a": ds_a, "b": ds_b})
+
+    r = samples.as_awkward(concatenate=True)
+
+    assert r.met_x.tolist() == [0, 1, 2, 100, 101]
+    assert r.sample_index.tolist() == [0, 0, 0, 1, 1]
+
+
+def test_samples_concatenate_values():
+    samples = _evt({"a": _sample_ds(0), "b": _sample_ds(100, n_events=1)})
+
+    r = samples.met_x.as_awkward(concatenate=True)
+
+    assert r.value.tolist() == [0, 1, 2, 100]
+    assert r.sample_index.tolist() == [0, 0, 0, 1]
+
+
+def test_samples_nested_template():
+    class jet:
+        @property
+        @ledm.remap(lambda j: j.pt())
+        def pt(self) -> float:
+            ...
+
+    @ledm.edm_sx
+    class evt:
+        @property
+        @ledm.remap(lambda e: e.Jets())
+        def jets(self) -> Iterable[jet]:
+            ...
+
+    ds_a, ds_b = _sample_ds(0), _sample_ds(100)
+    evt({"a": ds_a, "b": ds_b}).jets.pt.as_awkward()
+
+    assert unparse(ds_b.queries[0].args[0]) == unparse(
+        "Select(Select(EventDataset(), lambda e: e.Jets()), "
+        "lambda items: items.Select(lambda j: j.pt()))"
+    )
+
+
+def test_samples_async():
+    samples = _evt({"a": _sample_ds(0), "b": _sample_ds(100)})
+    r = asyncio.run(samples.met_y.as_awkward_async())
+    assert r["b"].tolist() == [100, 101, 102]
+
+
+def test_samples_cache_per_dataset():
+    cache = ledm.ResultCache()
+    ds_a, ds_b = _sample_ds(0), _sample_ds(100)
+    samples = _evt({"a": ds_a, "b": ds_b}, cache=cache, dataset_id={"a": "A", "b": "B"})
+
+    samples.met_x.as_awkward()
+    r = samples.met_x.as_awkward()
+
+    assert r["b"].tolist() == [100, 101, 102]
+    assert len(ds_a.queries) == 1
+    assert len(ds_b.queries) == 1
+
+
+def test_rebase_query_not_on_base():
+    with pytest.raises(ValueError):
+        _rebase_query(ast.parse("f(x)").body[0].value, ast.Name(id="y"), ast.Name(id="z"))
@@ -1,4 +1,6 @@
 import ast
+import asyncio
+import weakref
 from typing import Any, Iterable, Optional
 
 import awkward as ak
@@ -6,10 +8,23 @@ import layered_edm as ledm
 import pytest
 from func_adl import EventDataset, ObjectStream
 from layered_edm.layer_servicex import LEDMServiceX
+from layered_edm.util_ast import parse_remap_lambda
 
 from .conftest import unparse
 
 
+def _is_length_query(a: ast.AST) -> bool:
+    "Is this the query used to find the number of events (a `Select` of a constant)?"
+    select = a.args[0] if isinstance(a, ast.Call) and len(a.args) > 0 else None
+    return (
+        isinstance(select, ast.Call)
+        and isinstance(select.func, ast.Name)
+        and select.func.id == "Select"
+        and isinstance(select.args[1], ast.Lambda)
+        and isinstance(select.args[1].body, ast.Constant)
+    )
+
+
 @pytest.fixture
 def simple_ds() -> ObjectStream:
     "Returns the ast when value() is called"
@@ -40,12 +55,20 @@ def simple_awk_ds() -> ObjectStream:
         def __init__(self):
             super().__init__()
             self._count = 0
+            self._n_length_queries = 0
 
         @property
         def count(self) -> int:
             return self._count
 
+        @property
+        def n_length_queries(self) -> int:
+            return self._n_length_queries
+
         async def execute_result_async(self, a: ast.AST, _title: Optional[str] = None) -> Any:
+            if _is_length_query(a):
+                self._n_length_queries += 1
+                return ak.Array([0] * 10)
             self._count += 1
             return ak.Array([0, 1, 2, 3, 4, 5, 6, 7, 8, 9])
 
@@ -66,6 +89,9 @@ def simple_awk_ds_virtual() -> ObjectStream:
             return self._count
 
         async def execute_result_async(self, a: ast.AST, _title: Optional[str] = None) -> Any:
+            if _is_length_query(a):
+                return ak.Array([0] * 10)
+
             def generate():
                 self._count += 1
                 return ak.Array([0, 1, 2, 3, 4, 5, 6, 7, 8, 9])
@@ -89,6 +115,9 @@ def simple_awk_ds_virtual_concat() -> ObjectStream:
             return self._count
 
         async def execute_result_async(self, a: ast.AST, _title: Optional[str] = None) -> Any:
+            if _is_length_query(a):
+                return ak.Array([0] * 10)
+
             def generate():
                 self._count += 1
                 a1 = ak.Array([0, 1, 2, 3, 4])
@@ -100,6 +129,67 @@ def simple_awk_ds_virtual_concat() -> ObjectStream:
     return my_evt_ds()
 
 
+@pytest.fixture
+def simple_awk_record_ds() -> ObjectStream:
+    "Returns a dummy awkward record when value() is called with a dictionary query"
+
+    class my_evt_ds(EventDataset):
+        def __init__(self):
+            super().__init__()
+            self._count = 0
+            self._queries = []
+
+        @property
+        def count(self) -> int:
+            return self._count
+
+        @property
+        def queries(self):
+            return self._queries
+
+        async def execute_result_async(self, a: ast.AST, _title: Optional[str] = None) -> Any:
+            if _is_length_query(a):
+                return ak.Array([0] * 10)
+            self._count += 1
+            self._queries.append(a)
+            select_lambda = a.args[0].args[1]
+            if isinstance(select_lambda.body, ast.Dict):
+                return ak.Array(
+                    {
+                        k.value: [0, 1, 2, 3, 4, 5, 6, 7, 8, 9]
+                        for k in select_lambda.body.keys  # type: ignore
+                    }
+                )
+            return ak.Array([0, 1, 2, 3, 4, 5, 6, 7, 8, 9])
+
+    return my_evt_ds()
+
+
+class _slow_ds(EventDataset):
+    "Takes a while to answer each query, and tracks how many run at once"
+
+    def __init__(self, delay: float = 0.05):
+        super().__init__()
+        self._delay = delay
+        self.count = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def execute_result_async(self, a: ast.AST, _title: Optional[str] = None) -> Any:
+        self.count += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self._delay)
+        finally:
+            self.in_flight -= 1
+
+        select_lambda = a.args[0].args[1]
+        if isinstance(select_lambda.body, ast.Dict):
+            return ak.Array({k.value: list(range(10)) for k in select_lambda.body.keys})
+        return ak.Array(list(range(10)))
+
+
 def test_sx_empty_layer(simple_ds):
     @ledm.edm_sx
     class my_evt:
@@ -268,6 +358,23 @@ def test_sub_sx(simple_ds):
     assert unparse(r.value()) == unparse(expected.value())
 
 
+def test_sx_layers_are_slotted(simple_ds):
+    "Layers are created at each navigation step - they should not carry a `__dict__`"
+
+    @ledm.edm_sx
+    class my_evt:
+        @property
+        @ledm.remap(lambda e: e.subs())
+        def subs(self) -> Iterable[_test_sub_objs]:
+            ...
+
+    data = my_evt(simple_ds)
+    for layer in [data, data.ds, data.subs, data.subs.p]:
+        with pytest.raises(AttributeError):
+            object.__getattribute__(layer, "__dict__")
+        assert weakref.ref(layer)() is layer
+
+
 def test_simple_collection_as_awk(simple_awk_ds):
     "Test a collection of objects connected"
 
@@ -291,13 +398,14 @@ def test_simple_collection_as_awk(simple_awk_ds):
 
     data = my_evt(simple_awk_ds)
     awk_data = data.subs.as_awkward()
-    # 1 because the first item had to be generated
-    assert simple_awk_ds.count == 1
+    # Only the number of events is needed up front
+    assert simple_awk_ds.count == 0
+    assert simple_awk_ds.n_length_queries == 1
 
     assert len(awk_data.px) == 10
-    assert simple_awk_ds.count == 1
+    assert simple_awk_ds.count == 0
     assert len(awk_data.py) == 10
-    assert simple_awk_ds.count == 1
+    assert simple_awk_ds.count == 0
 
     assert isinstance(awk_data, ak.Array)
     t = ak.type(awk_data)
@@ -307,6 +415,34 @@ def test_simple_collection_as_awk(simple_awk_ds):
     assert simple_awk_ds.count == 2
 
 
+def test_nested_collections_length_once(simple_awk_ds):
+    "Nested templates have one entry per event - only the events are counted"
+
+    @ledm.edm_sx
+    class my_evt:
+        @property
+        @ledm.remap(lambda e: e.Jets())
+        def jets(self) -> Iterable[_fused_jet]:
+            ...
+
+        @property
+        @ledm.remap(lambda e: e.Electrons())
+        def eles(self) -> Iterable[_fused_jet]:
+            ...
+
+        @property
+        @ledm.remap(lambda e: e.met())
+        def met(self) -> float:
+            ...
+
+    awk_data = my_evt(simple_awk_ds).as_awkward()
+    assert len(awk_data.jets.px) == 10
+    assert len(awk_data.eles.py) == 10
+    assert len(awk_data.met) == 10
+
+    assert simple_awk_ds.n_length_queries == 1
+
+
 def test_simple_collection_with_behavior(simple_awk_ds):
     "A behavior can alter how a virtual array is materalized - make sure we work around it"
 
@@ -336,7 +472,7 @@ def test_simple_collection_with_behavior(simple_awk_ds):
 
     data = my_evt(simple_awk_ds)
     data.subs.as_awkward()
-    assert simple_awk_ds.count == 1
+    assert simple_awk_ds.count == 0
 
 
 def test_simple_collection_as_v_awk(simple_awk_ds_virtual_concat):
@@ -439,3 +575,797 @@ def test_two_layer_combo(simple_ds):
     assert unparse(r_ele.value()) == unparse(
         "Select(Select(EventDataset(), lambda e: e.electrons()), lambda items: items.Select(lambda e: e.ele_px()))"
     )
+
+
+class _fused_jet:
+    @property
+    @ledm.remap(lambda j: j.px())
+    def px(self) -> float:
+        ...
+
+    @property
+    @ledm.remap(lambda j: j.py())
+    def py(self) -> float:
+        ...
+
+
+def test_fused_record_as_awk(simple_awk_record_ds):
+    "All the leaf fields of a record should come back from a single query"
+
+    @ledm.edm_sx
+    class my_evt:
+        @property
+        @ledm.remap(lambda e: e.met_x())
+        def met_x(self) -> float:
+            ...
+
+        @property
+        @ledm.remap(lambda e: e.met_y())
+        def met_y(self) -> float:
+            ...
+
+    data = my_evt(simple_awk_record_ds, fuse_queries=True)
+    awk_data = data.as_awkward()
+
+    # All the fields are terminal, so they are fetched (together) right away
+    assert simple_awk_record_ds.count == 1
+
+    assert len(awk_data) == 10
+    assert awk_data.met_x.tolist() == list(range(10))
+    assert awk_data.met_y.tolist() == list(range(10))
+    assert simple_awk_record_ds.count == 1
+
+    assert unparse(simple_awk_record_ds.queries[0].args[0]) == unparse(
+        "Select(EventDataset(), lambda e: {'met_x': e.met_x(), 'met_y': e.met_y()})"
+    )
+
+
+def test_fused_collection_as_awk(simple_awk_record_ds):
+    "All the leaf fields of a collection should come back from a single query"
+
+    @ledm.edm_sx
+    class my_evt:
+        @property
+        @ledm.remap(lambda e: e.subs())
+        def subs(self) -> Iterable[_fused_jet]:
+            ...
+
+    data = my_evt(simple_awk_record_ds, fuse_queries=True)
+    awk_data = data.subs.as_awkward()
+
+    # One contiguous record array, rather than a virtual array per field
+    assert isinstance(awk_data.layout, ak.layout.RecordArray)
+    assert set(ak.fields(awk_data)) == {"px", "py"}
+    assert awk_data.px.tolist() == list(range(10))
+    assert awk_data.py.tolist() == list(range(10))
+    assert simple_awk_record_ds.count == 1
+
+    assert unparse(simple_awk_record_ds.queries[0].args[0]) == unparse(
+        "Select(Select(EventDataset(), lambda e: e.subs()), "
+        "lambda items: {'px': items.Select(lambda j: j.px()), "
+        "'py': items.Select(lambda j: j.py())})"
+    )
+
+
+def test_fused_record_hoists_shared(simple_awk_record_ds):
+    "Something used by several fields is calculated once"
+
+    @ledm.edm_sx
+    class my_evt:
+        @property
+        @ledm.remap(lambda e: e.MissingET().First().mpx())
+        def met_x(self) -> float:
+            ...
+
+        @property
+        @ledm.remap(lambda ev: ev.MissingET().First().mpy() / 1000.0)
+        def met_y(self) -> float:
+            ...
+
+        @property
+        @ledm.remap(lambda e: e.EventInfo().runNumber())
+        def run(self) -> float:
+            ...
+
+    data = my_evt(simple_awk_record_ds, fuse_queries=True)
+    assert data.as_awkward().met_y.tolist() == list(range(10))
+
+    assert unparse(simple_awk_record_ds.queries[0].args[0]) == unparse(
+        "Select(Select(EventDataset(), "
+        "lambda e: {'h0': e.MissingET().First(), 'h1': e.EventInfo().runNumber()}), "
+        "lambda e: {'met_x': e.h0.mpx(), 'met_y': e.h0.mpy() / 1000.0, 'run': e.h1})"
+    )
+
+
+def test_fused_record_no_hoist_arg_used(simple_awk_record_ds):
+    "If a field uses the event itself, there is nothing to hoist it into"
+
+    class my_evt:
+        @property
+        @ledm.remap(lambda e: e.MissingET().First().mpx())
+        def met_x(self) -> float:
+            ...
+
+        @property
+        @ledm.remap(lambda e: e.MissingET().First().mpy() + hash(e))
+        def met_y(self) -> float:
+            ...
+
+    fused = LEDMServiceX(simple_awk_record_ds, fuse_queries=True).single_item_record_map(
+        {"met_x": my_evt.met_x.fget.__remap_func, "met_y": my_evt.met_y.fget.__remap_func}
+    )
+    assert unparse(fused.query_ast) == unparse(
+        "Select(EventDataset(), "
+        "lambda e: {'met_x': e.MissingET().First().mpx(), "
+        "'met_y': e.MissingET().First().mpy() + hash(e)})"
+    )
+
+
+def test_fused_collection_hoists_shared(simple_awk_record_ds):
+    class jet:
+        @property
+        @ledm.remap(lambda j: j.p4().pt())
+        def pt(self) -> float:
+            ...
+
+        @property
+        @ledm.remap(lambda j: j.p4().eta())
+        def eta(self) -> float:
+            ...
+
+    @ledm.edm_sx
+    class my_evt:
+        @property
+        @ledm.remap(lambda e: e.Jets())
+        def jets(self) -> Iterable[jet]:
+            ...
+
+    data = my_evt(simple_awk_record_ds, fuse_queries=True)
+    data.jets.as_awkward().pt.tolist()
+
+    assert unparse(simple_awk_record_ds.queries[0].args[0]) == unparse(
+        "Select(Select(Select(EventDataset(), lambda e: e.Jets()), "
+        "lambda items: items.Select(lambda x: {'h0': x.p4()})), "
+        "lambda items: {'eta': items.Select(lambda x: x.h0.eta()), "
+        "'pt': items.Select(lambda x: x.h0.pt())})"
+    )
+
+
+def test_fused_record_no_hoist_bound_method(simple_awk_record_ds):
+    "The collection is hoisted - not the `Select` method called on it"
+
+    class my_evt:
+        @property
+        @ledm.remap(lambda e: e.Jets().Select(lambda j: j.pt()).Sum())
+        def sum_pt(self) -> float:
+            ...
+
+        @property
+        @ledm.remap(lambda e: e.Jets().Select(lambda j: j.eta()).Max())
+        def max_eta(self) -> float:
+            ...
+
+        @property
+        @ledm.remap(lambda e: e.Jets().Where(lambda j: j.pt() > 30).Count())
+        def n_jets(self) -> float:
+            ...
+
+        @property
+        @ledm.remap(lambda e: e.met())
+        def met(self) -> float:
+            ...
+
+    fused = LEDMServiceX(simple_awk_record_ds, fuse_queries=True).single_item_record_map(
+        {n: getattr(my_evt, n).fget.__remap_func for n in ["sum_pt", "max_eta", "n_jets", "met"]}
+    )
+    assert unparse(fused.query_ast) == unparse(
+        "Select(Select(EventDataset(), lambda e: {'h0': e.Jets(), 'h1': e.met()}), "
+        "lambda e: {'sum_pt': e.h0.Select(lambda j: j.pt()).Sum(), "
+        "'max_eta': e.h0.Select(lambda j: j.eta()).Max(), "
+        "'n_jets': e.h0.Where(lambda j: j.pt() > 30).Count(), 'met': e.h1})"
+    )
+
+
+def test_fused_record_no_hoist_shadowed(simple_awk_record_ds):
+    "Inside a lambda that re-binds the event's name, the name is not the event"
+
+    class my_evt:
+        @property
+        @ledm.remap(lambda e: e.Electrons().Select(lambda e: e.pt()))
+        def ele_pt(self) -> float:
+            ...
+
+        @property
+        @ledm.remap(lambda e: e.Electrons().Count())
+        def n_ele(self) -> float:
+            ...
+
+        @property
+        @ledm.remap(lambda e: e.pt())
+        def pt(self) -> float:
+            ...
+
+    fused = LEDMServiceX(simple_awk_record_ds, fuse_queries=True).single_item_record_map(
+        {n: getattr(my_evt, n).fget.__remap_func for n in ["ele_pt", "n_ele", "pt"]}
+    )
+    assert unparse(fused.query_ast) == unparse(
+        "Select(Select(EventDataset(), lambda e: {'h0': e.Electrons(), 'h1': e.pt()}), "
+        "lambda e: {'ele_pt': e.h0.Select(lambda e: e.pt()), 'n_ele': e.h0.Count(), "
+        "'pt': e.h1})"
+    )
+
+
+def test_sibling_queries_share_prefix(simple_ds):
+    "The queries of `jets.pt` and `jets.eta` are built on the same `e.Jets()` node"
+
+    @ledm.edm_sx
+    class my_evt:
+        @property
+        @ledm.remap(lambda e: e.Jets())
+        def jets(self) -> Iterable[_fused_jet]:
+            ...
+
+    data = my_evt(simple_ds)
+    px = data.jets.px.ds.query_ast
+    py = data.jets.py.ds.query_ast
+
+    assert px.args[0] is py.args[0]
+    assert data.jets.px.graph.common_prefixes([px, py]) == [px.args[0]]
+
+
+def test_fused_rename_arg_no_capture(simple_awk_record_ds):
+    "Fusing must not let one lambda argument capture another variable"
+
+    @ledm.edm_sx
+    class my_evt:
+        @property
+        @ledm.remap(lambda e: e.jets().Select(lambda j: j.pt()))
+        def jet_pt(self) -> float:
+            ...
+
+        @property
+        @ledm.remap(lambda ev: ev.tracks().Select(lambda e: e.pt() + ev.x()))
+        def trk_pt(self) -> float:
+            ...
+
+    data = my_evt(simple_awk_record_ds, fuse_queries=True)
+    data.as_awkward().jet_pt.tolist()
+
+    assert unparse(simple_awk_record_ds.queries[0].args[0]) == unparse(
+        "Select(EventDataset(), lambda e1: {'jet_pt': e1.jets().Select(lambda j: j.pt()), "
+        "'trk_pt': e1.tracks().Select(lambda e: e.pt() + e1.x())})"
+    )
+
+
+def test_not_fused_by_default(simple_awk_record_ds):
+    "Without asking for fusion, each field is its own query"
+
+    @ledm.edm_sx
+    class my_evt:
+        @property
+        @ledm.remap(lambda e: e.subs())
+        def subs(self) -> Iterable[_fused_jet]:
+            ...
+
+    data = my_evt(simple_awk_record_ds)
+    awk_data = data.subs.as_awkward()
+    awk_data.px.tolist()
+    awk_data.py.tolist()
+    assert simple_awk_record_ds.count == 2
+
+
+def test_cache_repeat_query(simple_awk_ds):
+    "The second time we ask for the same data it should come from the cache"
+
+    @ledm.edm_sx
+    class my_evt:
+        @property
+        @ledm.remap(lambda e: e.MissingET().First())
+        def met(self) -> float:
+            ...
+
+    data = my_evt(simple_awk_ds, cache=ledm.ResultCache(), dataset_id="zee")
+    r1 = data.met.as_awkward()
+    r2 = data.met.as_awkward()
+
+    assert simple_awk_ds.count == 1
+    assert r1.tolist() == r2.tolist()
+
+
+def test_cache_on_disk_with_dataset_id(simple_awk_ds, tmp_path):
+    "A new session with the same dataset id can use the cached result"
+
+    @ledm.edm_sx
+    class my_evt:
+        @property
+        @ledm.remap(lambda e: e.MissingET().First())
+        def met(self) -> float:
+            ...
+
+    my_evt(
+        simple_awk_ds, cache=ledm.ResultCache(cache_dir=tmp_path), dataset_id="zee"
+    ).met.as_awkward()
+    r = my_evt(
+        simple_awk_ds, cache=ledm.ResultCache(cache_dir=tmp_path), dataset_id="zee"
+    ).met.as_awkward()
+
+    assert simple_awk_ds.count == 1
+    assert len(r) == 10
+
+
+def test_cache_different_datasets(simple_awk_ds):
+    "Same query on a different dataset should not hit the cache"
+
+    @ledm.edm_sx
+    class my_evt:
+        @property
+        @ledm.remap(lambda e: e.MissingET().First())
+        def met(self) -> float:
+            ...
+
+    cache = ledm.ResultCache()
+    my_evt(simple_awk_ds, cache=cache, dataset_id="zee").met.as_awkward()
+    my_evt(simple_awk_ds, cache=cache, dataset_id="zmumu").met.as_awkward()
+
+    assert simple_awk_ds.count == 2
+
+
+def test_cache_needs_dataset_id(simple_awk_ds):
+    "The dataset object can't identify itself in the cache keys"
+
+    @ledm.edm_sx
+    class my_evt:
+        @property
+        @ledm.remap(lambda e: e.MissingET().First())
+        def met(self) -> float:
+            ...
+
+    with pytest.raises(ValueError):
+        my_evt(simple_awk_ds, cache=ledm.ResultCache())
+    with pytest.raises(ValueError):
+        my_evt({"zee": simple_awk_ds}, cache=ledm.ResultCache(), dataset_id={"zmumu": "zmumu"})
+
+
+def test_cache_without_dataset_id_not_used(simple_awk_ds):
+    "A layer built directly with a cache and no dataset id does not cache anything"
+    layer = LEDMServiceX(simple_awk_ds.Select(lambda e: e.met()), cache=ledm.ResultCache())
+    layer.as_awkward()
+    layer.as_awkward()
+    assert simple_awk_ds.count == 2
+
+
+def test_record_as_awk_is_lazy(simple_awk_ds):
+    "Turning a record into awkward should not fetch any of its fields"
+
+    @ledm.edm_sx
+    class my_evt:
+        @property
+        @ledm.remap(lambda e: e.met_x())
+        def met_x(self) -> float:
+            ...
+
+        @property
+        @ledm.remap(lambda e: e.met_y())
+        def met_y(self) -> float:
+            ...
+
+    data = my_evt(simple_awk_ds)
+    awk_data = data.as_awkward()
+
+    assert len(awk_data) == 10
+    assert simple_awk_ds.count == 0
+
+    assert awk_data.met_x.tolist() == list(range(10))
+    assert simple_awk_ds.count == 1
+
+
+def test_array_length(simple_awk_ds):
+    "The count query is used to find the length"
+
+    @ledm.edm_sx
+    class my_evt:
+        @property
+        @ledm.remap(lambda e: e.met())
+        def met(self) -> float:
+            ...
+
+    data = my_evt(simple_awk_ds)
+    assert data.array_length() == 10
+    assert data.met.array_length() == 10
+    assert simple_awk_ds.count == 0
+    assert simple_awk_ds.n_length_queries == 2
+
+
+def test_filter_event_level(simple_ds):
+    "An event filter becomes a Where in the query"
+
+    @ledm.edm_sx
+    @ledm.filter(lambda e: e.met() > 50.0)
+    class my_evt:
+        @property
+        @ledm.remap(lambda e: e.met())
+        def met(self) -> float:
+            ...
+
+    data = my_evt(simple_ds)
+    r = data.met.ds
+
+    assert unparse(r.value()) == unparse(
+        "Select(Where(EventDataset(), lambda e: e.met() > 50.0), lambda e: e.met())"
+    )
+
+
+def test_filter_multiple_in_order(simple_ds):
+    "Multiple filters are applied top to bottom"
+
+    @ledm.edm_sx
+    @ledm.filter(lambda e: e.met() > 50.0)
+    @ledm.filter(lambda e: e.njets() > 2)
+    class my_evt:
+        @property
+        @ledm.remap(lambda e: e.met())
+        def met(self) -> float:
+            ...
+
+    data = my_evt(simple_ds)
+    r = data.met.ds
+
+    assert unparse(r.value()) == unparse(
+        "Select(Where(Where(EventDataset(), lambda e: e.met() > 50.0), lambda e: e.njets() > 2), "
+        "lambda e: e.met())"
+    )
+
+
+def test_filter_on_nested_template(simple_ds):
+    "A filtered template wrapping another template"
+
+    @ledm.edm_sx
+    class my_evt:
+        @property
+        @ledm.remap(lambda e: e.met())
+        def met(self) -> float:
+            ...
+
+    @ledm.edm_sx
+    @ledm.filter(lambda e: e.met() > 50.0)
+    class preselection:
+        @property
+        @ledm.remap(lambda e: e.met() * 2)
+        def met2(self) -> float:
+            ...
+
+    presel = preselection(my_evt(simple_ds))
+
+    assert unparse(presel.met2.ds.value()) == unparse(
+        "Select(Where(EventDataset(), lambda e: e.met() > 50.0), lambda e: e.met() * 2)"
+    )
+    assert unparse(presel.met.ds.value()) == unparse("Select(EventDataset(), lambda e: e.met())")
+
+
+def test_filter_count_query():
+    "The number of events is counted after the filter"
+
+    class my_evt_ds(EventDataset):
+        async def execute_result_async(self, a: ast.AST, _title: Optional[str] = None) -> Any:
+            assert unparse(a.args[0]) == unparse(
+                "Select(Where(EventDataset(), lambda e: e.met() > 50.0), lambda e: 0)"
+            )
+            return ak.Array([0] * 5)
+
+    @ledm.edm_sx
+    @ledm.filter(lambda e: e.met() > 50.0)
+    class my_evt:
+        @property
+        @ledm.remap(lambda e: e.met())
+        def met(self) -> float:
+            ...
+
+    assert my_evt(my_evt_ds()).array_length() == 5
+
+
+class _filter_jet:
+    @property
+    @ledm.remap(lambda j: j.pt())
+    def pt(self) -> float:
+        ...
+
+
+@ledm.filter(lambda j: j.pt() > 30000.0)
+class _filter_good_jet(_filter_jet):
+    ...
+
+
+def test_filter_object_level(simple_ds):
+    "A filter on a collection element template becomes an inner Where"
+
+    @ledm.edm_sx
+    class my_evt:
+        @property
+        @ledm.remap(lambda e: e.Jets())
+        def jets(self) -> Iterable[_filter_jet]:
+            ...
+
+        @property
+        @ledm.remap(lambda e: e.Jets())
+        def good_jets(self) -> Iterable[_filter_good_jet]:
+            ...
+
+    data = my_evt(simple_ds)
+
+    assert unparse(data.jets.pt.ds.value()) == unparse(
+        "Select(Select(EventDataset(), lambda e: e.Jets()), "
+        "lambda items: items.Select(lambda j: j.pt()))"
+    )
+    assert unparse(data.good_jets.pt.ds.value()) == unparse(
+        "Select(Select(Select(EventDataset(), lambda e: e.Jets()), "
+        "lambda items: items.Where(lambda j: j.pt() > 30000.0)), "
+        "lambda items: items.Select(lambda j: j.pt()))"
+    )
+
+
+def test_iter_chunks_partitioned():
+    "A backend result that is partitioned (e.g. by file) is visited one partition at a time"
+
+    class my_evt_ds(EventDataset):
+        async def execute_result_async(self, a: ast.AST, _title: Optional[str] = None) -> Any:
+            return ak.repartition(ak.Array(list(range(10))), 4)
+
+    @ledm.edm_sx
+    class my_evt:
+        @property
+        @ledm.remap(lambda e: e.met())
+        def met(self) -> float:
+            ...
+
+    chunks = list(my_evt(my_evt_ds()).met.iter_chunks(3))
+
+    assert [c.tolist() for c in chunks] == [[0, 1, 2], [3], [4, 5, 6], [7], [8, 9]]
+
+
+class _async_evt:
+    @property
+    @ledm.remap(lambda e: e.met_x())
+    def met_x(self) -> float:
+        ...
+
+    @property
+    @ledm.remap(lambda e: e.met_y())
+    def met_y(self) -> float:
+        ...
+
+
+def test_as_awk_async_record():
+    "All the queries of a record are in flight at once"
+    ds = _slow_ds()
+    data = ledm.edm_sx(_async_evt)(ds)
+
+    awk_data = asyncio.run(data.as_awkward_async())
+
+    assert awk_data.met_x.tolist() == list(range(10))
+    assert awk_data.met_y.tolist() == list(range(10))
+    assert ds.count == 2
+    assert ds.max_in_flight == 2
+
+
+def test_as_awk_async_fused():
+    ds = _slow_ds()
+    data = ledm.edm_sx(_async_evt)(ds, fuse_queries=True)
+
+    awk_data = asyncio.run(data.as_awkward_async())
+
+    assert awk_data.met_y.tolist() == list(range(10))
+    assert ds.count == 1
+
+
+def test_gather_awkward_datasets():
+    "Queries against different datasets run at the same time"
+    ds1, ds2 = _slow_ds(), _slow_ds()
+    to_sx = ledm.edm_sx(_async_evt)
+
+    async def run():
+        return await ledm.gather_awkward(to_sx(ds1).met_x, to_sx(ds2).met_y)
+
+    r1, r2 = asyncio.run(run())
+
+    assert r1.tolist() == list(range(10))
+    assert r2.tolist() == list(range(10))
+    assert (ds1.max_in_flight, ds2.max_in_flight) == (1, 1)
+
+
+def test_gather_awkward_concurrent():
+    "Every query of every layer is submitted before any of them finish"
+    ds = _slow_ds(delay=0.2)
+    data = ledm.edm_sx(_async_evt)(ds)
+
+    async def run():
+        return await ledm.gather_awkward(data.met_x, data.met_y, data)
+
+    asyncio.run(run())
+
+    assert ds.count == 4
+    assert ds.max_in_flight == 4
+
+
+def test_as_awk_async_cache(simple_awk_ds):
+    cache = ledm.ResultCache()
+    data = ledm.edm_sx(_async_evt)(simple_awk_ds, cache=cache, dataset_id="zee")
+
+    asyncio.run(data.met_x.as_awkward_async())
+    asyncio.run(data.met_x.as_awkward_async())
+    assert simple_awk_ds.count == 1
+    assert data.met_x.as_awkward().tolist() == list(range(10))
+    assert simple_awk_ds.count == 1
+
+
+def test_awk_over_sx_converts_once(simple_awk_record_ds):
+    "An awkward template over a ServiceX one fetches the data once for all fields"
+
+    @ledm.edm_awk
+    class my_awk_evt:
+        @property
+        @ledm.remap(lambda e: e.met_x + e.met_y)
+        def met_sum(self) -> float:
+            ...
+
+        @property
+        @ledm.remap(lambda e: e.met_x - e.met_y)
+        def met_diff(self) -> float:
+            ...
+
+    data = my_awk_evt(ledm.edm_sx(_async_evt)(simple_awk_record_ds, fuse_queries=True))
+
+    assert data.met_sum.as_awkward().tolist() == [2 * i for i in range(10)]
+    assert data.met_diff.as_awkward().tolist() == [0] * 10
+    assert simple_awk_record_ds.count == 1
+
+
+def test_awk_over_sx_one_field_one_query(simple_awk_ds):
+    "Reading one field runs one query - the length comes from the field"
+
+    @ledm.edm_awk
+    class my_awk_evt:
+        @property
+        @ledm.remap(lambda e: e.met_x * 2)
+        def met_x2(self) -> float:
+            ...
+
+    data = my_awk_evt(ledm.edm_sx(_async_evt)(simple_awk_ds))
+
+    assert data.met_x2.as_awkward().tolist() == [2 * i for i in range(10)]
+    assert simple_awk_ds.count == 1
+    assert simple_awk_ds.n_length_queries == 0
+
+
+def test_awk_over_sx_field_fetched_once(simple_awk_ds):
+    @ledm.edm_awk
+    class my_awk_evt:
+        @property
+        @ledm.remap(lambda e: e.met_x * 2)
+        def met_x2(self) -> float:
+            ...
+
+        @property
+        @ledm.remap(lambda e: e.met_x * 3)
+        def met_x3(self) -> float:
+            ...
+
+    data = my_awk_evt(ledm.edm_sx(_async_evt)(simple_awk_ds))
+
+    assert data.met_x2.as_awkward().tolist() == [2 * i for i in range(10)]
+    assert data.met_x3.as_awkward().tolist() == [3 * i for i in range(10)]
+    assert simple_awk_ds.count == 1
+
+
+class _explain_evt:
+    @property
+    @ledm.remap(lambda e: e.met_x())
+    def met_x(self) -> float:
+        ...
+
+    @property
+    @ledm.remap(lambda e: e.met_y())
+    def met_y(self) -> float:
+        ...
+
+    @property
+    @ledm.remap(lambda e: e.subs())
+    def subs(self) -> Iterable[_fused_jet]:
+        ...
+
+
+def test_explain(simple_awk_record_ds, capsys, mocker):
+    "The plan is printed, and nothing is run"
+    run = mocker.patch.object(type(simple_awk_record_ds), "execute_result_async")
+
+    ledm.edm_sx(_explain_evt)(simple_awk_record_ds).explain()
+    out = capsys.readouterr().out
+
+    run.assert_not_called()
+    assert "Plan for _explain_evt: 5 operations" in out
+    assert "length of _explain_evt\n      Select(EventDataset(), lambda e: 0)" in out
+    assert "_explain_evt.met_x  (lambda e: e.met_x())" in out
+    assert "_explain_evt.subs.px  (lambda j: j.px())" in out
+    assert (
+        "Select(Select(EventDataset(), lambda e: e.subs()), "
+        "lambda items: items.Select(lambda j: j.py()))"
+    ) in out
+    # The collection has one entry per event, so only the events are counted
+    assert "length of _explain_evt.subs" not in out
+    assert "ServiceX transforms: 5 to run, 0 cached" in out
+    assert "Shared sub-queries:\n  Select(EventDataset(), lambda e: e.subs())" in out
+
+
+def test_explain_fused(simple_awk_record_ds, capsys):
+    ledm.edm_sx(_explain_evt)(simple_awk_record_ds, fuse_queries=True).explain()
+    out = capsys.readouterr().out
+
+    assert "_explain_evt.met_x, _explain_evt.met_y\n" in out
+    assert "Select(EventDataset(), lambda e: {'met_x': e.met_x(), 'met_y': e.met_y()})" in out
+    assert "_explain_evt.subs.px, _explain_evt.subs.py\n" in out
+    # The collection's fields are all fetched together, so its length is not needed
+    assert "ServiceX transforms: 3 to run, 0 cached" in out
+
+
+def test_explain_cached(simple_awk_record_ds, capsys):
+    data = ledm.edm_sx(_explain_evt)(
+        simple_awk_record_ds, cache=ledm.ResultCache(), dataset_id="zee"
+    )
+    data.met_x.as_awkward()
+    data.explain()
+    out = capsys.readouterr().out
+
+    assert "Select(EventDataset(), lambda e: e.met_x())  [cached]" in out
+    assert "ServiceX transforms: 4 to run, 1 cached" in out
+
+
+class _strict_ds(EventDataset):
+    "Like a real ServiceX backend: only runs queries that return data"
+
+    async def execute_result_async(self, a: ast.AST, _title: Optional[str] = None) -> Any:
+        if not (
+            isinstance(a, ast.Call)
+            and isinstance(a.func, ast.Name)
+            and a.func.id
+            in ("ResultTTree", "ResultParquet", "ResultPandasDF", "ResultAwkwardArray")
+        ):
+            raise ValueError(f"Can't run {unparse(a)}")
+        return ak.Array([0, 1, 2, 3, 4, 5, 6, 7, 8, 9])
+
+
+def test_length_strict_backend():
+    "The length of a record is found with a query the backend can run"
+
+    @ledm.edm_sx
+    class my_evt:
+        @property
+        @ledm.remap(lambda e: e.met())
+        def met(self) -> float:
+            ...
+
+        @property
+        @ledm.remap(lambda e: e.jets())
+        def jets(self) -> Iterable[_fused_jet]:
+            ...
+
+    data = my_evt(_strict_ds())
+    assert data.array_length() == 10
+
+    awk_data = data.as_awkward()
+    assert len(awk_data) == 10
+    assert awk_data.met.tolist() == list(range(10))
+
+
+def test_parsed_remap_not_modified(simple_ds):
+    "func_adl rewrites the lambdas it is given - the cached ones must not change"
+
+    class my_evt:
+        @property
+        @ledm.remap(lambda e: [j.pt() for j in e.Jets()])
+        def jet_pt(self) -> float:
+            ...
+
+    ledm.edm_sx(my_evt)(simple_ds).jet_pt.as_sx()
+
+    assert unparse(parse_remap_lambda(my_evt.jet_pt.fget.__remap_func)) == unparse(
+        "lambda e: [j.pt() for j in e.Jets()]"
+    )
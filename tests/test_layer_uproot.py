@@ -0,0 +1,117 @@
+from typing import Iterable
+
+import awkward as ak
+import numpy as np
+import pytest
+import layered_edm as ledm
+import uproot
+from uproot.behaviors.TBranch import TBranch
+
+
+def _write_ntuple(f_name: str):
+    "Write a small flat ntuple"
+    with uproot.recreate(f_name) as f:
+        f["mini"] = {
+            "met": np.arange(10.0),
+            "jet_pt": ak.Array([[float(i)] * (i % 3) for i in range(10)]),
+            "junk": np.arange(10),
+        }
+
+
+@pytest.fixture
+def root_file(tmp_path) -> str:
+    f_name = str(tmp_path / "ntuple.root")
+    _write_ntuple(f_name)
+    return f_name
+
+
+@pytest.fixture
+def root_file_2(tmp_path) -> str:
+    f_name = str(tmp_path / "ntuple_2.root")
+    _write_ntuple(f_name)
+    return f_name
+
+
+@pytest.fixture
+def branch_reads(mocker):
+    "Spy on the branches that are read"
+    return mocker.spy(TBranch, "array")
+
+
+def _read_branches(spy) -> set:
+    return {c.args[0].name for c in spy.call_args_list}
+
+
+class _jet:
+    @property
+    @ledm.remap(lambda j: j)
+    def pt(self) -> float:
+        ...
+
+
+@ledm.edm_uproot
+class _evt:
+    @property
+    @ledm.remap(lambda e: e.met)
+    def met(self) -> float:
+        ...
+
+    @property
+    @ledm.remap(lambda e: e.jet_pt)
+    def jets(self) -> Iterable[_jet]:
+        ...
+
+
+def test_uproot_single_file(root_file, branch_reads):
+    data = _evt(root_file, tree_name="mini")
+
+    assert data.met.as_awkward().tolist() == list(np.arange(10.0))
+    assert _read_branches(branch_reads) == {"met"}
+
+
+def test_uproot_file_tree_spec(root_file, branch_reads):
+    data = _evt(f"{root_file}:mini")
+    assert data.array_length() == 10
+    assert _read_branches(branch_reads) == set()
+
+
+def test_uproot_multiple_files(root_file, root_file_2):
+    data = _evt([root_file, root_file_2], tree_name="mini")
+    assert len(data.met.as_awkward()) == 20
+
+
+def test_uproot_entry_range(root_file, root_file_2, branch_reads):
+    data = _evt([root_file, root_file_2], tree_name="mini", entry_start=8, entry_stop=12)
+
+    assert data.met.as_awkward().tolist() == [8.0, 9.0, 0.0, 1.0]
+    assert _read_branches(branch_reads) == {"met"}
+
+
+def test_uproot_collection(root_file, branch_reads):
+    data = _evt(root_file, tree_name="mini")
+
+    assert data.jets.pt.as_awkward().tolist()[:3] == [[], [1.0], [2.0, 2.0]]
+    assert "junk" not in _read_branches(branch_reads)
+    assert "met" not in _read_branches(branch_reads)
+
+
+def test_uproot_filter_name(root_file):
+    data = _evt(root_file, tree_name="mini", filter_name=["met"])
+    assert ak.fields(data.ds.ds) == ["met"]
+
+
+def test_uproot_prune_branches(root_file):
+    data = _evt(root_file, tree_name="mini", prune_branches=True)
+    assert set(ak.fields(data.ds.ds)) == {"met", "jet_pt"}
+
+
+def test_uproot_func_adl_style(root_file):
+    @ledm.edm_uproot
+    class sx_evt:
+        @property
+        @ledm.remap(lambda e: e.jet_pt().Where(lambda j: j > 1.0).Count())
+        def n_jets(self) -> int:
+            ...
+
+    data = sx_evt(root_file, tree_name="mini", func_adl_style=True)
+    assert data.n_jets.as_awkward().tolist()[:6] == [0, 0, 2, 0, 1, 2]
@@ -0,0 +1,172 @@
+import ast
+import sys
+from typing import Callable
+
+import layered_edm as ledm
+from layered_edm.util_ast import (
+    ExpressionGraph,
+    canonical_unparse,
+    clone_ast,
+    free_names,
+    parse_remap_lambda,
+)
+
+from .conftest import unparse
+
+
+def _remap_func(decorator: Callable) -> Callable:
+    "Return the lambda captured by a `remap` decorator"
+
+    def prop():
+        ...
+
+    return getattr(decorator(prop), "__remap_func")
+
+
+def test_clone_ast_is_copy():
+    a = ast.parse("lambda e: e.jets()").body[0].value  # type: ignore
+    setattr(a, "_extra", "hi")
+    c = clone_ast(a)
+
+    assert c is not a
+    assert c.body is not a.body
+    assert unparse(c) == unparse(a)
+    assert not hasattr(c, "_extra")
+
+
+def test_canonical_unparse_shadowing():
+    a1 = ast.parse("lambda e: e.jets().Select(lambda e: e.pt())").body[0].value  # type: ignore
+    a2 = ast.parse("lambda x: x.jets().Select(lambda j: j.pt())").body[0].value  # type: ignore
+    assert canonical_unparse(a1) == canonical_unparse(a2)
+
+
+def test_parse_remap_lambda_cached(mocker):
+    spy = mocker.spy(__import__("layered_edm.util_ast").util_ast, "parse_as_ast")
+
+    f = _remap_func(ledm.remap(lambda j: j.pt()))
+    a1 = parse_remap_lambda(f)
+    a2 = parse_remap_lambda(f)
+
+    assert a1 is a2
+    assert spy.call_count == 1
+    assert unparse(a1) == unparse("lambda j: j.pt()")
+
+
+def test_parse_remap_lambda_closure_change():
+    def make_cut():
+        cut = 30
+
+        def set_cut(v):
+            nonlocal cut
+            cut = v
+
+        return _remap_func(ledm.remap(lambda j: j.pt() > cut)), set_cut
+
+    f, set_cut = make_cut()
+    a1 = parse_remap_lambda(f)
+    set_cut(40)
+    a2 = parse_remap_lambda(f)
+
+    assert unparse(a1) == unparse("lambda j: j.pt() > 30")
+    assert unparse(a2) == unparse("lambda j: j.pt() > 40")
+
+
+def _expr(text: str) -> ast.AST:
+    return ast.parse(text).body[0].value  # type: ignore
+
+
+def test_expression_graph_shares_nodes():
+    graph = ExpressionGraph()
+    q1 = graph.intern(_expr("Select(Select(ds, lambda e: e.Jets()), lambda j: j.pt())"))
+    q2 = graph.intern(_expr("Select(Select(ds, lambda e: e.Jets()), lambda j: j.eta())"))
+
+    assert q1.args[0] is q2.args[0]
+    assert q1 is not q2
+    assert graph.key(q1.args[0]) == graph.key(_expr("Select(ds, lambda e: e.Jets())"))
+
+
+def test_expression_graph_lambda_arg_names():
+    graph = ExpressionGraph()
+    l1 = _expr("lambda j: j.pt()")
+    l2 = _expr("lambda jet: jet.pt()")
+
+    assert graph.key(l1) == graph.key(l2)
+    assert graph.key(l1.body) != graph.key(l2.body)
+    assert graph.intern(l1) is graph.intern(l2)
+
+
+def test_expression_graph_nested_lambdas():
+    graph = ExpressionGraph()
+    l1 = _expr("lambda e: e.jets().Select(lambda j: j.pt() + e.x())")
+    l2 = _expr("lambda e: e.jets().Select(lambda e1: e1.pt() + e.x())")
+    l3 = _expr("lambda e: e.jets().Select(lambda e: e.pt() + e.x())")
+
+    assert graph.key(l1) == graph.key(l2)
+    assert graph.key(l1) != graph.key(l3)
+
+
+def test_expression_graph_constants():
+    graph = ExpressionGraph()
+    assert graph.key(_expr("f(1)")) != graph.key(_expr("f(1.0)"))
+    assert graph.key(_expr("f(1)")) != graph.key(_expr("f(True)"))
+    assert graph.key(_expr("f('1')")) != graph.key(_expr("f(1)"))
+
+
+def test_expression_graph_intern_does_not_modify():
+    graph = ExpressionGraph()
+    graph.intern(_expr("g(f(x))"))
+    a = _expr("h(f(x))")
+    f_x = a.args[0]
+
+    r = graph.intern(a)
+
+    assert a.args[0] is f_x
+    assert r.args[0] is not f_x
+    assert unparse(r) == unparse("h(f(x))")
+
+
+def test_expression_graph_keeps_dataset_root():
+    graph = ExpressionGraph()
+    root = _expr("EventDataset()")
+    setattr(root, "_eds_object", object())
+    q = graph.intern(
+        ast.Call(func=ast.Name(id="Select", ctx=ast.Load()), args=[root], keywords=[])
+    )
+
+    assert q.args[0] is root
+    other = _expr("EventDataset()")
+    setattr(other, "_eds_object", object())
+    assert graph.key(root) != graph.key(other)
+
+
+def test_expression_graph_common_prefixes():
+    graph = ExpressionGraph()
+    jets = "Select(Select(ds(), lambda e: e.Jets()), lambda j: j.{0}())"
+    prefixes = graph.common_prefixes(
+        [
+            _expr(jets.format("pt")),
+            _expr(jets.format("eta")),
+            _expr("Select(ds(), lambda e: e.met())"),
+        ]
+    )
+
+    assert [unparse(p) for p in prefixes] == [unparse("Select(ds(), lambda e: e.Jets())")]
+
+
+def test_free_names():
+    assert free_names(_expr("lambda e: e.jets().Select(lambda j: j.pt() + e.x() + y)")) == {"y"}
+    assert free_names(_expr("e.jets().Select(lambda j: j.pt())")) == {"e"}
+
+
+_CUT = 30.0
+
+
+def test_parse_remap_lambda_nested_global_change(monkeypatch):
+    "A global used only in a nested lambda is part of the cache key"
+    f = _remap_func(ledm.remap(lambda e: e.Jets().Where(lambda j: j.pt() > _CUT)))
+    a1 = parse_remap_lambda(f)
+    monkeypatch.setattr(sys.modules[__name__], "_CUT", 50.0)
+    a2 = parse_remap_lambda(f)
+
+    assert unparse(a1) == unparse("lambda e: e.Jets().Where(lambda j: j.pt() > 30.0)")
+    assert unparse(a2) == unparse("lambda e: e.Jets().Where(lambda j: j.pt() > 50.0)")
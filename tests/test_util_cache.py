@@ -0,0 +1,91 @@
+import ast
+
+import awkward as ak
+from layered_edm.util_cache import ResultCache
+
+from .conftest import unparse
+
+
+def _q(text: str) -> ast.AST:
+    return ast.parse(text).body[0].value  # type: ignore
+
+
+def test_key_normalizes_lambda_args():
+    k1 = ResultCache.key(_q("Select(EventDataset(), lambda e: e.jets())"), "ds")
+    k2 = ResultCache.key(_q("Select(EventDataset(), lambda evt: evt.jets())"), "ds")
+    assert k1 == k2
+
+
+def test_key_depends_on_query_and_dataset():
+    k1 = ResultCache.key(_q("Select(EventDataset(), lambda e: e.jets())"), "ds")
+    k2 = ResultCache.key(_q("Select(EventDataset(), lambda e: e.electrons())"), "ds")
+    k3 = ResultCache.key(_q("Select(EventDataset(), lambda e: e.jets())"), "ds2")
+    assert len({k1, k2, k3}) == 3
+
+
+def test_key_does_not_alter_query():
+    q = _q("Select(EventDataset(), lambda e: e.jets())")
+    ResultCache.key(q, "ds")
+    assert unparse(q) == unparse("Select(EventDataset(), lambda e: e.jets())")
+
+
+def test_memory_get_put():
+    c = ResultCache()
+    assert c.get("hi") is None
+    c.put("hi", ak.Array([1, 2, 3]))
+    assert "hi" in c
+    assert c.get("hi").tolist() == [1, 2, 3]
+
+
+def test_memory_lru_eviction():
+    a = ak.Array([1.0, 2.0, 3.0])
+    c = ResultCache(max_memory_bytes=2 * a.nbytes)
+    c.put("one", a)
+    c.put("two", a)
+    c.get("one")
+    c.put("three", a)
+
+    assert "one" in c
+    assert "two" not in c
+    assert "three" in c
+    assert c.memory_bytes == 2 * a.nbytes
+
+
+def test_invalidate():
+    c = ResultCache()
+    c.put("one", ak.Array([1]))
+    c.put("two", ak.Array([2]))
+    c.invalidate("one")
+    assert "one" not in c
+    assert "two" in c
+    c.invalidate()
+    assert "two" not in c
+
+
+def test_disk_round_trip(tmp_path):
+    a = ak.with_parameter(ak.Array([{"x": [1, 2]}, {"x": []}]), "__record__", "my_jet")
+    c = ResultCache(cache_dir=tmp_path)
+    c.put("one", a)
+
+    c2 = ResultCache(cache_dir=tmp_path)
+    assert "one" in c2
+    r = c2.get("one")
+    assert r.tolist() == a.tolist()
+    assert ak.parameters(r)["__record__"] == "my_jet"
+
+
+def test_disk_invalidate(tmp_path):
+    c = ResultCache(cache_dir=tmp_path)
+    c.put("one", ak.Array([1, 2, 3]))
+    c.invalidate("one")
+    assert ResultCache(cache_dir=tmp_path).get("one") is None
+
+
+def test_disk_eviction(tmp_path):
+    c = ResultCache(cache_dir=tmp_path, max_disk_bytes=1)
+    c.put("one", ak.Array([1, 2, 3]))
+    c.put("two", ak.Array([1, 2, 3]))
+
+    c2 = ResultCache(cache_dir=tmp_path)
+    assert "one" not in c2
+    assert "two" in c2
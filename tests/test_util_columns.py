@@ -0,0 +1,148 @@
+from typing import Iterable
+
+import layered_edm as ledm
+from layered_edm.util_columns import required_columns
+
+
+class _jet:
+    @property
+    @ledm.remap(lambda j: j.pt)
+    def pt(self) -> float:
+        ...
+
+    @property
+    @ledm.remap(lambda j: j.eta)
+    def eta(self) -> float:
+        ...
+
+
+class _flat_jet:
+    @property
+    @ledm.remap(lambda j: j.jet_pt)
+    def pt(self) -> float:
+        ...
+
+
+class _particle:
+    @property
+    @ledm.remap(lambda p: p.pt)
+    def pt(self) -> float:
+        ...
+
+    @property
+    @ledm.remap(lambda p: p.parent)
+    def parent(self) -> "_particle":
+        ...
+
+
+class _evt:
+    @property
+    @ledm.remap(lambda e: e.met)
+    def met(self) -> float:
+        ...
+
+    @property
+    @ledm.remap(lambda e: e.jets)
+    def jets(self) -> Iterable[_jet]:
+        ...
+
+    @property
+    @ledm.remap()
+    def flat_jets(self) -> Iterable[_flat_jet]:
+        ...
+
+    @property
+    @ledm.remap(lambda e: e.met_x * e.met_x + e.met_y * e.met_y)
+    def met2(self) -> float:
+        ...
+
+
+def test_all_columns():
+    assert required_columns(_evt) == {"met", "jets.pt", "jets.eta", "jet_pt", "met_x", "met_y"}
+
+
+def test_requested_attributes():
+    assert required_columns(_evt, ["met"]) == {"met"}
+    assert required_columns(_evt, ["jets.pt", "met2"]) == {"jets.pt", "met_x", "met_y"}
+    assert required_columns(_evt, ["jets"]) == {"jets.pt", "jets.eta"}
+    assert required_columns(_evt, ["flat_jets.pt"]) == {"jet_pt"}
+
+
+def test_func_adl_style():
+    class jet:
+        @property
+        @ledm.remap(lambda j: j.pt() / 1000.0)
+        def pt(self) -> float:
+            ...
+
+    class evt:
+        @property
+        @ledm.remap(lambda e: e.Jets("AntiKt4"))
+        def jets(self) -> Iterable[jet]:
+            ...
+
+        @property
+        @ledm.remap(
+            lambda e: e.Electrons().Where(lambda el: el.eta() < 2.5).Select(lambda el: el.pt())
+        )
+        def ele_pt(self) -> float:
+            ...
+
+        @property
+        @ledm.remap(lambda e: e.MissingET().First().met())
+        def met(self) -> float:
+            ...
+
+        @property
+        @ledm.remap(lambda e: e.Muons().Count())
+        def n_muons(self) -> int:
+            ...
+
+    assert required_columns(evt) == {
+        "Jets.pt",
+        "Electrons.eta",
+        "Electrons.pt",
+        "MissingET.met",
+        "Muons",
+    }
+
+
+def test_filters():
+    @ledm.filter(lambda j: j.pt > 30)
+    class good_jet(_jet):
+        ...
+
+    @ledm.filter(lambda e: e.trigger)
+    class evt:
+        @property
+        @ledm.remap(lambda e: e.jets)
+        def jets(self) -> Iterable[good_jet]:
+            ...
+
+    assert required_columns(evt, ["jets.eta"]) == {"trigger", "jets.pt", "jets.eta"}
+
+
+def test_complex_remap():
+    "Columns used to build a new object are all needed"
+
+    class evt:
+        @property
+        @ledm.remap(lambda e: zip(e.jet_pt, e.jet_eta))
+        def jets(self) -> Iterable[_jet]:
+            ...
+
+    assert required_columns(evt) == {"jet_pt", "jet_eta"}
+
+
+def test_not_remapped_property():
+    class evt:
+        @property
+        def met(self) -> float:
+            ...
+
+    assert required_columns(evt) == {"met"}
+
+
+def test_recursive_template():
+    assert required_columns(_particle) == {"pt", "parent"}
+    assert required_columns(_particle, ["parent.parent.pt"]) == {"parent.parent.pt"}
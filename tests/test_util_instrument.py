@@ -0,0 +1,162 @@
+import ast
+import io
+import json
+from typing import Any, List, Optional
+
+import awkward as ak
+import layered_edm as ledm
+import pytest
+from func_adl import EventDataset
+from layered_edm.util_instrument import (
+    ARRAY_MATERIALIZED,
+    QUERY_BUILT,
+    QUERY_SUBMITTED,
+    RESULT_RECEIVED,
+    emit,
+    enabled,
+)
+
+
+class _ds(EventDataset):
+    async def execute_result_async(self, a: ast.AST, _title: Optional[str] = None) -> Any:
+        values = [1.0, 2.0, 3.0, 4.0]
+        select_lambda = a.args[0].args[1] if isinstance(a.args[0], ast.Call) else None
+        if isinstance(select_lambda, ast.Lambda) and isinstance(select_lambda.body, ast.Dict):
+            return ak.Array({k.value: values for k in select_lambda.body.keys})  # type: ignore
+        return ak.Array(values)
+
+
+@ledm.edm_sx
+class _evt:
+    @property
+    @ledm.remap(lambda e: e.met())
+    def met(self) -> float:
+        ...
+
+    @property
+    @ledm.remap(lambda e: e.sumet())
+    def sumet(self) -> float:
+        ...
+
+
+@pytest.fixture
+def events():
+    "Collect all events for the duration of the test"
+    collected: List[ledm.InstrumentEvent] = []
+    ledm.add_listener(collected.append)
+    yield collected
+    ledm.remove_listener(collected.append)
+
+
+def test_no_listeners():
+    assert not enabled()
+    emit(QUERY_BUILT, query="hi")
+
+
+def test_query_events(events):
+    data = _evt(_ds())
+    data.met.as_awkward()
+
+    kinds = [e.kind for e in events]
+    assert kinds == [QUERY_BUILT, QUERY_SUBMITTED, RESULT_RECEIVED]
+    assert all(e.query == "Select(EventDataset(), lambda e: e.met())" for e in events)
+
+    received = events[-1]
+    assert received.rows == 4
+    assert received.nbytes == 32
+    assert received.duration is not None and received.duration >= 0
+    assert not received.cached
+
+
+def test_length_query_events(events):
+    _evt(_ds()).met.array_length()
+
+    received = [e for e in events if e.kind == RESULT_RECEIVED]
+    assert len(received) == 1
+    assert received[0].query == "Select(Select(EventDataset(), lambda e: e.met()), lambda e: 0)"
+    assert received[0].rows == 4
+
+
+def test_cached_result_event(events):
+    data = _evt(_ds(), cache=ledm.ResultCache(), dataset_id="zee")
+    data.met.as_awkward()
+    data.met.as_awkward()
+
+    received = [e for e in events if e.kind == RESULT_RECEIVED]
+    assert [e.cached for e in received] == [False, True]
+    assert len([e for e in events if e.kind == QUERY_SUBMITTED]) == 1
+
+
+def test_materialized_events(events):
+    awk = _evt(_ds()).as_awkward()
+    assert not any(e.kind == ARRAY_MATERIALIZED for e in events)
+
+    awk.sumet.tolist()
+    materialized = [e for e in events if e.kind == ARRAY_MATERIALIZED]
+    assert len(materialized) == 1
+    assert materialized[0].field == "_evt.sumet"
+    assert materialized[0].rows == 4
+    assert materialized[0].nbytes == 32
+
+
+def test_materialized_fused(events):
+    awk = _evt(_ds(), fuse_queries=True).as_awkward()
+    awk.met.tolist()
+
+    # All the fields come from the one query, and are zipped together
+    materialized = [e for e in events if e.kind == ARRAY_MATERIALIZED]
+    assert [e.field for e in materialized] == ["_evt"]
+
+
+def test_listener_error_does_not_stop(caplog):
+    def bad_listener(e):
+        raise RuntimeError("oops")
+
+    ledm.add_listener(bad_listener)
+    try:
+        assert _evt(_ds()).met.as_awkward().tolist() == [1.0, 2.0, 3.0, 4.0]
+    finally:
+        ledm.remove_listener(bad_listener)
+    assert "oops" in caplog.text
+
+
+def test_collector_report():
+    with ledm.InstrumentCollector() as collector:
+        data = _evt(_ds())
+        awk = data.as_awkward()
+        awk.met.tolist()
+        awk.sumet.tolist()
+    assert not enabled()
+
+    by_query = collector.by_query()
+    assert by_query["Select(EventDataset(), lambda e: e.met())"].count == 1
+    assert by_query["Select(EventDataset(), lambda e: e.met())"].rows == 4
+    assert set(collector.by_field()) == {"_evt.met", "_evt.sumet"}
+
+    report = collector.report()
+    assert "_evt.sumet" in report
+    assert "Select(EventDataset(), lambda e: e.sumet())" in report
+
+
+def test_collector_dump(tmp_path):
+    with ledm.InstrumentCollector() as collector:
+        _evt(_ds()).met.as_awkward()
+
+    out = io.StringIO()
+    collector.dump(out)
+    assert "e.met()" in out.getvalue()
+
+    collector.dump(tmp_path / "report.txt")
+    assert (tmp_path / "report.txt").read_text() == collector.report() + "\n"
+
+    collector.dump(tmp_path / "events.jsonl")
+    lines = [json.loads(line) for line in (tmp_path / "events.jsonl").read_text().splitlines()]
+    assert [line["kind"] for line in lines] == [QUERY_BUILT, QUERY_SUBMITTED, RESULT_RECEIVED]
+
+
+def test_collector_clear():
+    collector = ledm.InstrumentCollector()
+    collector(ledm.InstrumentEvent(QUERY_BUILT, 0.0, query="q"))
+    assert len(collector.events) == 1
+    collector.clear()
+    assert len(collector.events) == 0
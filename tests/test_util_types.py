@@ -95,3 +95,126 @@ def test_class_behavior_unknown(ak_behavior):
         class_behavior(my_test)
 
     assert "hi_there" in str(e)
+
+
+def _two_behaviors(cls: type, reg_function=None):
+    class hi_there_1(ak.Array):
+        def __init__(self):
+            pass
+
+    class hi_there_2(ak.Array):
+        def __init__(self):
+            pass
+
+    append_awk_behavior_to_class(cls, hi_there_1, reg_function)
+    append_awk_behavior_to_class(cls, hi_there_2, None)
+
+
+def test_class_behavior_name_deterministic(ak_behavior):
+    class my_test:
+        pass
+
+    _two_behaviors(my_test)
+
+    assert class_behavior(my_test) == f"{__name__}.{my_test.__qualname__}"
+
+
+def test_class_behavior_memoized(ak_behavior):
+    class my_test:
+        pass
+
+    count = 0
+
+    def call_me():
+        nonlocal count
+        count += 1
+
+    _two_behaviors(my_test, call_me)
+    r1 = class_behavior(my_test)
+    n_registered = len(ak_behavior)
+    r2 = class_behavior(my_test)
+
+    assert r1 == r2
+    assert count == 1
+    assert len(ak_behavior) == n_registered
+    assert ak_behavior["*", r1] is ak_behavior["*", r2]
+
+
+def test_class_behavior_single_memoized(ak_behavior):
+    class my_test:
+        pass
+
+    count = 0
+
+    def reg():
+        nonlocal count
+        count += 1
+        ak_behavior["*", "hi_there"] = ak.Record
+
+    append_awk_behavior_to_class(my_test, "hi_there", reg)
+    assert class_behavior(my_test) == "hi_there"
+    assert class_behavior(my_test) == "hi_there"
+    assert count == 1
+
+
+def test_class_behavior_reset(ak_behavior, mocker):
+    "If `ak.behavior` is replaced, everything is registered again"
+
+    class my_test:
+        pass
+
+    count = 0
+
+    def call_me():
+        nonlocal count
+        count += 1
+
+    _two_behaviors(my_test, call_me)
+    r1 = class_behavior(my_test)
+    old_behavior = ak_behavior["*", r1]
+
+    new_dict = {}
+    mocker.patch("layered_edm.util_types.ak.behavior", new_dict)
+    r2 = class_behavior(my_test)
+
+    assert r1 == r2
+    assert count == 2
+    assert new_dict["*", r2] is old_behavior
+
+
+def test_class_behavior_same_qualname(ak_behavior):
+    "Two classes with the same name must not share a behavior"
+
+    def make_class():
+        class my_test:
+            pass
+
+        _two_behaviors(my_test)
+        return my_test
+
+    c1, c2 = make_class(), make_class()
+    r1, r2 = class_behavior(c1), class_behavior(c2)
+
+    assert r1 != r2
+    assert class_behavior(c1) == r1
+    assert ak_behavior["*", r1] is not ak_behavior["*", r2]
+
+
+def test_class_behavior_added_later(ak_behavior):
+    class my_test:
+        pass
+
+    class hi_there_1(ak.Array):
+        def __init__(self):
+            pass
+
+    class hi_there_2(ak.Array):
+        def __init__(self):
+            pass
+
+    append_awk_behavior_to_class(my_test, hi_there_1, None)
+    assert class_behavior(my_test) == "hi_there_1"
+
+    append_awk_behavior_to_class(my_test, hi_there_2, None)
+    r = class_behavior(my_test)
+    assert issubclass(ak_behavior["*", r], hi_there_2)
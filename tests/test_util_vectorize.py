@@ -0,0 +1,134 @@
+import ast
+
+import awkward as ak
+import pytest
+
+from layered_edm.util_vectorize import vectorize_lambda
+
+
+@pytest.fixture
+def events():
+    return ak.Array(
+        [
+            {
+                "met": 10.0,
+                "Jets": [
+                    {"pt": 50.0, "eta": -1.0, "tracks": [{"q": 1}, {"q": -1}, {"q": 1}]},
+                    {"pt": 20.0, "eta": 2.0, "tracks": []},
+                ],
+            },
+            {"met": 5.0, "Jets": []},
+            {"met": 7.0, "Jets": [{"pt": 30.0, "eta": 0.5, "tracks": [{"q": -1}]}]},
+        ]
+    )
+
+
+def run(text: str, data: ak.Array):
+    return vectorize_lambda(ast.parse(text, mode="eval").body)(data).tolist()  # type: ignore
+
+
+def test_field(events):
+    assert run("lambda e: e.met", events) == [10.0, 5.0, 7.0]
+
+
+def test_method_is_field(events):
+    assert run("lambda e: e.met()", events) == [10.0, 5.0, 7.0]
+
+
+def test_select(events):
+    assert run("lambda e: e.Jets().Select(lambda j: j.pt())", events) == [[50.0, 20.0], [], [30.0]]
+
+
+def test_select_arithmetic(events):
+    assert run("lambda e: e.Jets().Select(lambda j: j.pt() / 10.0 + e.met())", events) == [
+        [15.0, 12.0],
+        [],
+        [10.0],
+    ]
+
+
+def test_select_constant(events):
+    assert run("lambda e: e.Jets().Select(lambda j: 1)", events) == [[1, 1], [], [1]]
+
+
+def test_where(events):
+    assert run(
+        "lambda e: e.Jets().Where(lambda j: j.pt() > 25).Select(lambda j: j.eta)", events
+    ) == [
+        [-1.0],
+        [],
+        [0.5],
+    ]
+
+
+def test_where_and(events):
+    assert run(
+        "lambda e: e.Jets().Where(lambda j: j.pt() > 25 and abs(j.eta()) < 0.8).Count()", events
+    ) == [0, 0, 1]
+
+
+def test_chained_compare(events):
+    assert run("lambda e: e.Jets().Where(lambda j: 25 < j.pt() < 40).Count()", events) == [0, 0, 1]
+
+
+def test_count(events):
+    assert run("lambda e: e.Jets().Count()", events) == [2, 0, 1]
+
+
+def test_count_nested(events):
+    assert run("lambda e: e.Jets().Select(lambda j: j.tracks().Count())", events) == [
+        [3, 0],
+        [],
+        [1],
+    ]
+
+
+def test_sum_nested(events):
+    assert run(
+        "lambda e: e.Jets().Select(lambda j: j.tracks().Select(lambda t: t.q()).Sum())", events
+    ) == [
+        [1, 0],
+        [],
+        [-1],
+    ]
+
+
+def test_first(events):
+    assert run("lambda e: e.Jets().First().pt()", events) == [50.0, None, 30.0]
+
+
+def test_max_min(events):
+    assert run("lambda e: e.Jets().Select(lambda j: j.pt()).Max()", events) == [50.0, None, 30.0]
+    assert run("lambda e: e.Jets().Select(lambda j: j.pt()).Min()", events) == [20.0, None, 30.0]
+
+
+def test_any(events):
+    assert run("lambda e: e.Jets().Any(lambda j: j.eta() > 1)", events) == [True, False, False]
+
+
+def test_dict(events):
+    assert run("lambda e: {'met': e.met, 'n': e.Jets().Count()}", events) == [
+        {"met": 10.0, "n": 2},
+        {"met": 5.0, "n": 0},
+        {"met": 7.0, "n": 1},
+    ]
+
+
+def test_if(events):
+    assert run("lambda e: e.met if e.met > 6 else 0.0", events) == [10.0, 0.0, 7.0]
+
+
+def test_math_function(events):
+    assert run("lambda e: math.sqrt(e.met * e.met)", events) == [10.0, 5.0, 7.0]
+
+
+def test_jagged_argument(events):
+    "At a collection, the lambda is bound to each item"
+    r = vectorize_lambda(ast.parse("lambda j: j.tracks().Count()", mode="eval").body)  # type: ignore
+    assert r(events.Jets).tolist() == [[3, 0], [], [1]]
+
+
+def test_untranslatable(events):
+    with pytest.raises(ValueError) as e:
+        run("lambda e: sorted(e.met)", events)
+    assert "sorted" in str(e.value)